@@ -0,0 +1,110 @@
+"""Бенчмарк задержки цикла событий при конкурентном просмотре услуг
+
+Сравнивает синхронный Database (запросы прямо в цикле событий) и
+AsyncDatabase (запросы в потоке-исполнителе). Параллельно с "покупателями",
+листающими каталог через filter_services, работает тикер, который
+каждые 10 мс замеряет, на сколько цикл событий опоздал с его пробуждением.
+
+Запуск из корня проекта:
+    python -m benchmarks.event_loop_latency
+"""
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from utils.async_database import AsyncDatabase
+from utils.database import Database
+
+SERVICES_COUNT = 20000
+BROWSERS = 20
+REQUESTS_PER_BROWSER = 10
+TICK_INTERVAL = 0.01
+
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург"]
+
+
+def fill_database(path: str) -> int:
+    db = Database(path)
+    db.add_user(telegram_id="1", username="seller", is_seller=True)
+    type_id = db.add_service_type("Маникюр", created_by_telegram_id="1")
+    rows = [
+        (1, type_id, f"Услуга {i}", "photo", random.choice(CITIES), "Центр", "Ленина", "1",
+         "+70000000000", random.randint(500, 50000), f'{{"description": "описание {i}"}}')
+        for i in range(SERVICES_COUNT)
+    ]
+    db.cursor.executemany("""
+        INSERT INTO services (user_id, service_type_id, title, photo_id, city, district,
+                              street, house, number_phone, price, custom_fields)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    db.connection.commit()
+    db.close()
+    return type_id
+
+
+async def measure(browse) -> dict:
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK_INTERVAL)
+            lags.append(time.perf_counter() - started - TICK_INTERVAL)
+
+    async def browser():
+        for _ in range(REQUESTS_PER_BROWSER):
+            await browse(search_text=str(random.randint(0, 999)), city=random.choice(CITIES))
+
+    ticker_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(browser() for _ in range(BROWSERS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker_task
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "total_s": elapsed,
+        "ticks": len(lags_ms),
+        "lag_median_ms": statistics.median(lags_ms),
+        "lag_p99_ms": lags_ms[int(len(lags_ms) * 0.99) - 1] if len(lags_ms) > 1 else lags_ms[0],
+        "lag_max_ms": lags_ms[-1],
+    }
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        type_id = fill_database(path)
+
+        sync_db = Database(path)
+
+        async def browse_sync(**filters):
+            return sync_db.filter_services(service_type_id=type_id, **filters)
+
+        before = await measure(browse_sync)
+        sync_db.close()
+
+        async_db = AsyncDatabase(path)
+
+        async def browse_async(**filters):
+            return await async_db.filter_services(service_type_id=type_id, **filters)
+
+        after = await measure(browse_async)
+        await async_db.close()
+
+    print(f"Услуг: {SERVICES_COUNT}, покупателей: {BROWSERS}, запросов на покупателя: {REQUESTS_PER_BROWSER}")
+    for title, result in (("Database (до)", before), ("AsyncDatabase (после)", after)):
+        print(
+            f"{title:<24} время: {result['total_s']:.2f} c, тиков: {result['ticks']}, "
+            f"задержка цикла: медиана {result['lag_median_ms']:.1f} мс, "
+            f"p99 {result['lag_p99_ms']:.1f} мс, максимум {result['lag_max_ms']:.1f} мс"
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
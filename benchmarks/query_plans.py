@@ -0,0 +1,131 @@
+"""Проверка планов запросов для индексов из utils/migrations.py
+
+Вызывает настоящие методы Database на временной базе, перехватывает
+выполненный SQL и для каждого запроса проверяет через EXPLAIN QUERY PLAN,
+что SQLite использует ожидаемый индекс, а не полный просмотр таблицы
+и не сортирует результат во временном B-дереве.
+
+Запуск из корня проекта:
+    python -m benchmarks.query_plans
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import Callable, List, Tuple
+
+from utils.database import Database
+from utils.pagination import encode_cursor
+
+# (описание, вызов метода, таблица, ожидаемый индекс)
+CHECKS: List[Tuple[str, Callable[[Database], object], str, str]] = [
+    ("filter_services по типу, сортировка по дате",
+     lambda db: db.filter_services(service_type_id=1),
+     "services", "idx_services_status_type_created"),
+    ("filter_services по типу, сортировка по цене",
+     lambda db: db.filter_services(service_type_id=1, sort_by='price', sort_direction='ASC'),
+     "services", "idx_services_status_type_price"),
+    ("filter_services по типу, сортировка по релевантности",
+     lambda db: db.filter_services(service_type_id=1, sort_by='relevance'),
+     "services", "idx_services_status_type_rank"),
+    ("filter_services по релевантности, следующая страница по курсору",
+     lambda db: db.filter_services(service_type_id=1, sort_by='relevance', cursor=encode_cursor([250.5, 10])),
+     "services", "idx_services_status_type_rank"),
+    ("get_services по продавцу",
+     lambda db: db.get_services(telegram_id="100"),
+     "services", "idx_services_user_created"),
+    ("filter_services, следующая страница по курсору",
+     lambda db: db.filter_services(service_type_id=1, cursor=encode_cursor(["2024-01-01 00:00:00", 10])),
+     "services", "idx_services_status_type_created"),
+    ("get_services по продавцу, следующая страница по курсору",
+     lambda db: db.get_services(telegram_id="100", limit=5, cursor=encode_cursor(["2024-01-01 00:00:00", 10])),
+     "services", "idx_services_user_created"),
+    ("get_ban_info для пользователя",
+     lambda db: db.get_ban_info('user', accused_telegram_id="100"),
+     "banned_types", "idx_banned_types_type_user"),
+    ("get_ban_info для услуги",
+     lambda db: db.get_ban_info('service', accused_service_id=1),
+     "banned_types", "idx_banned_types_type_service"),
+    ("get_complaints по автору",
+     lambda db: db.get_complaints(creator_telegram_id="100"),
+     "complaints", "idx_complaints_creator_created"),
+    ("get_complaints по обвиняемому",
+     lambda db: db.get_complaints(accused_telegram_id="100"),
+     "complaints", "idx_complaints_accused_created"),
+    ("get_complaints по услуге",
+     lambda db: db.get_complaints(accused_service_id=1),
+     "complaints", "idx_complaints_service_created"),
+    ("get_service_type_fields",
+     lambda db: db.get_service_type_fields(1),
+     "service_type_fields", "idx_service_type_fields_type_position"),
+    ("filter_services по числовому доп. полю",
+     lambda db: db.filter_services(service_type_id=1, custom_fields={"year": "2010-2020"}),
+     "service_attributes", "idx_service_attributes_num"),
+    ("filter_services по вариантам доп. поля",
+     lambda db: db.filter_services(service_type_id=1, custom_fields={"color": "Красный,Синий"}),
+     "service_attributes", "idx_service_attributes_text"),
+    ("filter_services, только работающие сейчас продавцы",
+     lambda db: db.filter_services(service_type_id=1, available_now=True),
+     "seller_hours", "idx_seller_hours_open"),
+    ("filter_services, услуги рядом с точкой",
+     lambda db: db.filter_services(service_type_id=1, near=(55.75, 37.61), radius_km=5),
+     "services_geo", "services_geo VIRTUAL TABLE INDEX 2:"),
+    ("filter_services, услуги рядом по расстоянию",
+     lambda db: db.filter_services(near=(55.75, 37.61), radius_km=5, sort_by='distance'),
+     "services_geo", "services_geo VIRTUAL TABLE INDEX 2:"),
+]
+
+# Таблицы, после поиска по которым результат сортируется в памяти: в радиус
+# попадает немного услуг, а порядок по расстоянию индексом не обеспечить
+SORTED_IN_MEMORY = {"services_geo"}
+
+
+def prepare(db: Database) -> None:
+    """Поля типа услуги, по которым строятся фильтры дополнительных полей"""
+    db.add_service_type_field(1, "year", "Год", "number", 1)
+    db.add_service_type_field(1, "color", "Цвет", "select", 2, "Красный,Синий")
+
+
+def capture_queries(db: Database, call: Callable[[Database], object]) -> List[str]:
+    queries = []
+    db.connection.set_trace_callback(queries.append)
+    try:
+        call(db)
+    finally:
+        db.connection.set_trace_callback(None)
+    return [q for q in queries if q.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def query_plan(connection: sqlite3.Connection, query: str) -> List[str]:
+    return [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}")]
+
+
+def main() -> int:
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "plans.db"))
+        prepare(db)
+        for title, call, table, index in CHECKS:
+            queries = capture_queries(db, call)
+            plans = [query_plan(db.connection, q) for q in queries]
+            uses_index = any(index in step for plan in plans for step in plan)
+            # У виртуальной таблицы поиск по индексу тоже выглядит как SCAN ... VIRTUAL TABLE INDEX
+            full_scan = any((step == f"SCAN {table}" or step.startswith(f"SCAN {table} ")
+                             or step == f"SCAN {table[0]}") and index not in step
+                            for plan in plans for step in plan)
+            temp_sort = table not in SORTED_IN_MEMORY and any(
+                "USE TEMP B-TREE" in step for plan in plans for step in plan
+            )
+            ok = uses_index and not full_scan and not temp_sort
+            failed += not ok
+            print(f"[{'OK' if ok else 'FAIL'}] {title}: {index}")
+            if not ok:
+                for plan in plans:
+                    for step in plan:
+                        print(f"        {step}")
+        db.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,14 +3,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from utils.variables import ADMIN_IDS
 from keyboards.role_keyboards import admin_keyboard
 import re
 from typing import Dict, Any, List
 
 router = Router(name='admin')
-db = Database()
 
 RESERVED_FIELDS = {"title", "photo", "address", "price", "district", "number_phone", "city", "house", "street"}
 MAX_FIELD_NAME_LENGTH = 50
@@ -101,7 +100,7 @@ async def start_create_service_type(callback: CallbackQuery, state: FSMContext):
         await callback.answer(f"Произошла ошибка: {str(e)}", show_alert=True)
 
 @router.message(CreateServiceType.waiting_for_name)
-async def process_name(message: Message, state: FSMContext):
+async def process_name(message: Message, state: FSMContext, db: AsyncDatabase):
     try:
         name = message.text.strip()
         
@@ -113,7 +112,7 @@ async def process_name(message: Message, state: FSMContext):
             await message.answer("❌ Название слишком длинное. Максимум 100 символов.")
             return
 
-        if db.get_service_type_by_name(name):
+        if await db.get_service_type_by_name(name):
             await message.answer("❌ Тип услуги с таким названием уже существует!")
             return
             
@@ -135,12 +134,12 @@ async def process_name(message: Message, state: FSMContext):
         await message.answer(f"Произошла ошибка: {str(e)}")
 
 @router.callback_query(CreateServiceType.waiting_for_price_level, F.data.startswith("price_level_"))
-async def process_price_level(callback: CallbackQuery, state: FSMContext):
+async def process_price_level(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         price_level = int(callback.data.split("_")[2])
         data = await state.get_data()
         name = data.get("name")
-        type_id = db.add_service_type(
+        type_id = await db.add_service_type(
             header=name,
             created_by_telegram_id=str(callback.from_user.id),
             price_level=price_level
@@ -153,7 +152,7 @@ async def process_price_level(callback: CallbackQuery, state: FSMContext):
         await state.update_data(name=name, price_level=price_level, service_type_id=type_id)
         await state.set_state(CreateServiceType.management)
         
-        fields = db.get_service_type_fields(type_id)
+        fields = await db.get_service_type_fields(type_id)
         price_str = "Десятки тысяч рублей" if price_level == 1 else "Тысячи рублей"
         await callback.message.edit_text(
             f"🛠 Панель управления типом услуги:\n"
@@ -166,11 +165,11 @@ async def process_price_level(callback: CallbackQuery, state: FSMContext):
         await callback.answer(f"Произошла ошибка: {str(e)}", show_alert=True)
 
 @router.callback_query(F.data.startswith("add_field_"))
-async def start_add_field(callback: CallbackQuery, state: FSMContext):
+async def start_add_field(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         service_type_id = int(callback.data.split("_")[2])
         # Проверяем, не достигнуто ли максимальное число полей для данного типа услуги (запрос из БД)
-        fields = db.get_service_type_fields(service_type_id)
+        fields = await db.get_service_type_fields(service_type_id)
         if len(fields) >= MAX_FIELDS_PER_TYPE:
             await callback.answer(f"❌ Достигнуто максимальное количество полей ({MAX_FIELDS_PER_TYPE})", show_alert=True)
             return
@@ -365,15 +364,15 @@ async def process_select_options(message: Message, state: FSMContext):
         await message.answer(f"Произошла ошибка: {str(e)}")
 
 @router.callback_query(CreateServiceType.waiting_for_confirmation, F.data.in_(["confirm_field", "cancel_field"]))
-async def process_field_confirmation(callback: CallbackQuery, state: FSMContext):
+async def process_field_confirmation(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         data = await state.get_data()
         service_type_id = data.get("service_type_id")
         if callback.data == "confirm_field":
             current_field = data.get("current_field", {})
-            fields = db.get_service_type_fields(service_type_id)
+            fields = await db.get_service_type_fields(service_type_id)
             order_position = len(fields) + 1
-            db.add_service_type_field(
+            await db.add_service_type_field(
                 service_type_id=service_type_id,
                 name=current_field.get("name"),
                 name_for_user=current_field.get("label"),
@@ -390,7 +389,7 @@ async def process_field_confirmation(callback: CallbackQuery, state: FSMContext)
         service_type_id = data.get("service_type_id")
         name = data.get("name")
         price_level = data.get("price_level")
-        fields = db.get_service_type_fields(service_type_id)
+        fields = await db.get_service_type_fields(service_type_id)
         price_str = "Десятки тысяч рублей" if price_level == 1 else "Тысячи рублей"
         await state.update_data(current_field={})
         await state.set_state(CreateServiceType.management)
@@ -405,15 +404,14 @@ async def process_field_confirmation(callback: CallbackQuery, state: FSMContext)
         await callback.answer(f"Произошла ошибка: {str(e)}", show_alert=True)
 
 @router.callback_query(F.data.startswith("delete_last_field_"))
-async def delete_last_field(callback: CallbackQuery, state: FSMContext):
+async def delete_last_field(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         service_type_id = int(callback.data.split("_")[2])
-        fields = db.get_service_type_fields(service_type_id)
+        fields = await db.get_service_type_fields(service_type_id)
         
         if fields:
-            # Предполагается, что в базе реализована функция для удаления последнего поля
-            if db.delete_last_service_type_field(service_type_id):
-                fields = db.get_service_type_fields(service_type_id)
+            if await db.delete_last_service_type_field(service_type_id):
+                fields = await db.get_service_type_fields(service_type_id)
                 data = await state.get_data()
                 await callback.message.edit_text(
                     f"🛠 Панель управления типом услуги:\n"
@@ -441,7 +439,7 @@ async def finish_editing(callback: CallbackQuery, state: FSMContext):
         await callback.answer(f"Произошла ошибка: {str(e)}", show_alert=True)
 
 @router.callback_query(F.data == "back")
-async def handle_back(callback: CallbackQuery, state: FSMContext):
+async def handle_back(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         current_state = await state.get_state()
         data = await state.get_data()
@@ -456,7 +454,7 @@ async def handle_back(callback: CallbackQuery, state: FSMContext):
             if service_type_id:
                 name = data.get("name")
                 price_level = data.get("price_level")
-                fields = db.get_service_type_fields(service_type_id)
+                fields = await db.get_service_type_fields(service_type_id)
                 price_str = "Десятки тысяч рублей" if price_level == 1 else "Тысячи рублей"
                 await state.set_state(CreateServiceType.management)
                 await callback.message.edit_text(
@@ -5,12 +5,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from utils.variables import ADMIN_IDS
 from keyboards.role_keyboards import admin_keyboard
 
 router = Router(name='admin')
-db = Database()
 
 COMPLAINTS_PER_PAGE = 5
 
@@ -18,9 +17,9 @@ class BanStates(StatesGroup):
     waiting_for_duration = State()
     waiting_for_reason = State()
 
-def format_complaint_text(complaint: dict) -> str:
+async def format_complaint_text(db: AsyncDatabase, complaint: dict) -> str:
     """Форматирует текст жалобы для отображения"""
-    creator = db.get_user(telegram_id=complaint['creator_telegram_id'])
+    creator = await db.get_user(telegram_id=complaint['creator_telegram_id'])
     creator_username = creator[2] if creator else 'Неизвестно'
     
     base_text = (
@@ -33,14 +32,14 @@ def format_complaint_text(complaint: dict) -> str:
     )
     
     if complaint['type'] == 'service':
-        service = db.get_service_by_id(complaint['accused_service_id'])
+        service = await db.get_service_by_id(complaint['accused_service_id'])
         if service:
             base_text += f"🛍 Услуга: {service[3]}\n"  # title is at index 3
-            seller = db.get_user(user_id=service[1])  # user_id is at index 1
+            seller = await db.get_user(user_id=service[1])  # user_id is at index 1
             if seller:
                 base_text += f"👤 Владелец: @{seller[2]}\n"  # username is at index 2
     else:
-        accused = db.get_user(telegram_id=complaint['accused_telegram_id'])
+        accused = await db.get_user(telegram_id=complaint['accused_telegram_id'])
         accused_username = accused[2] if accused else 'Неизвестно'  # username is at index 2
         base_text += f"👤 На пользователя: @{accused_username}\n"
         
@@ -86,12 +85,12 @@ def get_complaint_keyboard(complaint: dict, page: int, total_pages: int) -> Inli
     return kb
 
 @router.callback_query(F.data == "get_all_reports")
-async def show_complaints(callback: CallbackQuery):
+async def show_complaints(callback: CallbackQuery, db: AsyncDatabase):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
         
-    complaints = db.get_complaints()
+    complaints = await db.get_complaints()
     if not complaints:
         await callback.message.edit_text(
             "📝 Активных жалоб нет",
@@ -99,16 +98,16 @@ async def show_complaints(callback: CallbackQuery):
         )
         return
 
-    await show_complaints_page(callback.message, complaints, 0)
+    await show_complaints_page(callback.message, complaints, 0, db)
     await callback.answer()
 
-async def show_complaints_page(message: Message, complaints: list, page: int):
+async def show_complaints_page(message: Message, complaints: list, page: int, db: AsyncDatabase):
     total_pages = (len(complaints) + COMPLAINTS_PER_PAGE - 1) // COMPLAINTS_PER_PAGE
     page = min(max(0, page), total_pages - 1)
     start_idx = page * COMPLAINTS_PER_PAGE
     complaint = complaints[start_idx]
 
-    text = format_complaint_text(complaint)
+    text = await format_complaint_text(db, complaint)
     keyboard = get_complaint_keyboard(complaint, page, total_pages)
 
     try:
@@ -125,10 +124,10 @@ async def show_complaints_page(message: Message, complaints: list, page: int):
         await message.answer(text, reply_markup=keyboard.as_markup())
 
 @router.callback_query(F.data.startswith("complaints_page_"))
-async def handle_pagination(callback: CallbackQuery):
+async def handle_pagination(callback: CallbackQuery, db: AsyncDatabase):
     page = int(callback.data.split("_")[2])
-    complaints = db.get_complaints()
-    await show_complaints_page(callback.message, complaints, page)
+    complaints = await db.get_complaints()
+    await show_complaints_page(callback.message, complaints, page, db)
     await callback.answer()
 
 @router.callback_query(F.data == "admin_menu")
@@ -157,16 +156,16 @@ async def return_to_admin_menu(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("dismiss_"))
-async def dismiss_complaint(callback: CallbackQuery):
+async def dismiss_complaint(callback: CallbackQuery, db: AsyncDatabase):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
         
     complaint_id = int(callback.data.split("_")[1])
-    if db.delete_complaint(complaint_id):
-        complaints = db.get_complaints()
+    if await db.delete_complaint(complaint_id):
+        complaints = await db.get_complaints()
         if complaints:
-            await show_complaints_page(callback.message, complaints, 0)
+            await show_complaints_page(callback.message, complaints, 0, db)
         else:
             try:
                 if callback.message.photo:
@@ -196,13 +195,13 @@ class ComplaintAction(StatesGroup):
     waiting_for_reason = State()
 
 @router.callback_query(F.data.startswith("accept_"))
-async def accept_complaint(callback: CallbackQuery, state: FSMContext):
+async def accept_complaint(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
     complaint_id = int(callback.data.split("_")[1])
-    complaint = db.get_complaints(complaint_id=complaint_id)[0]
+    complaint = (await db.get_complaints(complaint_id=complaint_id))[0]
     
     await state.update_data(complaint_id=complaint_id, complaint=complaint)
     
@@ -221,7 +220,7 @@ async def accept_complaint(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ComplaintAction.waiting_for_action)
 
 @router.callback_query(ComplaintAction.waiting_for_action)
-async def process_action(callback: CallbackQuery, state: FSMContext):
+async def process_action(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     await callback.answer()
     action = callback.data.split("_")[1]
     data = await state.get_data()
@@ -229,9 +228,9 @@ async def process_action(callback: CallbackQuery, state: FSMContext):
     
     if action == "cancel":
         await state.clear()
-        complaints = db.get_complaints()
+        complaints = await db.get_complaints()
         if complaints:
-            await show_complaints_page(callback.message, complaints, 0)
+            await show_complaints_page(callback.message, complaints, 0, db)
         else:
             await callback.message.edit_text(
                 "📝 Активных жалоб больше нет",
@@ -258,7 +257,7 @@ async def process_action(callback: CallbackQuery, state: FSMContext):
                 complaint['accused_telegram_id'],
                 "⚠️ На вашу услугу поступила жалоба. При повторном нарушении услуга будет заблокирована."
             )
-        db.delete_complaint(data['complaint_id'])
+        await db.delete_complaint(data['complaint_id'])
         await state.clear()
         return
 
@@ -281,12 +280,12 @@ async def process_action(callback: CallbackQuery, state: FSMContext):
         await state.set_state(ComplaintAction.waiting_for_reason)
 
 @router.callback_query(ComplaintAction.waiting_for_duration)
-async def process_duration(callback: CallbackQuery, state: FSMContext):
+async def process_duration(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     await callback.answer()
     if callback.data == "action_cancel":
         await state.clear()
-        complaints = db.get_complaints()
-        await show_complaints_page(callback.message, complaints, 0)
+        complaints = await db.get_complaints()
+        await show_complaints_page(callback.message, complaints, 0, db)
         return
 
     duration = int(callback.data.split("_")[1])
@@ -295,7 +294,7 @@ async def process_duration(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ComplaintAction.waiting_for_reason)
 
 @router.message(ComplaintAction.waiting_for_reason)
-async def process_reason(message: Message, state: FSMContext):
+async def process_reason(message: Message, state: FSMContext, db: AsyncDatabase):
     data = await state.get_data()
     complaint = data['complaint']
     action = data['action']
@@ -304,16 +303,24 @@ async def process_reason(message: Message, state: FSMContext):
     is_permanent = action == "perm_ban"
     duration = 0 if is_permanent else data.get('duration', 24)
     
-    db.update_service_status(complaint['accused_service_id'], 'blocked')
-    success = db.ban_entity(
-        admin_telegram_id=str(message.from_user.id),
-        type=complaint['type'],
-        accused_telegram_id=complaint['accused_telegram_id'] if complaint['type'] == 'user' else None,
-        accused_service_id=complaint['accused_service_id'] if complaint['type'] == 'service' else None,
-        ban_duration_hours=duration,
-        is_permanent=is_permanent,
-        reason=reason
-    )
+    # Блокировка услуги, бан и удаление жалобы применяются вместе или не применяются вовсе
+    try:
+        async with db.transaction():
+            await db.update_service_status(complaint['accused_service_id'], 'blocked')
+            success = await db.ban_entity(
+                admin_telegram_id=str(message.from_user.id),
+                type=complaint['type'],
+                accused_telegram_id=complaint['accused_telegram_id'] if complaint['type'] == 'user' else None,
+                accused_service_id=complaint['accused_service_id'] if complaint['type'] == 'service' else None,
+                ban_duration_hours=duration,
+                is_permanent=is_permanent,
+                reason=reason
+            )
+            if not success or not await db.delete_complaint(data['complaint_id']):
+                raise RuntimeError("не удалось применить решение по жалобе")
+    except Exception as e:
+        print(f"Ошибка при блокировке по жалобе: {e}")
+        success = False
 
     if success:
         ban_text = "навсегда" if is_permanent else f"на {duration} час(ов)"
@@ -322,12 +329,11 @@ async def process_reason(message: Message, state: FSMContext):
             f"🚫 {'Вы были заблокированы' if complaint['type'] == 'user' else 'Ваша услуга была заблокирована'} {ban_text}\nПричина: {reason}"
         )
         
-        db.delete_complaint(data['complaint_id'])
         await state.clear()
         
-        complaints = db.get_complaints()
+        complaints = await db.get_complaints()
         if complaints:
-            await show_complaints_page(message, complaints, 0)
+            await show_complaints_page(message, complaints, 0, db)
         else:
             await message.answer(
                 "📝 Активных жалоб больше нет",
@@ -9,12 +9,11 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton, FSInputFile
 from aiogram.exceptions import TelegramBadRequest
 
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from utils.variables import ADMIN_IDS
 from keyboards.role_keyboards import admin_keyboard
 
 router = Router(name='admin')
-db = Database()
 
 USERS_PER_PAGE = 10  # Количество пользователей для рассылки на одной странице
 
@@ -130,12 +129,12 @@ async def skip_photo(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(F.data == "confirm_newsletter")
-async def confirm_newsletter(callback: CallbackQuery, state: FSMContext):
+async def confirm_newsletter(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     data = await state.get_data()
     text = data.get("text", "")
     photo = data.get("photo")
     
-    users = db.cursor.execute("SELECT telegram_id FROM users").fetchall()
+    users = await db.get_all_users_telegram_ids()
     total_users = len(users)
     total_pages = (total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE
     
@@ -157,20 +156,20 @@ async def confirm_newsletter(callback: CallbackQuery, state: FSMContext):
             try:
                 if photo:
                     await callback.bot.send_photo(
-                        chat_id=user[0],
+                        chat_id=user,
                         photo=photo,
                         caption=text,
                         parse_mode="Markdown"
                     )
                 else:
                     await callback.bot.send_message(
-                        chat_id=user[0],
+                        chat_id=user,
                         text=text,
                         parse_mode="Markdown"
                     )
                 sent_count += 1
             except Exception as e:
-                print(f"Ошибка отправки сообщения пользователю {user[0]}: {e}")
+                print(f"Ошибка отправки сообщения пользователю {user}: {e}")
                 failed_count += 1
 
             current_count = sent_count + failed_count
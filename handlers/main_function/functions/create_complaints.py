@@ -3,12 +3,11 @@ from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from handlers.main_handler import show_main_menu
 from typing import Optional, Dict, Tuple
 
 router = Router(name='create_complaints')
-db = Database()
 
 class ComplaintStates(StatesGroup):
     waiting_for_complaint_type = State()
@@ -33,7 +32,7 @@ def parse_complaint_data(callback_data: str) -> Tuple[Optional[str], Optional[st
     except Exception:
         return None, None, None
 
-def validate_complaint_data(
+async def validate_complaint_data(db: AsyncDatabase, 
     complaint_type: str,
     creator_telegram_id: str,
     accused_telegram_id: Optional[str] = None,
@@ -54,11 +53,11 @@ def validate_complaint_data(
         if creator_telegram_id == accused_telegram_id:
             return False, "Нельзя подать жалобу на самого себя"
             
-        if not db.get_user(telegram_id=accused_telegram_id):
+        if not await db.get_user(telegram_id=accused_telegram_id):
             return False, "Пользователь не найден"
             
         # Проверяем, не забанен ли пользователь
-        ban_info = db.get_ban_info('user', accused_telegram_id=accused_telegram_id)
+        ban_info = await db.get_ban_info('user', accused_telegram_id=accused_telegram_id)
         if ban_info:
             return False, "Пользователь уже заблокирован"
             
@@ -66,19 +65,19 @@ def validate_complaint_data(
         if not accused_service_id:
             return False, "Не указан ID услуги"
             
-        service = db.get_services(service_id=accused_service_id)
+        service = await db.get_services(service_id=accused_service_id)
         if not service:
             return False, "Услуга не найдена"
             
         # Проверяем, не забанена ли услуга
-        ban_info = db.get_ban_info('service', accused_service_id=accused_service_id)
+        ban_info = await db.get_ban_info('service', accused_service_id=accused_service_id)
         if ban_info:
             return False, "Услуга уже заблокирована"
             
     return True, ""
 
 @router.callback_query(F.data.startswith("create_complaint_"))
-async def create_complaint(callback: CallbackQuery, state: FSMContext) -> None:
+async def create_complaint(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase) -> None:
     try:
         complaint_type, accused_telegram_id, accused_service_id = parse_complaint_data(callback.data)
         if not complaint_type:
@@ -89,7 +88,7 @@ async def create_complaint(callback: CallbackQuery, state: FSMContext) -> None:
         creator_telegram_id = str(callback.from_user.id)
         
         # Валидация данных
-        is_valid, error_msg = validate_complaint_data(
+        is_valid, error_msg = await validate_complaint_data(db, 
             complaint_type, 
             creator_telegram_id,
             accused_telegram_id,
@@ -129,13 +128,13 @@ async def create_complaint(callback: CallbackQuery, state: FSMContext) -> None:
         await callback.answer()
 
 @router.callback_query(ComplaintStates.waiting_for_complaint_type)
-async def process_complaint_type(callback: CallbackQuery, state: FSMContext) -> None:
+async def process_complaint_type(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase) -> None:
     if callback.data == "no_answer_complaint":
         data = await state.get_data()
         service_id = data.get('accused_service_id')
         
         # Баним услугу на 2 часа
-        db.ban_entity(
+        await db.ban_entity(
             admin_telegram_id="SYSTEM",
             type='service',
             accused_service_id=service_id,
@@ -144,10 +143,10 @@ async def process_complaint_type(callback: CallbackQuery, state: FSMContext) ->
             reason="Не отвечает на звонки"
         )
         
-        db.update_service_status(service_id, 'blocked')
+        await db.update_service_status(service_id, 'blocked')
         
         # Уведомляем владельца услуги
-        service = db.get_service_by_id(service_id)
+        service = await db.get_service_by_id(service_id)
         if service:
             await callback.bot.send_message(
                 service['owner_telegram_id'],
@@ -171,7 +170,7 @@ async def process_complaint_type(callback: CallbackQuery, state: FSMContext) ->
     await callback.answer()
 
 @router.message(ComplaintStates.waiting_for_text)
-async def process_complaint_text(message: Message, state: FSMContext) -> None:
+async def process_complaint_text(message: Message, state: FSMContext, db: AsyncDatabase) -> None:
     try:
         complaint_text = message.text.strip()
         if len(complaint_text) < 10:
@@ -186,7 +185,7 @@ async def process_complaint_text(message: Message, state: FSMContext) -> None:
         data = await state.get_data()
         
         # Повторная проверка на бан перед сохранением жалобы
-        is_valid, error_msg = validate_complaint_data(
+        is_valid, error_msg = await validate_complaint_data(db, 
             data['complaint_type'],
             data['creator_telegram_id'],
             data.get('accused_telegram_id'),
@@ -198,7 +197,7 @@ async def process_complaint_text(message: Message, state: FSMContext) -> None:
             await state.clear()
             return
         
-        success = db.add_complaint(
+        success = await db.add_complaint(
             type=data['complaint_type'],
             creator_telegram_id=data['creator_telegram_id'],
             text=complaint_text,
@@ -212,9 +211,9 @@ async def process_complaint_text(message: Message, state: FSMContext) -> None:
         )
 
         # Возврат в главное меню
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = await db.get_user(telegram_id=str(message.from_user.id))
         if user:
-            await show_main_menu(message, user)
+            await show_main_menu(message, user, db)
         else:
             await message.answer("Ошибка при возврате в главное меню")
         
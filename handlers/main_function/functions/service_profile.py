@@ -4,25 +4,25 @@ from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from urllib.parse import quote
 import json
 from typing import List, Tuple, Dict, Any, Optional, Union
 from handlers.main_function.post_handler import to_home_keyboard
+from handlers.main_function.saved_search_handler import schedule_saved_search_notifications
 
 
 router = Router(name='service_profile')
-db = Database()
 ITEMS_PER_PAGE = 5
 
 class EditServiceStates(StatesGroup):
     waiting_for_photo = State()
     confirm_delete = State()
 
-def create_webapp_form_for_edit(service: Dict[str, Any]) -> Optional[ReplyKeyboardMarkup]:
+async def create_webapp_form_for_edit(db: AsyncDatabase, service: Dict[str, Any]) -> Optional[ReplyKeyboardMarkup]:
     """Создает форму веб-приложения для редактирования услуги"""
     try:
-        service_type = db.get_service_type(service["service_type_id"])
+        service_type = await db.get_service_type(service["service_type_id"])
         if not service_type or "required_fields" not in service_type:
             return None
             
@@ -76,11 +76,11 @@ def create_webapp_form_for_edit(service: Dict[str, Any]) -> Optional[ReplyKeyboa
         return None
 
 @router.callback_query(F.data.startswith("edit_service_"))
-async def start_edit_service(callback: CallbackQuery, state: FSMContext):
+async def start_edit_service(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Начало редактирования услуги"""
     try:
         service_id, page = map(int, callback.data.split("_")[2:])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         
         if not service:
             await callback.answer("❌ Услуга не найдена")
@@ -88,7 +88,7 @@ async def start_edit_service(callback: CallbackQuery, state: FSMContext):
             
         await state.update_data(edit_service_id=service_id, page=page, last_message_id=callback.message.message_id)
         
-        keyboard = create_webapp_form_for_edit(service)
+        keyboard = await create_webapp_form_for_edit(db, service)
         if keyboard:
             await callback.message.answer(
                 "🖥 Выберите действие:\n"
@@ -106,7 +106,7 @@ async def start_edit_service(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.message(lambda message: message.web_app_data and message.web_app_data.button_text == "📝 Редактировать")
-async def process_edit_webapp_data(message: Message, state: FSMContext):
+async def process_edit_webapp_data(message: Message, state: FSMContext, db: AsyncDatabase):
     """Обработка данных формы редактирования услуги"""
     try:
         data = json.loads(message.web_app_data.data)
@@ -117,11 +117,11 @@ async def process_edit_webapp_data(message: Message, state: FSMContext):
         if not service_id:
             raise ValueError("Услуга не найдена")
             
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         if not service:
             raise ValueError("Услуга не найдена")
             
-        service_type = db.get_service_type(service["service_type_id"])
+        service_type = await db.get_service_type(service["service_type_id"])
         if not service_type:
             raise ValueError("Тип услуги не найден")
 
@@ -182,7 +182,7 @@ async def process_edit_webapp_data(message: Message, state: FSMContext):
         print(f"Ошибка обработки формы: {e}")
 
 @router.message(EditServiceStates.waiting_for_photo)
-async def process_edit_photo(message: Message, state: FSMContext):
+async def process_edit_photo(message: Message, state: FSMContext, db: AsyncDatabase):
     """Обработка фото при редактировании"""
     try:
         data = await state.get_data()
@@ -193,7 +193,7 @@ async def process_edit_photo(message: Message, state: FSMContext):
         if not service_id:
             raise ValueError("Отсутствуют необходимые данные")
 
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         if not service:
             raise ValueError("Услуга не найдена")
 
@@ -205,9 +205,9 @@ async def process_edit_photo(message: Message, state: FSMContext):
             return
     
         # Обновляем услугу
-        if db.update_service(service_id, **form_data):
-            updated_service = db.get_services(service_id=service_id)
-            caption = await format_service_info(updated_service)
+        if await db.update_service(service_id, **form_data):
+            updated_service = await db.get_services(service_id=service_id)
+            caption = await format_service_info(db, updated_service)
             keyboard = await get_service_keyboard(service_id, updated_service['status'], page)
             
             if updated_service.get('photo_id'):
@@ -238,7 +238,7 @@ async def process_edit_photo(message: Message, state: FSMContext):
         await message.answer("❌ Ошибка обновления услуги\nПопробуйте позже или обратитесь в поддержку")
         print(f"Критическая ошибка: {e}")
 
-async def format_service_info(service: dict) -> str:
+async def format_service_info(db: AsyncDatabase, service: dict) -> str:
     """Форматирует информацию об услуге"""
     try:
         address_parts = []
@@ -271,7 +271,7 @@ async def format_service_info(service: dict) -> str:
             f"━━━━━━━━━━━━━━━\n"
         )
 
-        service_type = db.get_service_type(service['service_type_id'])
+        service_type = await db.get_service_type(service['service_type_id'])
         if not service_type:
             print(f"Тип услуги не найден: {service['service_type_id']}")
             return caption
@@ -310,28 +310,78 @@ async def get_service_keyboard(service_id: int, status: str, page: int) -> Inlin
 
     return kb.as_markup()
 
-async def get_navigation_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+async def get_navigation_keyboard(page: int, has_next: bool) -> InlineKeyboardMarkup:
     """Создает клавиатуру навигации"""
     kb = InlineKeyboardBuilder()
     
     buttons = []
     if page > 0:
-        buttons.append(("⬅️", f"services_page_{page-1}"))
+        buttons.append(("⬅️", f"my_services_page_{page-1}"))
     
-    buttons.append((f"📄 {page+1}/{total_pages}", "ignore"))
+    buttons.append((f"📄 {page+1}", "ignore"))
     
-    if page < total_pages - 1:
-        buttons.append(("➡️", f"services_page_{page+1}"))
+    if has_next:
+        buttons.append(("➡️", f"my_services_page_{page+1}"))
         
     kb.row(*[InlineKeyboardButton(text=text, callback_data=data) for text, data in buttons])
     
     return kb.as_markup()
 
+async def send_services_page(message: types.Message, state: FSMContext, db: AsyncDatabase,
+                             telegram_id: str, page: int = 0) -> bool:
+    """Отправляет страницу услуг продавца
+    Курсоры страниц хранятся в состоянии (my_services_cursors), поэтому
+    любая страница выбирается по индексу так же быстро, как первая
+    Returns:
+        True, если на странице есть услуги
+    """
+    state_data = await state.get_data()
+    # my_services_cursors[i] - курсор, с которого начинается страница i
+    cursors = state_data.get('my_services_cursors') if page > 0 else None
+    cursors = cursors or [None]
+    page = max(0, min(page, len(cursors) - 1))
+
+    services = await db.get_services(telegram_id=telegram_id, cursor=cursors[page], limit=ITEMS_PER_PAGE + 1)
+    if not services:
+        return False
+
+    has_next = len(services) > ITEMS_PER_PAGE
+    services = services[:ITEMS_PER_PAGE]
+    cursors = cursors[:page + 1] + ([services[-1]['cursor']] if has_next else [])
+    await state.update_data(my_services_cursors=cursors)
+
+    for service in services:
+        caption = await format_service_info(db, service)
+        keyboard = await get_service_keyboard(service['id'], service['status'], page)
+        
+        if service.get('photo_id'):
+            photo_ids = service['photo_id'].split(',')
+            if len(photo_ids) == 1:
+                await message.answer_photo(
+                    photo=photo_ids[0],
+                    caption=caption,
+                    reply_markup=keyboard
+                )
+            else:
+                media = [InputMediaPhoto(media=photo_ids[0], caption=caption)]
+                media.extend([InputMediaPhoto(media=photo_id) for photo_id in photo_ids[1:]])
+                await message.answer_media_group(media=media)
+                await message.answer(text="Управление услугой:", reply_markup=keyboard)
+        else:
+            await message.answer(caption, reply_markup=keyboard)
+
+    if page > 0 or has_next:
+        nav_markup = await get_navigation_keyboard(page, has_next)
+        await message.answer("Навигация:", reply_markup=nav_markup)
+    return True
+
 @router.message(F.text.in_(["📋 Все мои услуги", "my_services"]))
-async def show_services(message: types.Message):
+async def show_services(message: types.Message, state: FSMContext, db: AsyncDatabase,
+                        telegram_id: Optional[str] = None):
     """Показывает список услуг пользователя"""
     try:
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        telegram_id = telegram_id or str(message.from_user.id)
+        user = await db.get_user(telegram_id=telegram_id)
         if not user or not user[4]:  # user[4] - поле is_seller
             await message.answer(
                 "❌ Для просмотра услуг необходимо быть продавцом",
@@ -340,122 +390,60 @@ async def show_services(message: types.Message):
             return
 
         # Исправлено: используем telegram_id вместо user_id
-        services = db.get_services(telegram_id=str(message.from_user.id))
-        
-        if not services:
+        if not await send_services_page(message, state, db, telegram_id):
             await message.answer(
                 "📋 У вас пока нет опубликованных услуг\n"
                 "Введите /add_service чтобы добавить новую услугу"
             )
-            return
-
-        if isinstance(services, dict):
-            services = [services]
-
-        total_pages = (len(services) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-        
-        for service in services[:ITEMS_PER_PAGE]:
-            caption = await format_service_info(service)
-            keyboard = await get_service_keyboard(service['id'], service['status'], 0)
-            
-            if service.get('photo_id'):
-                photo_ids = service['photo_id'].split(',')
-                if len(photo_ids) == 1:
-                    await message.answer_photo(
-                        photo=photo_ids[0],
-                        caption=caption,
-                        reply_markup=keyboard
-                    )
-                else:
-                    media = [InputMediaPhoto(media=photo_ids[0], caption=caption)]
-                    media.extend([InputMediaPhoto(media=photo_id) for photo_id in photo_ids[1:]])
-                    await message.answer_media_group(media=media)
-                    await message.answer(text="Управление услугой:", reply_markup=keyboard)
-            else:
-                await message.answer(caption, reply_markup=keyboard)
-
-        if total_pages > 1:
-            nav_markup = await get_navigation_keyboard(0, total_pages)
-            await message.answer("Навигация:", reply_markup=nav_markup)
 
     except Exception as e:
         print(f"Ошибка при отображении услуг: {e}")
         await message.answer("❌ Произошла ошибка при загрузке услуг")
 
-@router.callback_query(F.data.startswith("services_page_"))
-async def handle_pagination(callback: CallbackQuery):
+@router.callback_query(F.data.startswith("my_services_page_"))
+async def handle_pagination(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Обработка пагинации"""
     try:
-        page = int(callback.data.split("_")[2])
-        user = db.get_user(telegram_id=str(callback.from_user.id))
+        page = int(callback.data.split("_")[3])
+        user = await db.get_user(telegram_id=str(callback.from_user.id))
         
         if not user:
             await callback.answer("❌ Пользователь не найден")
             return
             
-        services = db.get_services(user_id=user[0])
-        
-        if not services:
+        if not await send_services_page(callback.message, state, db, str(callback.from_user.id), page):
             await callback.answer("❌ У вас нет услуг")
             return
-        
-        if isinstance(services, dict):
-            services = [services]
-            
-        total_pages = (len(services) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-        start_idx = page * ITEMS_PER_PAGE
-        end_idx = start_idx + ITEMS_PER_PAGE
-        
-        for service in services[start_idx:end_idx]:
-            caption = await format_service_info(service)
-            keyboard = await get_service_keyboard(service['id'], service['status'], page)
-            
-            if service.get('photo_id'):
-                photo_ids = service['photo_id'].split(',')
-                if len(photo_ids) == 1:
-                    await callback.message.answer_photo(
-                        photo=photo_ids[0],
-                        caption=caption,
-                        reply_markup=keyboard
-                    )
-                else:
-                    media = [InputMediaPhoto(media=photo_ids[0], caption=caption)]
-                    media.extend([InputMediaPhoto(media=photo_id) for photo_id in photo_ids[1:]])
-                    await callback.message.answer_media_group(media=media)
-                    await callback.message.answer(text="Управление услугой:", reply_markup=keyboard)
-            else:
-                await callback.message.answer(caption, reply_markup=keyboard)
-
-        if total_pages > 1:
-            nav_markup = await get_navigation_keyboard(page, total_pages)
-            await callback.message.answer("Навигация:", reply_markup=nav_markup)
             
     except Exception as e:
         print(f"Ошибка при пагинации: {e}")
         await callback.answer("❌ Ошибка при обновлении страницы")
 
 @router.callback_query(F.data.startswith("toggle_service_"))
-async def toggle_service_status(callback: CallbackQuery):
+async def toggle_service_status(callback: CallbackQuery, db: AsyncDatabase):
     """Переключение статуса услуги"""
     try:
         service_id, page = map(int, callback.data.split("_")[2:])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         
         if not service:
             await callback.answer("❌ Услуга не найдена")
             return
             
         new_status = 'deactive' if service.get('status') == 'active' else 'active'
-        if db.update_service(service_id, status=new_status):
+        if await db.update_service(service_id, status=new_status):
             status_text = "включена ✅" if new_status == 'active' else "отключена ⭕"
             await callback.answer(f"Услуга успешно {status_text}")
+            if new_status == 'active':
+                # Повторно включенная услуга приходит только тем, кому о ней еще не писали
+                schedule_saved_search_notifications(callback.bot, db, service_id)
             
-            updated_service = db.get_services(service_id=service_id)
+            updated_service = await db.get_services(service_id=service_id)
             if not updated_service:
                 await callback.answer("❌ Ошибка при обновлении данных")
                 return
                 
-            caption = await format_service_info(updated_service)
+            caption = await format_service_info(db, updated_service)
             keyboard = await get_service_keyboard(service_id, new_status, page)
             
             if updated_service.get('photo_id'):
@@ -504,16 +492,16 @@ async def delete_service(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка")
 
 @router.callback_query(F.data.startswith("confirm_delete_"))
-async def confirm_delete_service(callback: CallbackQuery):
+async def confirm_delete_service(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Подтверждение удаления услуги"""
     try:
         service_id = int(callback.data.split("_")[2])
-        if db.delete_service(service_id, hard_delete=True):
+        if await db.delete_service(service_id, hard_delete=True):
             await callback.answer("✅ Услуга успешно удалена")
             await callback.message.answer("✅ Услуга успешно удалена")
             
             # Показываем обновленный список
-            await show_services(callback.message)
+            await show_services(callback.message, state, db, telegram_id=str(callback.from_user.id))
         else:
             await callback.answer("❌ Ошибка при удалении услуги")
     except Exception as e:
@@ -521,14 +509,14 @@ async def confirm_delete_service(callback: CallbackQuery):
         await callback.answer("❌ Произошла ошибка")
 
 @router.callback_query(F.data.startswith("cancel_delete_"))
-async def cancel_delete_service(callback: CallbackQuery):
+async def cancel_delete_service(callback: CallbackQuery, db: AsyncDatabase):
     """Отмена удаления услуги"""
     try:
         service_id = int(callback.data.split("_")[2])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         
         if service:
-            caption = await format_service_info(service)
+            caption = await format_service_info(db, service)
             keyboard = await get_service_keyboard(service_id, service['status'], 0)
             
             if service.get('photo_id'):
@@ -566,18 +554,18 @@ def validate_form_data(data: Dict[str, Any], required_fields: Dict[str, Dict[str
 
 
 @router.callback_query(F.data.startswith("view_service_"))
-async def view_service(callback: CallbackQuery):
+async def view_service(callback: CallbackQuery, db: AsyncDatabase):
     await callback.answer()
     """Просмотр услуги"""
     try:
         service_id = int(callback.data.split("_")[2])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         
         if not service:
             await callback.answer("❌ Услуга не найдена")
             return
             
-        caption = await format_service_info(service)
+        caption = await format_service_info(db, service)
         keyboard = InlineKeyboardBuilder()
         
         # Добавляем кнопку возврата к жалобам
@@ -607,7 +595,7 @@ async def view_service(callback: CallbackQuery):
             )
             
         # Увеличиваем счетчик просмотров
-        db.update_service(service_id, views=service.get('views', 0) + 1)
+        await db.increment_service_views(service_id)
         
     except Exception as e:
         print(f"Ошибка при просмотре услуги: {e}")
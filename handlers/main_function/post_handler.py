@@ -4,16 +4,17 @@ from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import json
-from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.models import User
 from keyboards.role_keyboards import seller_keyboard
 from keyboards.main_keyboards import to_home_keyboard
 from urllib.parse import quote, unquote
 from typing import Dict, Any, Optional
 import asyncio
 from utils.variables import ADMIN_IDS
+from handlers.main_function.saved_search_handler import schedule_saved_search_notifications
 
 router = Router(name='post_handler')
-db = Database()
 
 ITEMS_PER_PAGE = 8
 
@@ -42,9 +43,9 @@ def create_pagination_keyboard(total_items: int, current_page: int) -> InlineKey
     
     return keyboard.as_markup()
 
-def build_service_types_keyboard(page: int = 1) -> Optional[InlineKeyboardMarkup]:
+async def build_service_types_keyboard(db: AsyncDatabase, page: int = 1) -> Optional[InlineKeyboardMarkup]:
     """Создает клавиатуру типов услуг с пагинацией"""
-    service_types = db.get_service_types_by_creation_date()
+    service_types = await db.get_service_types_by_creation_date()
     if not service_types:
         return None
         
@@ -67,14 +68,14 @@ def build_service_types_keyboard(page: int = 1) -> Optional[InlineKeyboardMarkup
     
     return keyboard.as_markup()
 
-def create_webapp_form(service_type_id: int, need_enter_phone: Optional[bool] = True) -> Optional[ReplyKeyboardMarkup]:
+async def create_webapp_form(db: AsyncDatabase, service_type_id: int, need_enter_phone: Optional[bool] = True) -> Optional[ReplyKeyboardMarkup]:
     """Создает форму веб-приложения для услуги с дополнительными полями"""
     try:    
-        service_type = db.get_service_type(service_type_id)
+        service_type = await db.get_service_type(service_type_id)
         if not service_type:    
             return None
         
-        additional_fields = db.get_service_type_fields(service_type_id)
+        additional_fields = await db.get_service_type_fields(service_type_id)
 
         # Формируем базовый URL
         base_url = "https://spontaneous-kashata-919d92.netlify.app/create"
@@ -107,10 +108,11 @@ def create_webapp_form(service_type_id: int, need_enter_phone: Optional[bool] =
         return None
 
 @router.message(F.text.in_(["📈 Выставить свою услугу", "/add_service"]))
-async def start_post_service(message: Message, state: FSMContext):
+async def start_post_service(message: Message, state: FSMContext, db: AsyncDatabase,
+                             current_user: Optional[User] = None):
     """Начало публикации услуги"""
 
-    user = db.get_user(telegram_id=str(message.from_user.id))
+    user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
     if not user or not user[4]:
         await message.answer(
             "❌ Для публикации услуг необходимо быть продавцом",
@@ -118,7 +120,7 @@ async def start_post_service(message: Message, state: FSMContext):
         )
         return
 
-    keyboard = build_service_types_keyboard()
+    keyboard = await build_service_types_keyboard(db)
     if not keyboard:
         await message.answer(
             "❌ В данный момент нет доступных категорий услуг",
@@ -134,14 +136,15 @@ async def start_post_service(message: Message, state: FSMContext):
     )
 
 @router.callback_query(ServiceStates.selecting_type, lambda c: c.data.startswith('service_type:'))
-async def handle_service_type_selection(callback: CallbackQuery, state: FSMContext):
+async def handle_service_type_selection(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                                        current_user: Optional[User] = None):
     """Обработка выбора типа услуги"""
     try:
         service_type_id = int(callback.data.split(':')[1])
         await state.update_data(service_type_id=service_type_id)
         
-        user = db.get_user(telegram_id=str(callback.from_user.id))
-        keyboard = create_webapp_form(service_type_id, need_enter_phone=not bool(user[3]))
+        user = current_user or await db.get_user(telegram_id=str(callback.from_user.id))
+        keyboard = await create_webapp_form(db, service_type_id, need_enter_phone=not bool(user[3]))
         
         if keyboard:
             await callback.message.delete()
@@ -153,29 +156,29 @@ async def handle_service_type_selection(callback: CallbackQuery, state: FSMConte
         else:
             await callback.message.edit_text(
                 "❌ Ошибка получения формы",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
     except Exception as e:
         print(f"Ошибка выбора типа услуги: {e}")
         await callback.message.edit_text(
             "❌ Ошибка выбора категории",
-            reply_markup=build_service_types_keyboard()
+            reply_markup=await build_service_types_keyboard(db)
         )
     finally:
         await callback.answer()
 
 @router.callback_query(ServiceStates.selecting_type, F.data.startswith('page_'))
-async def handle_pagination(callback: CallbackQuery):
+async def handle_pagination(callback: CallbackQuery, db: AsyncDatabase):
     """Обработка пагинации"""
     try:
         page = int(callback.data.split('_')[1])
-        keyboard = build_service_types_keyboard(page)
+        keyboard = await build_service_types_keyboard(db, page)
         if keyboard:
             await callback.message.edit_reply_markup(reply_markup=keyboard)
         else:
             await callback.message.edit_text(
                 "❌ Ошибка загрузки категорий",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
     except Exception as e:
         print(f"Ошибка пагинации: {e}")
@@ -183,14 +186,15 @@ async def handle_pagination(callback: CallbackQuery):
     await callback.answer()
 
 @router.message(ServiceStates.filling_form, lambda message: message.web_app_data and message.web_app_data.button_text == "📝 Заполнить форму")
-async def process_create_webapp_data(message: Message, state: FSMContext):
+async def process_create_webapp_data(message: Message, state: FSMContext, db: AsyncDatabase,
+                                     current_user: Optional[User] = None):
     """Обработка данных формы для создания услуги"""
     print(message.web_app_data.data)
     try:
         form_data = json.loads(message.web_app_data.data)
 
         # Получаем пользователя и его телефон
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
         if not user[3] and not form_data.get('number_phone'):
             raise ValueError("Не указан номер телефона")
             
@@ -228,7 +232,8 @@ async def process_create_webapp_data(message: Message, state: FSMContext):
         await state.clear()
 
 @router.message(ServiceStates.waiting_for_photo, F.media_group_id)
-async def process_service_photo_album(message: Message, state: FSMContext):
+async def process_service_photo_album(message: Message, state: FSMContext, db: AsyncDatabase,
+                                      current_user: Optional[User] = None):
     """Обработка альбома фотографий услуги"""
     try:
         media_group_id = message.media_group_id
@@ -251,12 +256,12 @@ async def process_service_photo_album(message: Message, state: FSMContext):
         
         if len(photo_ids) >= 10:
             await message.answer("📸 Достигнут максимум фотографий (10 шт)")
-            await process_service_data(message, state)
+            await process_service_data(message, state, db, current_user)
         elif len(photo_ids) >= 1:
             await asyncio.sleep(1)
             final_data = await state.get_data()
             if len(final_data.get('photo_ids', [])) == len(photo_ids):
-                await process_service_data(message, state)
+                await process_service_data(message, state, db, current_user)
 
     except Exception as e:
         print(f"Ошибка обработки альбома: {e}")
@@ -268,13 +273,14 @@ async def process_service_photo_album(message: Message, state: FSMContext):
         await state.clear()
 
 @router.message(ServiceStates.waiting_for_photo, F.photo)
-async def process_service_photo(message: Message, state: FSMContext):
+async def process_service_photo(message: Message, state: FSMContext, db: AsyncDatabase,
+                                current_user: Optional[User] = None):
     """Обработка одиночного фото услуги"""
     try:
         if not message.media_group_id:
             await state.update_data(photo_ids=[message.photo[-1].file_id])
             await message.answer("✅ Фото успешно загружено!")
-            await process_service_data(message, state)
+            await process_service_data(message, state, db, current_user)
             
     except Exception as e:
         print(f"Ошибка обработки фото: {e}")
@@ -285,7 +291,8 @@ async def process_service_photo(message: Message, state: FSMContext):
         )
         await state.clear()
 
-async def process_service_data(message: Message, state: FSMContext):
+async def process_service_data(message: Message, state: FSMContext, db: AsyncDatabase,
+                               current_user: Optional[User] = None):
     """Обработка данных услуги и сохранение в БД"""
     try:
         data = await state.get_data()
@@ -296,16 +303,16 @@ async def process_service_data(message: Message, state: FSMContext):
         if not all([form_data, service_type_id, photo_ids]):
             raise ValueError("Отсутствуют необходимые данные")
 
-        service_type = db.get_service_type(service_type_id)
+        service_type = await db.get_service_type(service_type_id)
         if not service_type:
             raise ValueError("Неверный тип услуги")
 
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
         if not user:
             raise ValueError("Пользователь не найден")
 
         # Проверяем, не заблокирован ли пользователь
-        ban_info = db.get_ban_info('user', accused_telegram_id=str(message.from_user.id))
+        ban_info = await db.get_ban_info('user', accused_telegram_id=str(message.from_user.id))
         if ban_info:
             raise ValueError("Вы заблокированы и не можете создавать услуги")
 
@@ -330,17 +337,22 @@ async def process_service_data(message: Message, state: FSMContext):
             "house": form_data.get('house', 'Не указано').strip(),
             "number_phone": form_data.get('number_phone', user[3] or '').strip(),
             "price": price,
+            # Точка на карте, если форма ее передала; иначе база возьмет центр города
+            "latitude": form_data.get('latitude'),
+            "longitude": form_data.get('longitude'),
             "custom_fields": {
                 k: v.strip() if isinstance(v, str) else v
                 for k, v in form_data.items()
-                if k not in ['city', 'district', 'street', 'house', 'number_phone', 'price']
+                if k not in ['city', 'district', 'street', 'house', 'number_phone', 'price', 'latitude', 'longitude']
                 and v is not None
             }
         }
 
-        service_id = db.add_service(**service_data)
+        service_id = await db.add_service(**service_data)
         if not service_id:
             raise Exception("Ошибка при создании услуги")
+        # Подписчики с подходящими сохраненными поисками получают уведомление в фоне
+        schedule_saved_search_notifications(message.bot, db, service_id)
 
         await state.clear()
         await message.answer(
@@ -6,13 +6,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from typing import Optional
-from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.models import User
 from dotenv import load_dotenv
 
 load_dotenv()
 
 router = Router()
-db = Database()
 
 class ProfileStates(StatesGroup):
     waiting_for_phone = State()
@@ -22,12 +22,14 @@ class ProfileStates(StatesGroup):
     waiting_for_work_days = State()
 
 @router.message(F.text.in_(["👤 Профиль", "/profile"]))
-async def show_profile(message: Message, telegram_id: Optional[int] = None):
+async def show_profile(message: Message, db: AsyncDatabase, telegram_id: Optional[int] = None,
+                       current_user: Optional[User] = None):
     """Показывает профиль пользователя"""
     if telegram_id is None:
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
     else:
-        user = db.get_user(telegram_id=str(telegram_id))
+        # После изменения профиля перечитываем строку из базы
+        user = await db.get_user(telegram_id=str(telegram_id))
     
     if user is None:
         await message.answer("Ошибка: пользователь не найден")
@@ -36,21 +38,8 @@ async def show_profile(message: Message, telegram_id: Optional[int] = None):
     # Распаковываем данные пользователя согласно структуре БД
     user_id, telegram_id, username, phone, is_seller, full_name, work_time_start, work_time_end, work_days = user
     
-    # Получаем статистику жалоб через новый метод get_complaints
-    received_complaints = db.get_complaints(accused_telegram_id=telegram_id)
-    sent_complaints = db.get_complaints(creator_telegram_id=telegram_id)
-    
-    complaints_stats = {
-        'received_total': len(received_complaints),
-        'sent_total': len(sent_complaints),
-        'received_pending': len([c for c in received_complaints if c['status'] == 'pending'])
-    }
-    
-    # Если пользователь продавец, получаем его активные услуги
-    active_services_count = 0
-    if is_seller:
-        services = db.get_services(telegram_id=telegram_id, status='active')
-        active_services_count = len(services) if services else 0
+    # Счетчики жалоб и услуг поддерживаются в базе, читаем их одним запросом
+    stats = await db.get_user_stats(telegram_id)
     
     # Форматируем рабочие дни
     days_map = {
@@ -71,11 +60,11 @@ async def show_profile(message: Message, telegram_id: Optional[int] = None):
     if is_seller:
         profile_text += f"\n⏰ Время работы: {work_time_start} - {work_time_end}\n"
         profile_text += f"📅 Рабочие дни: {work_days_formatted}\n"
-        profile_text += f"📦 Активных услуг: {active_services_count}\n"
+        profile_text += f"📦 Активных услуг: {stats['active_services']}\n"
     
-    profile_text += f"\n📝 Жалоб получено: {complaints_stats['received_total']}\n"
-    profile_text += f"📝 Жалоб отправлено: {complaints_stats['sent_total']}\n"
-    profile_text += f"📝 Жалоб в обработке: {complaints_stats['received_pending']}\n"
+    profile_text += f"\n📝 Жалоб получено: {stats['complaints_received']}\n"
+    profile_text += f"📝 Жалоб отправлено: {stats['complaints_sent']}\n"
+    profile_text += f"📝 Жалоб в обработке: {stats['complaints_pending']}\n"
 
     # Создаем клавиатуру с действиями профиля
     keyboard = InlineKeyboardBuilder()
@@ -112,7 +101,8 @@ async def request_phone(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.message(ProfileStates.waiting_for_phone)
-async def process_phone(message: Message, state: FSMContext):
+async def process_phone(message: Message, state: FSMContext, db: AsyncDatabase,
+                        current_user: Optional[User] = None):
     """Обработка ввода номера телефона"""
     phone = message.text.strip()
     
@@ -124,12 +114,12 @@ async def process_phone(message: Message, state: FSMContext):
         return
         
     try:
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
         if not user:
             raise Exception("Пользователь не найден")
             
         # Обновляем телефон в БД
-        db.update_user(
+        await db.update_user(
             user_id=user[0],
             number_phone=phone
         )
@@ -138,7 +128,7 @@ async def process_phone(message: Message, state: FSMContext):
         await message.answer("✅ Номер телефона успешно сохранен!")
         
         # Отправляем новое сообщение с обновленным профилем
-        await show_profile(message, message.from_user.id)
+        await show_profile(message, db, message.from_user.id)
         
     except Exception as e:
         print(f"Ошибка при обновлении номера телефона: {e}")
@@ -177,15 +167,16 @@ async def work_time_request(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data == "work_24h")
-async def set_24h_work(callback: CallbackQuery, state: FSMContext):
+async def set_24h_work(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                       current_user: Optional[User] = None):
     """Установка круглосуточного режима работы"""
     try:
-        user = db.get_user(telegram_id=str(callback.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(callback.from_user.id))
         if not user:
             raise ValueError("Пользователь не найден")
             
         # Обновляем время работы в БД на круглосуточный режим
-        db.update_user(
+        await db.update_user(
             user_id=user[0],
             work_time_start="00:00",
             work_time_end="23:59"
@@ -195,7 +186,7 @@ async def set_24h_work(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_text("✅ Установлен круглосуточный режим работы!")
         
         # Обновляем профиль
-        await show_profile(callback.message, callback.from_user.id)
+        await show_profile(callback.message, db, callback.from_user.id)
         
     except ValueError as e:
         await callback.message.edit_text(f"❌ Ошибка: {str(e)}")
@@ -240,7 +231,8 @@ async def process_start_time(callback: CallbackQuery, state: FSMContext):
         await state.clear()
 
 @router.callback_query(lambda c: c.data.startswith("end_time_"))
-async def process_end_time(callback: CallbackQuery, state: FSMContext):
+async def process_end_time(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                           current_user: Optional[User] = None):
     """Обработка выбора времени окончания работы"""
     try:
         end_time = callback.data.split('_')[2]
@@ -250,12 +242,12 @@ async def process_end_time(callback: CallbackQuery, state: FSMContext):
         if not start_time:
             raise ValueError("Не выбрано время начала работы")
             
-        user = db.get_user(telegram_id=str(callback.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(callback.from_user.id))
         if not user:
             raise ValueError("Пользователь не найден")
             
         # Обновляем время работы в БД
-        db.update_user(
+        await db.update_user(
             user_id=user[0],
             work_time_start=f"{start_time}:00",
             work_time_end=f"{end_time}:00"
@@ -268,7 +260,7 @@ async def process_end_time(callback: CallbackQuery, state: FSMContext):
         )
         
         # Отправляем новое сообщение с обновленным профилем
-        await show_profile(callback.message, callback.from_user.id)
+        await show_profile(callback.message, db, callback.from_user.id)
         
     except ValueError as e:
         await callback.message.edit_text(f"❌ Ошибка: {str(e)}")
@@ -279,9 +271,10 @@ async def process_end_time(callback: CallbackQuery, state: FSMContext):
         await state.clear()
 
 @router.callback_query(F.data == "change_work_days")
-async def work_days_request(callback: CallbackQuery, state: FSMContext):
+async def work_days_request(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                            current_user: Optional[User] = None):
     """Запрос на изменение рабочих дней"""
-    user = db.get_user(telegram_id=str(callback.from_user.id))
+    user = current_user or await db.get_user(telegram_id=str(callback.from_user.id))
     current_days = set(user[8].split(',')) if user[8] else set()
     
     keyboard = InlineKeyboardBuilder()
@@ -351,7 +344,8 @@ async def toggle_work_day(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data == "save_work_days")
-async def save_work_days(callback: CallbackQuery, state: FSMContext):
+async def save_work_days(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                         current_user: Optional[User] = None):
     """Сохранение выбранных рабочих дней"""
     try:
         data = await state.get_data()
@@ -363,7 +357,7 @@ async def save_work_days(callback: CallbackQuery, state: FSMContext):
             )
             return
             
-        user = db.get_user(telegram_id=str(callback.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(callback.from_user.id))
         if not user:
             raise Exception("Пользователь не найден")
             
@@ -371,7 +365,7 @@ async def save_work_days(callback: CallbackQuery, state: FSMContext):
         work_days = ','.join(sorted(selected_days))
         
         # Обновляем рабочие дни в БД
-        db.update_user(
+        await db.update_user(
             user_id=user[0],
             work_days=work_days
         )
@@ -380,7 +374,7 @@ async def save_work_days(callback: CallbackQuery, state: FSMContext):
         await callback.message.edit_text("✅ Рабочие дни успешно обновлены!")
         
         # Отправляем новое сообщение с обновленным профилем
-        await show_profile(callback.message, callback.from_user.id)
+        await show_profile(callback.message, db, callback.from_user.id)
         
     except Exception as e:
         print(f"Ошибка при обновлении рабочих дней: {e}")
@@ -400,7 +394,8 @@ async def request_name(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.message(ProfileStates.waiting_for_name)
-async def process_name(message: Message, state: FSMContext):
+async def process_name(message: Message, state: FSMContext, db: AsyncDatabase,
+                       current_user: Optional[User] = None):
     """Обработка ввода имени"""
     name = message.text.strip()
     
@@ -412,12 +407,12 @@ async def process_name(message: Message, state: FSMContext):
         return
         
     try:
-        user = db.get_user(telegram_id=str(message.from_user.id))
+        user = current_user or await db.get_user(telegram_id=str(message.from_user.id))
         if not user:
             raise Exception("Пользователь не найден")
             
         # Обновляем имя в БД
-        db.update_user(
+        await db.update_user(
             user_id=user[0],
             full_name=name
         )
@@ -426,7 +421,7 @@ async def process_name(message: Message, state: FSMContext):
         await message.answer("✅ Имя успешно обновлено!")
         
         # Отправляем новое сообщение с обновленным профилем
-        await show_profile(message, message.from_user.id)
+        await show_profile(message, db, message.from_user.id)
         
     except Exception as e:
         print(f"Ошибка при обновлении имени: {e}")
@@ -434,8 +429,8 @@ async def process_name(message: Message, state: FSMContext):
         await state.clear()
 
 @router.callback_query(F.data == "cancel_input")
-async def cancel_input(callback: CallbackQuery, state: FSMContext):
+async def cancel_input(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Отмена ввода данных"""
     await state.clear()
     await callback.message.edit_text("❌ Действие отменено")
-    await show_profile(callback.message, callback.from_user.id)
\ No newline at end of file
+    await show_profile(callback.message, db, callback.from_user.id)
\ No newline at end of file
@@ -0,0 +1,183 @@
+import asyncio
+
+from aiogram import Bot, Router, F
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from typing import Any, Dict, Set
+
+from utils.async_database import AsyncDatabase
+
+router = Router(name='saved_search_handler')
+
+MAX_SAVED_SEARCHES = 10
+# Пауза между уведомлениями, чтобы не упереться в ограничения Telegram
+NOTIFY_DELAY = 0.05
+# Фильтры списка услуг (list_filters), которые сохраняются в подписке
+SAVED_SEARCH_FILTERS = {
+    'service_type_id', 'city', 'price_min', 'price_max', 'custom_fields', 'search_text', 'near', 'radius_km'
+}
+# Параметры списка, которые задают только порядок и статус услуг, а не выбор
+LIST_ORDER_FILTERS = {'sort_by', 'sort_direction', 'status'}
+
+# Запущенные рассылки уведомлений: ссылки не дают сборщику мусора
+# прервать рассылку, а при остановке бот дожидается их до закрытия базы
+_notify_tasks: Set[asyncio.Task] = set()
+
+
+def describe_saved_search(search: Dict[str, Any]) -> str:
+    """Краткое описание сохраненного поиска одной строкой"""
+    parts = [search.get('service_type_name') or "Услуги"]
+    if search.get('search_text'):
+        parts.append(f"🔎 «{search['search_text']}»")
+    if search.get('radius_km'):
+        parts.append(f"📍 в радиусе {search['radius_km']:g} км")
+    if search.get('city'):
+        parts.append(f"📍 {search['city'].title()}")
+    if search.get('price_min') is not None and search.get('price_max') is not None:
+        parts.append(f"💰 {search['price_min']:g}-{search['price_max']:g}₽")
+    elif search.get('price_min') is not None:
+        parts.append(f"💰 от {search['price_min']:g}₽")
+    elif search.get('price_max') is not None:
+        parts.append(f"💰 до {search['price_max']:g}₽")
+    for name, value in (search.get('custom_fields') or {}).items():
+        if isinstance(value, list):
+            value = ', '.join(map(str, value))
+        parts.append(f"{name}: {value}")
+    return " · ".join(parts)
+
+
+async def notify_saved_searches(bot: Bot, db: AsyncDatabase, service_id: int) -> None:
+    """Уведомляет подписчиков, чьи сохраненные поиски подходят опубликованной услуге
+    Запускается в фоне после публикации или повторного включения услуги
+    """
+    try:
+        matches = await db.claim_saved_search_matches(service_id)
+        if not matches:
+            return
+        service = await db.get_services(service_id=service_id)
+        if not service:
+            return
+
+        # Несколько поисков одного пользователя - одно уведомление
+        searches_by_user: Dict[str, int] = {}
+        for match in matches:
+            searches_by_user.setdefault(match['telegram_id'], match['search_id'])
+
+        text = (
+            "🔔 Новая услуга по вашему сохраненному поиску\n\n"
+            f"📋 {service.get('service_type_name') or service.get('title')}\n"
+            f"📍 {service.get('city')}, {service.get('district')}\n"
+            f"💰 {service.get('price')}₽"
+        )
+        for telegram_id, search_id in searches_by_user.items():
+            keyboard = InlineKeyboardBuilder()
+            keyboard.row(InlineKeyboardButton(text="📞 Показать телефон", callback_data=f"call_{service_id}"))
+            keyboard.row(InlineKeyboardButton(text="🔕 Отписаться", callback_data=f"delete_search:{search_id}"))
+            try:
+                await bot.send_message(int(telegram_id), text, reply_markup=keyboard.as_markup())
+            except Exception as e:
+                print(f"Ошибка при отправке уведомления пользователю {telegram_id}: {e}")
+            await asyncio.sleep(NOTIFY_DELAY)
+
+    except Exception as e:
+        print(f"Ошибка при уведомлении подписчиков об услуге {service_id}: {e}")
+
+
+def schedule_saved_search_notifications(bot: Bot, db: AsyncDatabase, service_id: int) -> None:
+    """Запускает notify_saved_searches в фоне, не задерживая ответ продавцу"""
+    task = asyncio.create_task(notify_saved_searches(bot, db, service_id))
+    _notify_tasks.add(task)
+    task.add_done_callback(_notify_tasks.discard)
+
+
+async def wait_saved_search_notifications() -> None:
+    """Дожидается запущенных рассылок (при остановке бота, до закрытия сессии и базы)"""
+    if _notify_tasks:
+        await asyncio.gather(*_notify_tasks, return_exceptions=True)
+
+
+@router.callback_query(F.data == "save_search")
+async def save_search(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
+    """Сохраняет текущие фильтры списка услуг как подписку на новые услуги"""
+    try:
+        state_data = await state.get_data()
+        filters = state_data.get('list_filters') or {}
+        if not filters.get('service_type_id'):
+            await callback.answer("❌ Сначала выберите категорию услуг", show_alert=True)
+            return
+        if set(filters) - SAVED_SEARCH_FILTERS - LIST_ORDER_FILTERS:
+            # Подписка, которая присылала бы не то, что показывает список, хуже отказа
+            await callback.answer("❌ На поиск с такими фильтрами нельзя подписаться", show_alert=True)
+            return
+
+        telegram_id = str(callback.from_user.id)
+        if len(await db.get_saved_searches(telegram_id)) >= MAX_SAVED_SEARCHES:
+            await callback.answer(
+                f"❌ Можно сохранить не больше {MAX_SAVED_SEARCHES} поисков. Удалите лишние: /my_searches",
+                show_alert=True
+            )
+            return
+
+        # Подписка выбирает услуги по тем же фильтрам, что и список
+        search_id = await db.add_saved_search(
+            telegram_id,
+            filters['service_type_id'],
+            city=filters.get('city'),
+            price_min=filters.get('price_min'),
+            price_max=filters.get('price_max'),
+            custom_fields=filters.get('custom_fields'),
+            search_text=filters.get('search_text'),
+            near=filters.get('near'),
+            radius_km=filters.get('radius_km')
+        )
+        if not search_id:
+            await callback.answer("❌ Не удалось сохранить поиск", show_alert=True)
+            return
+
+        text = "🔔 Поиск сохранен. Мы напишем, когда появится подходящая услуга.\n"
+        if state_data.get('only_available'):
+            # Рабочее время продавца проверяется в момент просмотра, а не публикации
+            text += "Уведомления приходят независимо от того, работает ли продавец сейчас.\n"
+        await callback.answer(text + "Список подписок: /my_searches", show_alert=True)
+    except Exception as e:
+        print(f"Ошибка при сохранении поиска: {e}")
+        await callback.answer("❌ Произошла ошибка")
+
+
+@router.message(Command("my_searches"))
+async def show_saved_searches(message: Message, db: AsyncDatabase):
+    """Список сохраненных поисков с кнопками удаления"""
+    searches = await db.get_saved_searches(str(message.from_user.id))
+    if not searches:
+        await message.answer(
+            "🔕 У вас нет сохраненных поисков\n"
+            "Настройте фильтры в списке услуг и нажмите «🔔 Подписаться на новые»"
+        )
+        return
+
+    keyboard = InlineKeyboardBuilder()
+    lines = ["🔔 Ваши сохраненные поиски:"]
+    for number, search in enumerate(searches, start=1):
+        lines.append(f"{number}. {describe_saved_search(search)}")
+        keyboard.row(InlineKeyboardButton(text=f"🗑 Удалить {number}", callback_data=f"delete_search:{search['id']}"))
+
+    await message.answer("\n".join(lines), reply_markup=keyboard.as_markup())
+
+
+@router.callback_query(F.data.startswith("delete_search:"))
+async def delete_saved_search(callback: CallbackQuery, db: AsyncDatabase):
+    """Удаление сохраненного поиска (из списка или из уведомления)"""
+    try:
+        search_id = int(callback.data.split(':')[1])
+        if await db.delete_saved_search(search_id, str(callback.from_user.id)):
+            await callback.answer("🔕 Подписка удалена")
+            try:
+                await callback.message.edit_reply_markup(reply_markup=None)
+            except Exception:
+                pass
+        else:
+            await callback.answer("❌ Подписка не найдена")
+    except (ValueError, IndexError):
+        await callback.answer("❌ Некорректная подписка")
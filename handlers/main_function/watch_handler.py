@@ -6,30 +6,33 @@ from aiogram.types import (
     WebAppInfo, KeyboardButton, ReplyKeyboardMarkup, Message,
     InputMediaPhoto
 )
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from utils.database import Database
+from utils.async_database import AsyncDatabase
 from handlers.main_function.functions.create_complaints import ComplaintStates, parse_complaint_data, validate_complaint_data
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from urllib.parse import quote
 
 router = Router(name='watch_handler')
-db = Database()
 
 ITEMS_PER_PAGE = 15
+# Сколько вариантов каждого фасета передавать в Mini App и показывать в сводке
+FACET_LIMIT = 10
+# Радиус поиска услуг рядом с присланной геопозицией, км
+NEARBY_RADIUS_KM = 10
 
 class SearchStates(StatesGroup):
     browsing = State()
     filtering = State()
     viewing_service = State()
 
-def build_service_types_keyboard(page: int = 1) -> Optional[InlineKeyboardMarkup]:
+async def build_service_types_keyboard(db: AsyncDatabase, page: int = 1) -> Optional[InlineKeyboardMarkup]:
     """Создает клавиатуру с типами услуг"""
     # Получаем типы услуг, отсортированные по времени создания (старые сверху)
-    service_types = db.get_service_types_by_creation_date()
+    service_types = await db.get_service_types_by_creation_date()
     if not service_types:
         return
 
@@ -60,23 +63,22 @@ def build_service_types_keyboard(page: int = 1) -> Optional[InlineKeyboardMarkup
 
     return keyboard.as_markup()
 
-def create_services_keyboard(services: List[Dict], page: int = 1, type_id: Optional[int] = None) -> InlineKeyboardMarkup:
-    """Создает клавиатуру со списком услуг, где каждая услуга представлена двумя кнопками:
+def create_services_keyboard(services: List[Dict], page: int = 1, has_next: bool = False,
+                             type_id: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Создает клавиатуру со списком услуг текущей страницы, где каждая услуга представлена двумя кнопками:
        - с информацией об услуге
        - для показа фото услуги
     """
     keyboard = InlineKeyboardBuilder()
 
     if not services:
-        print("Список услуг пуст")
         keyboard.row(InlineKeyboardButton(text="🔙 К категориям", callback_data="back_to_categories"))
         return keyboard.as_markup()
 
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    current_page_services = services[start_idx:start_idx + ITEMS_PER_PAGE]
-
-    for service in current_page_services:
+    for service in services:
         service_info = f"{service.get('city', 'Город не указан')} - {service.get('price', 0)}₽"
+        if service.get('distance_km') is not None:
+            service_info += f" · {service['distance_km']:.1f} км"
         # if service.get('custom_fields'):
         #     try:
         #         custom_fields = service['custom_fields'] if isinstance(service['custom_fields'], dict) else json.loads(service['custom_fields'])
@@ -99,15 +101,16 @@ def create_services_keyboard(services: List[Dict], page: int = 1, type_id: Optio
             )
         )
 
-    # Пагинация (если услуг больше, чем ITEMS_PER_PAGE)
-    if len(services) > ITEMS_PER_PAGE:
-        pagination_row = []
-        if page > 1:
-            pagination_row.append(InlineKeyboardButton(text="⬅️", callback_data=f"services_page_{page-1}"))
-        if len(services) > start_idx + ITEMS_PER_PAGE:
-            pagination_row.append(InlineKeyboardButton(text="➡️", callback_data=f"services_page_{page+1}"))
-        if pagination_row:
-            keyboard.row(*pagination_row)
+    # Пагинация: курсоры страниц хранятся в состоянии (page_cursors)
+    pagination_row = []
+    if page > 1:
+        pagination_row.append(InlineKeyboardButton(text="⬅️", callback_data=f"services_page_{page-1}"))
+    if has_next:
+        pagination_row.append(InlineKeyboardButton(text="➡️", callback_data=f"services_page_{page+1}"))
+    if pagination_row:
+        keyboard.row(*pagination_row)
+
+    keyboard.row(InlineKeyboardButton(text="🔔 Подписаться на новые", callback_data="save_search"))
 
     keyboard.row(
         InlineKeyboardButton(text="🔄 Сбросить фильтры", callback_data="reset_filters"),
@@ -117,6 +120,74 @@ def create_services_keyboard(services: List[Dict], page: int = 1, type_id: Optio
 
     return keyboard.as_markup()
 
+async def load_services_page(db: AsyncDatabase, filters: Dict[str, Any], cursor: Optional[str] = None,
+                             only_available: bool = False,
+                             with_facets: bool = False) -> Tuple[List[Dict], Optional[str], Optional[Dict[str, Any]]]:
+    """Загружает страницу услуг, начиная с курсора
+    Args:
+        filters: Параметры filter_services
+        cursor: Курсор страницы (None для первой)
+        only_available: Показывать только услуги продавцов, работающих сейчас
+        with_facets: Посчитать фасеты по тем же фильтрам в том же запросе
+    Returns:
+        Услуги страницы, курсор следующей страницы (None, если страница последняя)
+        и фасеты (None без with_facets)
+    """
+    # Берем на одну услугу больше, чтобы узнать, есть ли следующая страница.
+    # Рабочее время продавцов проверяется в том же запросе (индекс seller_hours)
+    result = await db.filter_services(
+        **filters, cursor=cursor, limit=ITEMS_PER_PAGE + 1, available_now=only_available,
+        with_facets=with_facets
+    )
+    services, facets = (result['services'], result['facets']) if with_facets else (result, None)
+
+    page_services = services[:ITEMS_PER_PAGE]
+    next_cursor = page_services[-1]['cursor'] if len(services) > ITEMS_PER_PAGE else None
+    return page_services, next_cursor, facets
+
+async def open_services_page(db: AsyncDatabase, state: FSMContext, page: int = 1,
+                             filters: Optional[Dict[str, Any]] = None,
+                             only_available: Optional[bool] = None,
+                             with_facets: bool = False) -> Tuple[List[Dict], InlineKeyboardMarkup, Optional[Dict[str, Any]]]:
+    """Открывает страницу списка услуг и запоминает курсоры в состоянии
+    Если переданы filters, список строится заново с первой страницы
+
+    Сами услуги в состоянии не хранятся: список описывается фильтрами,
+    курсорами страниц и номером текущей страницы, а страница каждый раз
+    загружается заново (повторы того же запроса отдает кэш выдачи в
+    AsyncDatabase). Так состояние занимает несколько сотен байт при любом
+    количестве найденных услуг.
+    Returns:
+        Услуги страницы, клавиатура списка и фасеты списка (при with_facets,
+        иначе None), посчитанные тем же запросом с теми же фильтрами
+    """
+    if filters is not None:
+        await state.update_data(
+            # Пустые фильтры не храним
+            list_filters={key: value for key, value in filters.items() if value not in (None, '', [], {})},
+            only_available=bool(only_available),
+            page_cursors=[None]
+        )
+        page = 1
+
+    state_data = await state.get_data()
+    # page_cursors[i] - курсор, с которого начинается страница i + 1
+    page_cursors = state_data.get('page_cursors') or [None]
+    page = max(1, min(page, len(page_cursors)))
+
+    services, next_cursor, facets = await load_services_page(
+        db,
+        state_data.get('list_filters', {}),
+        page_cursors[page - 1],
+        state_data.get('only_available', False),
+        with_facets
+    )
+
+    page_cursors = page_cursors[:page] + ([next_cursor] if next_cursor else [])
+    await state.update_data(page_cursors=page_cursors, current_page=page)
+
+    return services, create_services_keyboard(services, page=page, has_next=next_cursor is not None), facets
+
 def create_service_details_keyboard(service: Dict[str, Any], seller_id: str) -> InlineKeyboardMarkup:
     """Создает клавиатуру для детального просмотра услуги с кнопкой 'Показать фото'"""
     keyboard = InlineKeyboardBuilder()
@@ -134,30 +205,48 @@ def create_service_details_keyboard(service: Dict[str, Any], seller_id: str) ->
 
     return keyboard.as_markup()
 
-def create_filter_webapp_keyboard(service_type_id: int) -> Optional[ReplyKeyboardMarkup]:
-    service_type = db.get_service_type(service_type_id)
-    if not service_type or "required_fields" not in service_type:
+def top_facet_values(counts: Dict[str, int], limit: int = FACET_LIMIT) -> Dict[str, int]:
+    """Самые частые значения фасета (по убыванию количества услуг)"""
+    return dict(sorted(counts.items(), key=lambda item: -item[1])[:limit])
+
+def format_facet_summary(facets: Dict[str, Any]) -> List[str]:
+    """Строки сводки с количеством найденных услуг по городам и ценам"""
+    lines = []
+    if len(facets['city']) > 1:
+        cities = ', '.join(f"{city} ({count})" for city, count in top_facet_values(facets['city'], 5).items())
+        lines.append(f"🏙 По городам: {cities}")
+    if len(facets['price']) > 1:
+        prices = ', '.join(f"{label}₽ ({count})" for label, count in facets['price'].items())
+        lines.append(f"💰 По ценам: {prices}")
+    return lines
+
+async def create_filter_webapp_keyboard(db: AsyncDatabase, service_type_id: int,
+                                        facets: Optional[Dict[str, Any]] = None) -> Optional[ReplyKeyboardMarkup]:
+    service_type = await db.get_service_type(service_type_id)
+    if not service_type:
         return None
 
     base_url = "https://spontaneous-kashata-919d92.netlify.app/search"
-    custom_fields = {}
+    url_params = []
+
+    # Поля фильтра передаются так же, как в форме создания услуги
+    for field in await db.get_service_type_fields(service_type_id):
+        if field['field_type'] in ['select', 'multiselect']:
+            options = '+'.join(quote(option) for option in field['item_for_select'].split(','))
+            url_params.append(f"{field['name']}={quote(field['name_for_user'])}+|+{options}")
+        else:
+            url_params.append(f"{field['name']}={quote(field['name_for_user'])}")
+
+    # Количество услуг по вариантам фильтров, чтобы Mini App показал их без запросов к боту
+    if facets:
+        compact_facets = {
+            'total': facets['total'],
+            'city': top_facet_values(facets['city']),
+            'price': facets['price'],
+            'fields': {name: top_facet_values(counts) for name, counts in facets['fields'].items()},
+        }
+        url_params.append(f"facets={quote(json.dumps(compact_facets, ensure_ascii=False, separators=(',', ':')))}")
 
-    required_fields = service_type["required_fields"]
-    if isinstance(required_fields, str):
-        try:
-            required_fields = json.loads(required_fields)
-        except json.JSONDecodeError:
-            return None
-
-    for field_name, field_data in required_fields.items():
-        if field_name in {'photo', 'number_phone', 'price'}:
-            continue
-        if isinstance(field_data, dict):
-            description = field_data.get('description', '')
-            if description:
-                custom_fields[field_name] = description
-
-    url_params = [f"{param}={quote(value)}" for param, value in custom_fields.items()]
     webapp_url = f"{base_url}?{'&'.join(url_params)}"
 
     keyboard = ReplyKeyboardBuilder()
@@ -167,14 +256,15 @@ def create_filter_webapp_keyboard(service_type_id: int) -> Optional[ReplyKeyboar
             web_app=WebAppInfo(url=webapp_url)
         )
     )
+    keyboard.row(KeyboardButton(text="📍 Услуги рядом", request_location=True))
     keyboard.row(KeyboardButton(text="Вернуться домой 🏠"))
 
     return keyboard.as_markup(resize_keyboard=True, one_time_keyboard=False)
 
 @router.message(F.text.in_(["👁️ Смотреть услуги", "/search"]))
-async def start_search(message: Message, state: FSMContext):
+async def start_search(message: Message, state: FSMContext, db: AsyncDatabase):
     """Начало поиска услуг"""
-    keyboard = build_service_types_keyboard()
+    keyboard = await build_service_types_keyboard(db)
     if not keyboard:
         await message.answer(
             "❌ В данный момент нет доступных категорий услуг"
@@ -186,95 +276,43 @@ async def start_search(message: Message, state: FSMContext):
     await message.answer("Доступные категории:", reply_markup=keyboard)
 
 @router.callback_query(SearchStates.browsing, lambda c: c.data.startswith('watch_type:'))
-async def show_services_by_type(callback: CallbackQuery, state: FSMContext):
+async def show_services_by_type(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Показывает услуги выбранного типа"""
     try:
         service_type_id = int(callback.data.split(':')[1])
 
+        # Получаем первую страницу активных услуг выбранного типа и фасеты
+        # списка (общее количество, города, цены) тем же запросом
+        await state.update_data(current_type_id=service_type_id)
+        available_services, keyboard, facets = await open_services_page(
+            db, state,
+            filters={'service_type_id': service_type_id, 'status': 'active', 'sort_by': 'relevance'},
+            # Фильтруем услуги по рабочему времени продавцов
+            only_available=True,
+            with_facets=True
+        )
+        total = facets['total']
+
         await callback.message.answer(
             "📋 Выберите категорию услуг для просмотра:\n"
             "Используйте кнопку «🔍 Настроить фильтры» для уточнения поиска",
-            reply_markup=create_filter_webapp_keyboard(service_type_id)
-        )
-        # Получаем активные услуги выбранного типа
-        services = db.filter_services(
-            service_type_id=service_type_id,
-            status='active',
-            limit=100
+            reply_markup=await create_filter_webapp_keyboard(db, service_type_id, facets)
         )
 
-        if not services:
-            await callback.message.edit_text(
-                "❌ В данной категории пока нет услуг",
-                reply_markup=build_service_types_keyboard()
-            )
-            
-            await callback.answer()
-            return
-
-        # Фильтруем услуги по рабочему времени продавцов
-        current_time = datetime.now().time()
-        current_weekday = str(datetime.now().isoweekday()) 
-        
-        available_services = []
-        
-        for service in services:
-            try:
-                seller_id = service.get('user_id')
-                if not seller_id:
-                    continue
-                    
-                seller = db.get_user(telegram_id=str(seller_id))
-                if not seller:
-                    continue
-
-                user_id, telegram_id, username, phone, is_seller, full_name, work_time_start, work_time_end, work_days = seller
-
-                if not all([work_time_start, work_time_end, work_days]):
-                    available_services.append(service)
-                    continue
-
-                try:
-                    if not (work_time_start and work_time_end and ':' in work_time_start and ':' in work_time_end):
-                        available_services.append(service)
-                        continue
-
-                    start_time = datetime.strptime(work_time_start, '%H:%M').time()
-                    end_time = datetime.strptime(work_time_end, '%H:%M').time()
-                    work_days_list = work_days.split(',')
-                    
-                    if current_weekday in work_days_list:
-                        if start_time <= end_time:
-                            if start_time <= current_time <= end_time:
-                                available_services.append(service)
-                        else:  # Если конец рабочего дня на следующий день
-                            if current_time >= start_time or current_time <= end_time:
-                                available_services.append(service)
-                except (ValueError, TypeError):
-                    available_services.append(service)
-                    continue
-                    
-            except Exception:
-                continue
-
         if not available_services:
+            # Есть ли в категории услуги вне рабочего времени продавцов
+            has_services = await db.filter_services(service_type_id=service_type_id, status='active', limit=1)
             await callback.message.edit_text(
+                "❌ В данной категории пока нет услуг" if not has_services else
                 "❌ В данный момент нет доступных услуг в этой категории",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
             await callback.answer()
             return
 
-        # Сохраняем данные в состояние
-        await state.update_data({
-            'current_type_id': service_type_id,
-            'services': available_services
-        })
-
-        # Создаем клавиатуру и текст сообщения
-        keyboard = create_services_keyboard(available_services, type_id=service_type_id)
+        # Создаем текст сообщения
         new_text = (
-            f"📋 Найдено доступных услуг: {len(available_services)}\n"
+            f"📋 Доступно услуг в категории: {total}\n"
             "Используйте кнопку «🔍 Настроить фильтры» для уточнения поиска"
         )
 
@@ -289,30 +327,30 @@ async def show_services_by_type(callback: CallbackQuery, state: FSMContext):
         try:
             await callback.message.edit_text(
                 "❌ Произошла ошибка при загрузке услуг",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
         except Exception as edit_error:
             await callback.message.answer(
                 "❌ Произошла ошибка при загрузке услуг",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
     finally:
         await callback.answer()
             
 
 @router.callback_query(SearchStates.browsing, lambda c: c.data.startswith('service:'))
-async def show_service_details(callback: CallbackQuery, state: FSMContext):
+async def show_service_details(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Показывает детальную информацию об услуге"""
     try:
         service_id = int(callback.data.split(':')[1])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
 
         if not service:
             await callback.answer("❌ Услуга не найдена")
             return
 
         # Получаем информацию о продавце
-        seller = db.get_user(telegram_id=service['user_id'])
+        seller = await db.get_user(telegram_id=service['user_id'])
         if not seller:
             await callback.answer("❌ Информация о продавце недоступна")
             return
@@ -358,9 +396,9 @@ async def show_service_details(callback: CallbackQuery, state: FSMContext):
                 # Продолжаем выполнение даже при ошибке проверки времени
                 pass
 
-        db.increment_service_views(service_id)
+        await db.increment_service_views(service_id)
 
-        details = await format_service_info(service)
+        details = await format_service_info(db, service)
 
         await state.set_state(SearchStates.viewing_service)
 
@@ -400,28 +438,25 @@ async def show_service_details(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.callback_query(lambda c: c.data == "reset_filters")
-async def reset_filters(callback: CallbackQuery, state: FSMContext):
+async def reset_filters(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Сброс всех примененных фильтров"""
     try:
         state_data = await state.get_data()
         service_type_id = state_data.get('current_type_id')
 
         if service_type_id:
-            services = db.filter_services(
-                service_type_id=service_type_id,
-                status='active'
-            )
-            await state.update_data(services=services)
-            keyboard = create_services_keyboard(services)
+            filters = {'service_type_id': service_type_id, 'status': 'active', 'sort_by': 'relevance'}
+            services, keyboard, _ = await open_services_page(db, state, filters=filters)
+            await state.update_data(last_filters={})
 
             await callback.message.edit_text(
-                f"🔄 Фильтры сброшены\n📋 Найдено услуг: {len(services)}",
+                f"🔄 Фильтры сброшены\n📋 Найдено услуг: {await db.count_services(**filters)}",
                 reply_markup=keyboard
             )
         else:
             await callback.message.edit_text(
                 "❌ Не удалось сбросить фильтры",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
     except Exception as e:
         print(f"Ошибка при сбросе фильтров: {e}")
@@ -430,7 +465,7 @@ async def reset_filters(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.callback_query(lambda c: c.data == "refresh_services")
-async def refresh_services(callback: CallbackQuery, state: FSMContext):
+async def refresh_services(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Обновление списка услуг"""
     try:
         state_data = await state.get_data()
@@ -441,19 +476,20 @@ async def refresh_services(callback: CallbackQuery, state: FSMContext):
             await callback.answer("❌ Не удалось обновить список")
             return
 
-        services = db.filter_services(
-            service_type_id=service_type_id,
-            city=last_filters.get('city'),
-            price_min=last_filters.get('price_min'),
-            price_max=last_filters.get('price_max'),
-            custom_fields=last_filters.get('custom_fields'),
-            sort_by=last_filters.get('sort_by', 'created_at'),
-            sort_direction=last_filters.get('sort_direction', 'DESC'),
-            status='active'
-        )
-
-        await state.update_data(services=services)
-        keyboard = create_services_keyboard(services)
+        filters = {
+            'service_type_id': service_type_id,
+            'city': last_filters.get('city'),
+            'price_min': last_filters.get('price_min'),
+            'price_max': last_filters.get('price_max'),
+            'custom_fields': last_filters.get('custom_fields'),
+            'sort_by': last_filters.get('sort_by', 'relevance'),
+            'sort_direction': last_filters.get('sort_direction', 'DESC'),
+            'near': last_filters.get('near'),
+            'radius_km': last_filters.get('radius_km'),
+            'search_text': last_filters.get('search_text'),
+            'status': 'active'
+        }
+        services, keyboard, _ = await open_services_page(db, state, filters=filters)
 
         filter_text = ["🔄 Список обновлен"]
 
@@ -474,8 +510,12 @@ async def refresh_services(callback: CallbackQuery, state: FSMContext):
                 filter_text.append("📌 Дополнительные фильтры:")
                 for field, value in custom_fields.items():
                     filter_text.append(f"   • {field}: {value}")
+            if last_filters.get('search_text'):
+                filter_text.append(f"🔎 Запрос: {last_filters['search_text']}")
+            if last_filters.get('near'):
+                filter_text.append(f"📍 В радиусе {last_filters['radius_km']} км от вас")
 
-        filter_text.append(f"📋 Найдено услуг: {len(services)}")
+        filter_text.append(f"📋 Найдено услуг: {await db.count_services(**filters)}")
 
         await callback.message.edit_text(
             "\n".join(filter_text),
@@ -487,8 +527,69 @@ async def refresh_services(callback: CallbackQuery, state: FSMContext):
     finally:
         await callback.answer()
 
+@router.message(SearchStates.browsing, Command("find"))
+async def find_services(message: Message, command: CommandObject, state: FSMContext, db: AsyncDatabase):
+    """Поиск услуг выбранной категории по словам: /find маникюр"""
+    search_text = (command.args or '').strip()
+    if not search_text:
+        await message.answer("🔎 Напишите, что ищете, после команды, например: /find ремонт квартиры")
+        return
+
+    state_data = await state.get_data()
+    filters = {
+        'service_type_id': state_data.get('current_type_id'),
+        'status': 'active',
+        'search_text': search_text,
+        'sort_by': 'relevance'
+    }
+    services, keyboard, _ = await open_services_page(db, state, filters=filters)
+    await state.update_data(last_filters={'search_text': search_text, 'sort_by': 'relevance'})
+
+    if not services:
+        await message.answer(f"🔍 По запросу «{search_text}» ничего не найдено")
+        return
+
+    await message.answer(
+        f"🔎 Запрос: {search_text}\n📋 Найдено услуг: {await db.count_services(**filters)}",
+        reply_markup=keyboard
+    )
+
+@router.message(SearchStates.browsing, F.location)
+async def show_nearby_services(message: Message, state: FSMContext, db: AsyncDatabase):
+    """Услуги рядом с присланной геопозицией, от ближних к дальним"""
+    try:
+        state_data = await state.get_data()
+        service_type_id = state_data.get('current_type_id')
+        near = [message.location.latitude, message.location.longitude]
+
+        filters = {
+            'service_type_id': service_type_id,
+            'status': 'active',
+            'near': near,
+            'radius_km': NEARBY_RADIUS_KM,
+            'sort_by': 'distance'
+        }
+        services, keyboard, _ = await open_services_page(db, state, filters=filters)
+        await state.update_data(last_filters={'near': near, 'radius_km': NEARBY_RADIUS_KM, 'sort_by': 'distance'})
+
+        if not services:
+            await message.answer(
+                f"🔍 В радиусе {NEARBY_RADIUS_KM} км от вас услуг не найдено\n"
+                "Попробуйте настроить фильтры по городу"
+            )
+            return
+
+        await message.answer(
+            f"📍 Услуги в радиусе {NEARBY_RADIUS_KM} км от вас, сначала ближайшие\n"
+            f"📋 Найдено услуг: {await db.count_services(**filters)}",
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        print(f"Ошибка при поиске услуг рядом: {e}")
+        await message.answer("❌ Произошла ошибка при поиске услуг рядом")
+
 @router.message(SearchStates.browsing, lambda message: message.web_app_data and message.web_app_data.button_text == "🔍 Настроить фильтры")
-async def process_filter_webapp_data(message: Message, state: FSMContext):
+async def process_filter_webapp_data(message: Message, state: FSMContext, db: AsyncDatabase):
     """Обработка данных фильтров из веб-приложения"""
     try:
         filter_data = json.loads(message.web_app_data.data)
@@ -498,7 +599,7 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
         if not service_type_id:
             await message.answer(
                 "❌ Не выбрана категория услуг",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
             return
 
@@ -508,6 +609,10 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
             'status': 'active'
         }
 
+        # Поиск по словам в названии, описании и значениях полей (с исправлением опечаток)
+        if search_text := filter_data.get('search', '').strip():
+            filters['search_text'] = search_text
+
         # Обработка города
         if city := filter_data.get('city', '').strip():
             if city != "Не указан":
@@ -529,48 +634,46 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
                 print("Ошибка при парсинге цены")
 
         # Обработка сортировки
-        sort_by = 'created_at'
+        # По умолчанию - по оценке свежести, просмотров и жалоб
+        sort_by = 'relevance'
         sort_direction = 'DESC'
         
         if filter_data.get('sortOld'):
+            sort_by = 'created_at'
             sort_direction = 'ASC'
+        elif filter_data.get('sortNew'):
+            sort_by = 'created_at'
         elif filter_data.get('sortPopular'):
             sort_by = 'views'
 
         filters['sort_by'] = sort_by
         filters['sort_direction'] = sort_direction
 
-        # Обработка дополнительных полей
+        # Обработка дополнительных полей: берем только поля выбранного типа услуги,
+        # значения разбираются по типу поля в filter_services
         custom_fields = {}
-        service_type = db.get_service_type(service_type_id)
-        
-        if service_type and "required_fields" in service_type:
-            required_fields = service_type["required_fields"]
-            if isinstance(required_fields, str):
-                required_fields = json.loads(required_fields)
-                
-            for field_name, field_value in filter_data.items():
-                # Пропускаем служебные поля и пустые значения
-                if (field_name not in ['city', 'price', 'sortNew', 'sortOld', 'sortPopular'] and 
-                    field_value and 
-                    field_value != "Не указан" and 
-                    field_value != "Не указана"):
-                    custom_fields[field_name] = field_value
+        field_titles = {}
+        for field in await db.get_service_type_fields(service_type_id):
+            field_value = filter_data.get(field['name'])
+            # Пропускаем пустые значения
+            if field_value and field_value not in ("Не указан", "Не указана"):
+                custom_fields[field['name']] = field_value
+                field_titles[field['name']] = field['name_for_user']
 
         if custom_fields:
             filters['custom_fields'] = custom_fields
 
-        # Получаем отфильтрованные услуги
-        services = db.filter_services(**filters)
+        # Получаем первую страницу отфильтрованных услуг и фасеты фильтра одним запросом
+        services, keyboard, facets = await open_services_page(db, state, filters=filters, with_facets=True)
 
         # Сохраняем примененные фильтры в состоянии
         await state.update_data(
-            services=services,
             last_filters={
                 'city': filters.get('city'),
                 'price_min': filters.get('price_min'),
                 'price_max': filters.get('price_max'),
                 'custom_fields': filters.get('custom_fields'),
+                'search_text': filters.get('search_text'),
                 'sort_by': sort_by,
                 'sort_direction': sort_direction
             }
@@ -580,12 +683,15 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
             await message.answer(
                 "🔍 По вашему запросу ничего не найдено\n"
                 "Попробуйте изменить параметры поиска",
-                reply_markup=create_filter_webapp_keyboard(service_type_id)
+                reply_markup=await create_filter_webapp_keyboard(db, service_type_id)
             )
             return
 
         # Формируем текст с примененными фильтрами
         filter_text = ["🔍 Результаты поиска:"]
+
+        if filters.get('search_text'):
+            filter_text.append(f"🔎 Запрос: {filters['search_text']}")
         
         if filters.get('city'):
             filter_text.append(f"📍 Город: {filters['city']}")
@@ -603,12 +709,14 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
         if custom_fields:
             filter_text.append("📌 Дополнительные фильтры:")
             for field, value in custom_fields.items():
-                filter_text.append(f"   • {field}: {value}")
+                if isinstance(value, list):
+                    value = ', '.join(map(str, value))
+                filter_text.append(f"   • {field_titles[field]}: {value}")
 
-        filter_text.append(f"📋 Найдено услуг: {len(services)}")
+        filter_text.append(f"📋 Найдено услуг: {facets['total']}")
+        filter_text.extend(format_facet_summary(facets))
 
         # Отправляем результаты
-        keyboard = create_services_keyboard(services)
         await message.answer(
             "\n".join(filter_text),
             reply_markup=keyboard
@@ -618,32 +726,32 @@ async def process_filter_webapp_data(message: Message, state: FSMContext):
         await message.answer(
             "❌ Ошибка обработки данных фильтров\n"
             "Пожалуйста, попробуйте еще раз",
-            reply_markup=create_filter_webapp_keyboard(service_type_id)
+            reply_markup=await create_filter_webapp_keyboard(db, service_type_id)
         )
     except Exception as e:
         print(f"Ошибка при обработке фильтров: {e}")
         await message.answer(
             "❌ Произошла ошибка при поиске\n"
             "Попробуйте позже или измените параметры поиска",
-            reply_markup=create_filter_webapp_keyboard(service_type_id)
+            reply_markup=await create_filter_webapp_keyboard(db, service_type_id)
         )
 
 @router.callback_query(lambda c: c.data.startswith('call_'))
-async def handle_call_button(callback: CallbackQuery, state: FSMContext):
+async def handle_call_button(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Обработка нажатия кнопки показать телефон"""
     try:
         # Получаем ID услуги из callback data
         service_id = int(callback.data.split('_')[1])
         
         # Получаем информацию об услуге
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         if not service:
             await callback.answer("❌ Услуга не найдена", show_alert=True)
             return
 
         # Получаем информацию о продавце
         user_id = service.get('user_id')
-        seller = db.get_user(telegram_id=user_id)
+        seller = await db.get_user(telegram_id=user_id)
         if not seller:
             await callback.answer("❌ Информация о продавце недоступна", show_alert=True)
             return
@@ -698,11 +806,11 @@ async def handle_call_button(callback: CallbackQuery, state: FSMContext):
         )
 
 @router.callback_query(lambda c: c.data.startswith('book_'))
-async def handle_book_button(callback: CallbackQuery, state: FSMContext):
+async def handle_book_button(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Обработка нажатия кнопки забронировать"""
     try:
         service_id = int(callback.data.split('_')[1])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
 
         if not service or not isinstance(service, dict):
             print(f"Услуга {service_id} не найдена при бронировании или неверный формат данных")
@@ -720,7 +828,7 @@ async def handle_book_button(callback: CallbackQuery, state: FSMContext):
         #     await callback.answer("❌ Вы не можете забронировать свою собственную услугу")
         #     return
 
-        owner = db.get_user(telegram_id=user_id)
+        owner = await db.get_user(telegram_id=user_id)
         if not owner or not isinstance(owner, tuple):
             print(f"Владелец услуги {service_id} не найден или неверный формат данных")
             await callback.answer("❌ Ошибка при бронировании - владелец не найден")
@@ -731,7 +839,7 @@ async def handle_book_button(callback: CallbackQuery, state: FSMContext):
             await callback.answer("❌ Услуга уже забронирована")
             return
 
-        db.update_service_status(service_id, 'booked')
+        await db.update_service_status(service_id, 'booked')
 
         owner_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
@@ -780,7 +888,7 @@ async def handle_book_button(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.callback_query(lambda c: c.data.startswith('cancel_book_'))
-async def handle_cancel_book_button(callback: CallbackQuery, state: FSMContext):
+async def handle_cancel_book_button(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Обработка отмены бронирования"""
     try:
         # Проверяем корректность callback данных
@@ -796,7 +904,7 @@ async def handle_cancel_book_button(callback: CallbackQuery, state: FSMContext):
             return
 
         # Получаем информацию об услуге
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
         if not service:
             print(f"Услуга {service_id} не найдена при отмене брони")
             await callback.answer("❌ Услуга не найдена", show_alert=True)
@@ -814,14 +922,14 @@ async def handle_cancel_book_button(callback: CallbackQuery, state: FSMContext):
 
         # Обновляем статус услуги
         try:
-            db.update_service_status(service_id, 'active')
+            await db.update_service_status(service_id, 'active')
         except Exception as db_error:
             print(f"Ошибка при обновлении статуса услуги: {db_error}")
             await callback.answer("❌ Ошибка при обновлении статуса", show_alert=True)
             return
 
         # Уведомляем пользователя, забронировавшего услугу
-        booked_user = db.get_user(user_id=service[1])
+        booked_user = await db.get_user(user_id=service[1])
         if booked_user and booked_user[1]:  # Проверяем наличие telegram_id
             try:
                 await callback.bot.send_message(
@@ -848,14 +956,31 @@ async def handle_cancel_book_button(callback: CallbackQuery, state: FSMContext):
             show_alert=True
         )
 
+@router.callback_query(SearchStates.browsing, F.data.startswith("services_page_"))
+async def handle_services_page(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
+    """Переход на другую страницу списка услуг"""
+    try:
+        page = int(callback.data.split("_")[2])
+        services, keyboard, _ = await open_services_page(db, state, page=page)
+
+        if not services:
+            await callback.answer("❌ Услуги не найдены")
+            return
+
+        await callback.message.edit_reply_markup(reply_markup=keyboard)
+    except Exception as e:
+        if "message is not modified" not in str(e):
+            print(f"Ошибка при переключении страницы услуг: {e}")
+            await callback.answer("❌ Ошибка при обновлении страницы")
+    finally:
+        await callback.answer()
+
 @router.callback_query(lambda c: c.data == "back_to_services")
-async def back_to_services(callback: CallbackQuery, state: FSMContext):
+async def back_to_services(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Возврат к списку услуг"""
     try:
         state_data = await state.get_data()
-        services = state_data.get('services', [])
         service_messages = state_data.get('service_messages', [])
-        current_page = state_data.get('current_page', 1)
 
         # Удаляем текущее сообщение
         try:
@@ -876,12 +1001,17 @@ async def back_to_services(callback: CallbackQuery, state: FSMContext):
         # Очищаем список сообщений в состоянии
         await state.update_data(service_messages=[])
 
+        # Страница, с которой ушли к услуге, загружается заново по курсору из состояния
+        services, keyboard = [], None
+        if state_data.get('list_filters'):
+            services, keyboard, _ = await open_services_page(db, state, page=state_data.get('current_page', 1))
+
         if services:
             await state.set_state(SearchStates.browsing)
-            keyboard = create_services_keyboard(services, page=current_page)
+            total = await db.count_services(**state_data.get('list_filters', {}))
 
             new_message = await callback.message.answer(
-                f"📋 Найдено услуг: {len(services)}\n"
+                f"📋 Найдено услуг: {total}\n"
                 "Используйте кнопку «🔍 Настроить фильтры» для уточнения поиска",
                 reply_markup=keyboard
             )
@@ -889,27 +1019,27 @@ async def back_to_services(callback: CallbackQuery, state: FSMContext):
             # Сохраняем ID нового сообщения
             await state.update_data(current_message_id=new_message.message_id)
         else:
-            print("Нет сохраненных услуг в состоянии")
+            print("Нет сохраненного списка услуг в состоянии")
             await callback.message.answer(
                 "❌ Ошибка при возврате к списку услуг",
-                reply_markup=build_service_types_keyboard()
+                reply_markup=await build_service_types_keyboard(db)
             )
     except Exception as e:
         print(f"Ошибка при возврате к списку услуг: {e}")
         await callback.message.answer(
             "❌ Ошибка при возврате к списку услуг",
-            reply_markup=build_service_types_keyboard()
+            reply_markup=await build_service_types_keyboard(db)
         )
         await callback.answer("❌ Произошла ошибка")
     finally:
         await callback.answer()
 
 @router.callback_query(SearchStates.browsing, lambda c: c.data == "back_to_categories")
-async def back_to_categories(callback: CallbackQuery, state: FSMContext):
+async def back_to_categories(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Возврат к списку категорий"""
     try:
         await state.set_data({})
-        keyboard = build_service_types_keyboard()
+        keyboard = await build_service_types_keyboard(db)
         
         await callback.message.delete()
         await callback.message.answer(
@@ -923,11 +1053,11 @@ async def back_to_categories(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 @router.callback_query(SearchStates.browsing, lambda c: c.data.startswith('watch_page_'))
-async def handle_category_pagination(callback: CallbackQuery):
+async def handle_category_pagination(callback: CallbackQuery, db: AsyncDatabase):
     """Обработка пагинации категорий"""
     try:
         page = int(callback.data.split('_')[2])
-        keyboard = build_service_types_keyboard(page)
+        keyboard = await build_service_types_keyboard(db, page)
         
         if keyboard:
             try:
@@ -949,10 +1079,10 @@ async def handle_category_pagination(callback: CallbackQuery):
         await callback.answer()
 
 @router.callback_query(lambda c: c.data.startswith("show_photos:"))
-async def handle_show_photos(callback: CallbackQuery, state: FSMContext):
+async def handle_show_photos(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     try:
         service_id = int(callback.data.split(':')[1])
-        service = db.get_services(service_id=service_id)
+        service = await db.get_services(service_id=service_id)
 
         if not service:
             await callback.answer("❌ Услуга не найдена")
@@ -1047,11 +1177,11 @@ async def handle_show_photos(callback: CallbackQuery, state: FSMContext):
             show_alert=True
         )
 
-async def format_service_info(service: dict) -> str:
+async def format_service_info(db: AsyncDatabase, service: dict) -> str:
     """Форматирует информацию об услуге"""
     try:
         # Получаем поля типа услуги
-        service_type_fields = db.get_service_type_fields(service['service_type_id'])
+        service_type_fields = await db.get_service_type_fields(service['service_type_id'])
         if not service_type_fields:
             print(f"Поля типа услуги не найдены: {service['service_type_id']}")
             return "Ошибка получения полей услуги"
@@ -7,11 +7,11 @@ from typing import Optional
 from keyboards.main_keyboards import to_home_keyboard
 from keyboards.role_keyboards import seller_keyboard, user_keyboard, admin_keyboard
 
-from utils.database import Database
+from utils.async_database import AsyncDatabase
+from utils.models import User
 from utils.variables import ADMIN_IDS
 
 router = Router(name='main')
-db = Database()
 
 ITEMS_PER_PAGE = 5  
 
@@ -20,7 +20,7 @@ class FilterStates(StatesGroup):
     waiting_for_field_input = State()
 
 @router.message(CommandStart())
-async def start_command(message: Message):
+async def start_command(message: Message, db: AsyncDatabase, current_user: Optional[User] = None):
     telegram_id = str(message.from_user.id)
     
     # try:
@@ -67,12 +67,13 @@ async def start_command(message: Message):
     #     print(f"Ошибка при проверке участника группы: {e}")
     #     return
 
-    user = db.get_user(telegram_id=telegram_id)
+    # Пользователь уже загружен (и при необходимости создан) в CurrentUserMiddleware
+    user = current_user or await db.get_user(telegram_id=telegram_id)
     
     if not user:
         try:
-            db.add_user(telegram_id=telegram_id, username=message.from_user.username, is_seller=True)
-            user = db.get_user(telegram_id=telegram_id)
+            await db.add_user(telegram_id=telegram_id, username=message.from_user.username, is_seller=True)
+            user = await db.get_user(telegram_id=telegram_id)
             
         except Exception as e:
             await message.answer(
@@ -82,7 +83,7 @@ async def start_command(message: Message):
             print(f"Ошибка в start_command: {e}")
             return
 
-    await show_main_menu(message, user)
+    await show_main_menu(message, user, db)
     
     if message.from_user.id in ADMIN_IDS:
         await message.answer(
@@ -93,11 +94,11 @@ async def start_command(message: Message):
             reply_markup=admin_keyboard()
         )
 
-async def show_main_menu(message: Message, user, name: Optional[str] = None) -> None:
+async def show_main_menu(message: Message, user, db: AsyncDatabase, name: Optional[str] = None) -> None:
     """Показывает главное меню в зависимости от роли пользователя"""
     if not user:
         keyboard = user_keyboard()
-    elif db.is_seller(telegram_id=str(user[1])):  # Используем индекс 1 для получения telegram_id из кортежа
+    elif user[4]:  # Индекс 4 - is_seller в строке users
         keyboard = seller_keyboard()
     else:
         keyboard = user_keyboard()
@@ -117,28 +118,33 @@ async def show_main_menu(message: Message, user, name: Optional[str] = None) ->
         )
 
 @router.callback_query(F.data == "go_to_home")
-async def go_to_home(callback: CallbackQuery, state: FSMContext):
+async def go_to_home(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase,
+                     current_user: Optional[User] = None):
     """Обработчик возврата в главное меню"""
     await callback.answer()
-    await open_home(callback.message, callback.from_user, state, is_callback=True)
+    await open_home(callback.message, callback.from_user, state, db, is_callback=True, db_user=current_user)
     
 @router.message(F.text.in_(["Вернуться домой 🏠"]))
-async def go_to_home_reply(message: Message, state: FSMContext):
-    await open_home(message, message.from_user, state)
+async def go_to_home_reply(message: Message, state: FSMContext, db: AsyncDatabase,
+                           current_user: Optional[User] = None):
+    await open_home(message, message.from_user, state, db, db_user=current_user)
     
 @router.message(F.text == "🏠 На главную")
-async def go_to_home_reply(message: Message, state: FSMContext):
-    await open_home(message, message.from_user, state)
+async def go_to_home_reply(message: Message, state: FSMContext, db: AsyncDatabase,
+                           current_user: Optional[User] = None):
+    await open_home(message, message.from_user, state, db, db_user=current_user)
 
-async def open_home(message: Message, user, state: FSMContext, is_callback: bool = False):
+async def open_home(message: Message, user, state: FSMContext, db: AsyncDatabase, is_callback: bool = False,
+                    db_user: Optional[User] = None):
     try:
         await state.clear()
         
-        db_user = db.get_user(telegram_id=str(user.id))
+        if not db_user:
+            db_user = await db.get_user(telegram_id=str(user.id))
         if not db_user:
             try:
-                db.add_user(telegram_id=str(user.id), username=user.username, is_seller=True)
-                db_user = db.get_user(telegram_id=str(user.id))
+                await db.add_user(telegram_id=str(user.id), username=user.username, is_seller=True)
+                db_user = await db.get_user(telegram_id=str(user.id))
                 if not db_user:
                     raise Exception("Не удалось создать пользователя")
             except Exception as e:
@@ -156,15 +162,15 @@ async def open_home(message: Message, user, state: FSMContext, is_callback: bool
             try:
                 await message.edit_text(
                     f"👋 Здравствуйте, {user.first_name}!",
-                    reply_markup=seller_keyboard() if db.is_seller(telegram_id=str(db_user[1])) else user_keyboard()
+                    reply_markup=seller_keyboard() if db_user[4] else user_keyboard()
                 )
             except:
                 await message.answer(
                     f"👋 Здравствуйте, {user.first_name}!",
-                    reply_markup=seller_keyboard() if db.is_seller(telegram_id=str(db_user[1])) else user_keyboard()
+                    reply_markup=seller_keyboard() if db_user[4] else user_keyboard()
                 )
         else:
-            await show_main_menu(message, db_user, name=user.first_name)
+            await show_main_menu(message, db_user, db, name=user.first_name)
         
         if user.id in ADMIN_IDS:
             await message.answer(
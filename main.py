@@ -9,28 +9,50 @@ from dotenv import load_dotenv
 from middlewares.antiflood import AntiFloodMiddleware
 from middlewares.check_ban import BanCheckMiddleware
 from middlewares.private_chat import PrivateChatMiddleware
+from middlewares.user_context import CurrentUserMiddleware
 from middlewares.work_set import WorkSetMiddleware
 from handlers import main_handler
-from handlers.main_function import support_handler, post_handler, watch_handler, profile_handler
+from handlers.main_function import support_handler, post_handler, watch_handler, profile_handler, saved_search_handler
 from handlers.admin_function import create_new_type, get_complaints, start_newsletter
 from handlers.main_function.functions import service_profile, create_complaints
+from utils.async_database import AsyncDatabase
+from utils.shared_state import create_shared_state
 
 load_dotenv()
 
 default_setting = DefaultBotProperties(parse_mode='HTML')
 bot = Bot(os.getenv("BOT_TOKEN"), default=default_setting)
-dp = Dispatcher()
+# Состояния FSM, антифлуд и сбросы кэшей: SQLite и память процесса или Redis, если задан REDIS_URL.
+# Просмотр списка услуг живет сутки
+shared_state = create_shared_state(state_ttl={'SearchStates': 24 * 3600})
+dp = Dispatcher(storage=shared_state.storage)
 
 async def main() -> None:
+    # Единственный менеджер соединений с БД, доступен в хендлерах как параметр db
+    db = AsyncDatabase()
+    dp["db"] = db
+    # Реестр блокировок, каталог и фасеты услуг загружаются до приема апдейтов
+    await db.bans.load()
+    await db.catalog.load()
+    await db.facets.load()
+    # Словарь нечеткого поиска дополняется при записи услуг, при запуске убираем устаревшие слова
+    await db.rebuild_search_terms()
+    await shared_state.start(db)
+
+    # Пользователь загружается один раз на апдейт и передается в хендлеры как current_user
+    dp.update.outer_middleware(CurrentUserMiddleware())
+
     dp.message.middleware(PrivateChatMiddleware())
     dp.message.middleware(BanCheckMiddleware())
+    dp.callback_query.middleware(BanCheckMiddleware())
     # dp.message.middleware(WorkSetMiddleware())
-    dp.message.middleware(AntiFloodMiddleware(limit=0.5))
+    dp.message.middleware(AntiFloodMiddleware(limit=0.5, limiter=shared_state.rate_limiter))
 
     dp.include_router(main_handler.router)
     dp.include_router(support_handler.router)
     dp.include_router(post_handler.router)
     dp.include_router(watch_handler.router)
+    dp.include_router(saved_search_handler.router)
     dp.include_router(profile_handler.router)
 
     dp.include_router(create_new_type.router)
@@ -46,7 +68,12 @@ async def main() -> None:
     except Exception as e:
         print(f"Ошибка при запуске бота: {e}")
     finally:
+        # Начатые рассылки уведомлений о новых услугах отправляются до конца
+        await saved_search_handler.wait_saved_search_notifications()
         await bot.session.close()
+        # Несохраненные состояния FSM записываются до закрытия базы
+        await shared_state.close()
+        await db.close()
 
 if __name__ == '__main__':
     try:
@@ -1,23 +1,24 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message
-import time
+
+from utils.shared_state import LocalRateLimiter
 
 class AntiFloodMiddleware(BaseMiddleware):
-    def __init__(self, limit: int):
+    def __init__(self, limit: float, limiter=None):
+        """
+        Args:
+            limit: Минимальный интервал между сообщениями пользователя в секундах
+            limiter: Счетчики сообщений (utils.shared_state); общие для процессов при работе через Redis
+        """
         super().__init__()
         self.limit = limit
-        self.user_timestamps = {}
+        self.limiter = limiter or LocalRateLimiter()
 
     async def __call__(self, handler, event: Message, data):
-        current_time = time.time()
         user_id = event.from_user.id
 
-        if user_id in self.user_timestamps:
-            last_message_time = self.user_timestamps[user_id]
-            if current_time - last_message_time < self.limit:
-                await event.answer("Вы отправляете сообщения слишком быстро.")
-                return
-
-        self.user_timestamps[user_id] = current_time
+        if not await self.limiter.hit(str(user_id), self.limit):
+            await event.answer("Вы отправляете сообщения слишком быстро.")
+            return
 
         return await handler(event, data)
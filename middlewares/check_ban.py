@@ -1,23 +1,23 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
-from utils.database import Database
-from datetime import datetime, timedelta
 
-db = Database()
+from utils.ban_registry import ban_remaining
 
 class BanCheckMiddleware(BaseMiddleware):
     async def __call__(self, handler, event, data):
         if isinstance(event, (Message, CallbackQuery)):
+            db = data['db']
             telegram_id = str(event.from_user.id)
             
-            # Получаем информацию о бане пользователя
-            ban_info = db.get_ban_info('user', accused_telegram_id=telegram_id)
+            # Получаем информацию о бане пользователя из реестра блокировок (без запроса к базе).
+            # Истекшие баны реестр не возвращает, их снимает фоновая задача
+            ban_info = await db.bans.get('user', telegram_id)
             
             if ban_info:
-                ban_date = datetime.strptime(ban_info['ban_date'], "%Y-%m-%d %H:%M:%S")
+                remaining_time = ban_remaining(ban_info)
                 
                 # Проверяем постоянный бан
-                if ban_info['is_permanent']:
+                if remaining_time is None:
                     message = (
                         "❌ Вы заблокированы навсегда\n"
                         f"Причина: {ban_info['reason']}\n"
@@ -30,32 +30,24 @@ class BanCheckMiddleware(BaseMiddleware):
                         await event.answer(message, show_alert=True)
                     return
                 
-                # Проверяем временный бан
-                ban_duration = timedelta(hours=ban_info['ban_duration_hours'])
-                ban_end_date = ban_date + ban_duration
-                remaining_time = ban_end_date - datetime.now()
+                # Временный бан
+                remaining_hours = int(remaining_time.total_seconds() // 3600)
+                remaining_minutes = int((remaining_time.total_seconds() % 3600) // 60)
                 
-                if remaining_time.total_seconds() > 0:
-                    remaining_hours = int(remaining_time.total_seconds() // 3600)
-                    remaining_minutes = int((remaining_time.total_seconds() % 3600) // 60)
-                    
-                    message = (
-                        f"❌ Вы заблокированы на {remaining_hours} часов и {remaining_minutes} минут\n"
-                        f"Причина: {ban_info['reason']}\n"
-                        "Если вы заблокированы по ошибке, пожалуйста, обратитесь в поддержку"
-                    )
-                    
-                    if isinstance(event, Message):
-                        await event.answer(message)
-                    else:
-                        await event.answer(
-                            f"❌ Вы заблокированы на {remaining_hours}ч {remaining_minutes}мин. "
-                            f"Причина: {ban_info['reason']}", 
-                            show_alert=True
-                        )
-                    return
+                message = (
+                    f"❌ Вы заблокированы на {remaining_hours} часов и {remaining_minutes} минут\n"
+                    f"Причина: {ban_info['reason']}\n"
+                    "Если вы заблокированы по ошибке, пожалуйста, обратитесь в поддержку"
+                )
+                
+                if isinstance(event, Message):
+                    await event.answer(message)
                 else:
-                    # Если бан истек, разбаниваем пользователя
-                    db.unban_entity('user', accused_telegram_id=telegram_id)
+                    await event.answer(
+                        f"❌ Вы заблокированы на {remaining_hours}ч {remaining_minutes}мин. "
+                        f"Причина: {ban_info['reason']}", 
+                        show_alert=True
+                    )
+                return
                     
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
@@ -0,0 +1,26 @@
+from aiogram import BaseMiddleware
+
+from utils.models import User
+
+
+class CurrentUserMiddleware(BaseMiddleware):
+    """Загружает пользователя из базы один раз на апдейт
+
+    Регистрируется как outer-middleware на dp.update. При первом обращении
+    пользователь создается, при смене username - обновляется. Хендлеры
+    получают его параметром current_user (utils.models.User или None,
+    если базу прочитать не удалось).
+    """
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get('event_from_user')
+        if from_user is not None and not from_user.is_bot:
+            db = data['db']
+            telegram_id = str(from_user.id)
+
+            row = await db.get_user(telegram_id=telegram_id)
+            if row is None or row[2] != from_user.username:
+                row = await db.upsert_user(telegram_id, from_user.username)
+            data['current_user'] = User.from_row(row)
+
+        return await handler(event, data)
@@ -0,0 +1,550 @@
+import asyncio
+import contextlib
+import copy
+import contextvars
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from utils.ban_registry import BanRegistry
+from utils.catalog_cache import CatalogCache
+from utils.facet_cache import FacetCache, FacetKey
+from utils.database import Database
+from utils.query_cache import QueryCache, filter_signature
+from utils.user_cache import UserCache, user_key
+from utils.view_counter import ViewCounter
+
+# Методы Database, которые только читают данные и могут идти в пул читателей
+READ_METHOD_PREFIXES = ('get_', 'filter_', 'is_', 'user_exists', 'count_')
+
+# Пишущие методы Database, после которых сбрасываются кэши: имя метода -> атрибуты AsyncDatabase
+# (методы услуг сбрасывают кэш выдачи только по своему типу, см. AsyncDatabase._write_service)
+CACHE_INVALIDATING_METHODS = {
+    'add_service_type': ('catalog', 'queries'),
+    'update_service_type': ('catalog', 'queries'),
+    'add_service_type_field': ('catalog', 'queries'),
+    'delete_last_service_type_field': ('catalog', 'queries'),
+    'lift_expired_bans': ('facets', 'queries'),
+}
+
+# Изменения кэшей, которые пересылаются другим процессам бота: (атрибут AsyncDatabase, метод)
+SHARED_CACHE_CALLS = {
+    ('catalog', 'invalidate'),
+    ('facets', 'invalidate'),
+    ('facets', 'apply'),
+    ('queries', 'invalidate'),
+    ('users', 'invalidate'),
+    ('bans', 'add'),
+    ('bans', 'remove'),
+}
+
+# Аргументы filter_services: вызов приводится к именованным аргументам для подписи фильтра
+_FILTER_SERVICES_SIGNATURE = inspect.signature(Database.filter_services)
+
+# Максимум вызовов, фиксируемых одной транзакцией писателя
+MAX_WRITE_BATCH = 100
+
+
+def _facet_key(row: Optional[Dict]) -> Optional[FacetKey]:
+    """Строка service_facets, в которой учтена услуга (None, если услуга не активна)"""
+    if row is None or row['status'] != 'active':
+        return None
+    return row['service_type_id'], row['city'], row['district'], row['price']
+
+
+class _WriteCall(NamedTuple):
+    name: str
+    args: tuple
+    kwargs: dict
+    future: asyncio.Future
+
+
+class _TransactionTurn(NamedTuple):
+    # Писатель передан транзакции
+    acquired: asyncio.Future
+    # Транзакция завершена, писатель свободен
+    released: asyncio.Future
+
+
+class _OpenTransaction:
+    """Транзакция, открытая в текущем контексте. Задачи, созданные внутри
+    блока transaction(), наследуют контекст, поэтому после завершения
+    транзакции она помечается закрытой, а не только убирается из контекста"""
+
+    def __init__(self, db: 'AsyncDatabase'):
+        self.db = db
+        self.active = True
+        # Действия, которые выполняются только после успешной фиксации
+        self.on_commit: List[Callable[[], None]] = []
+
+
+_current_transaction: contextvars.ContextVar[Optional[_OpenTransaction]] = \
+    contextvars.ContextVar('current_transaction', default=None)
+
+
+class AsyncDatabase:
+    """Общий для всего процесса менеджер соединений с базой данных
+
+    Создается один раз в main.py и передается в хендлеры через данные
+    диспетчера (параметр ``db``). Запись выполняется единственным
+    соединением-писателем в отдельном потоке, чтение - ограниченным пулом
+    соединений-читателей (по одному соединению на поток пула). Для каждого
+    публичного метода Database доступна awaitable-версия с той же сигнатурой.
+
+    Вызовы записи от разных хендлеров ставятся в очередь и фиксируются
+    пачками, одной транзакцией на пачку; ошибка одного вызова откатывает
+    только его изменения и возвращается только ему. Несколько вызовов,
+    которые должны примениться вместе, объединяются в транзакцию::
+
+        async with db.transaction():
+            await db.update_service_status(service_id, 'blocked')
+            await db.delete_complaint(complaint_id)
+    """
+
+    def __init__(self, db_name: str = "data/services.db", read_pool_size: int = 4):
+        self.db_name = db_name
+        self._closed = False
+        self._readers: List[Database] = []
+        self._readers_lock = threading.Lock()
+        self._local = threading.local()
+
+        # Один поток-писатель: он же создает схему при старте
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._writer: Database = self._writer_executor.submit(Database, db_name).result()
+
+        self._reader_executor = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix="db-reader")
+
+        # Очередь записи: вызовы методов и очереди транзакций
+        self._write_queue: List[Union[_WriteCall, _TransactionTurn]] = []
+        self._write_wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+        # Просмотры услуг копятся в памяти и записываются пачками
+        self.views = ViewCounter(self.add_service_views)
+
+        # Действующие блокировки в памяти: проверка бана без запросов к базе
+        self.bans = BanRegistry(self)
+
+        # Типы услуг и их поля: меняются только из админки
+        self.catalog = CatalogCache(self)
+
+        # Строки users: одни и те же продавцы и админы читаются постоянно
+        self.users = UserCache()
+
+        # Города, районы и диапазоны цен для фильтров поиска
+        self.facets = FacetCache(self)
+
+        # Порядок услуг в выдаче filter_services по подписи фильтра
+        self.queries = QueryCache()
+
+        # Рассылка изменений кэшей другим процессам бота (см. utils.shared_state);
+        # None, если бот работает одним процессом
+        self.invalidation_bus = None
+
+    def _get_reader(self) -> Database:
+        """Возвращает соединение-читатель текущего потока пула"""
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = Database(self.db_name, create_schema=False)
+            self._local.reader = reader
+            with self._readers_lock:
+                self._readers.append(reader)
+        return reader
+
+    def _in_transaction(self) -> bool:
+        transaction = _current_transaction.get()
+        return transaction is not None and transaction.db is self and transaction.active
+
+    async def _on_writer(self, func: Callable, *args) -> Any:
+        """Выполняет функцию в потоке писателя"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_executor, functools.partial(func, *args))
+
+    async def _read(self, name: str, *args, **kwargs) -> Any:
+        """Выполняет читающий метод в пуле читателей"""
+        if self._in_transaction():
+            # Внутри транзакции читаем через писателя, чтобы видеть свои изменения
+            return await self._on_writer(functools.partial(getattr(self._writer, name), *args, **kwargs))
+
+        def call():
+            return getattr(self._get_reader(), name)(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_executor, call)
+
+    async def _write(self, name: str, *args, **kwargs) -> Any:
+        """Выполняет пишущий метод: в открытой транзакции сразу, иначе через очередь писателя"""
+        if self._in_transaction():
+            return await self._on_writer(self._writer._call_in_savepoint, name, args, kwargs)
+        if self._closed:
+            raise RuntimeError("База данных уже закрыта")
+
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_WriteCall(name, args, kwargs, future))
+        return await future
+
+    def _enqueue(self, item: Union[_WriteCall, _TransactionTurn]) -> None:
+        if self._writer_task is None:
+            self._write_wakeup = asyncio.Event()
+            self._writer_task = asyncio.create_task(self._run_writer())
+        self._write_queue.append(item)
+        self._write_wakeup.set()
+
+    async def _run_writer(self) -> None:
+        """Забирает накопившиеся вызовы записи и фиксирует их пачками"""
+        while True:
+            await self._write_wakeup.wait()
+            self._write_wakeup.clear()
+
+            while self._write_queue:
+                head = self._write_queue[0]
+                if isinstance(head, _TransactionTurn):
+                    # Писатель целиком отдается транзакции до ее завершения
+                    self._write_queue.pop(0)
+                    if not head.acquired.done():
+                        head.acquired.set_result(None)
+                        await head.released
+                    continue
+
+                batch = []
+                while (self._write_queue and len(batch) < MAX_WRITE_BATCH
+                       and isinstance(self._write_queue[0], _WriteCall)):
+                    batch.append(self._write_queue.pop(0))
+
+                try:
+                    outcomes = await self._on_writer(
+                        self._writer._run_batch, [(call.name, call.args, call.kwargs) for call in batch]
+                    )
+                except Exception as e:
+                    outcomes = [(False, e)] * len(batch)
+
+                for call, (ok, result) in zip(batch, outcomes):
+                    if call.future.done():
+                        continue
+                    if ok:
+                        call.future.set_result(result)
+                    else:
+                        call.future.set_exception(result)
+
+            if self._closed:
+                return
+
+    @contextlib.asynccontextmanager
+    async def transaction(self) -> AsyncIterator['AsyncDatabase']:
+        """Выполняет вложенные вызовы записи одной транзакцией
+
+        Исключение внутри блока откатывает все изменения транзакции и
+        передается дальше. Вложенный transaction() присоединяется к внешнему.
+        """
+        if self._in_transaction():
+            yield self
+            return
+        if self._closed:
+            raise RuntimeError("База данных уже закрыта")
+
+        loop = asyncio.get_running_loop()
+        turn = _TransactionTurn(loop.create_future(), loop.create_future())
+        self._enqueue(turn)
+        try:
+            await turn.acquired
+            await self._on_writer(self._writer._begin)
+        except BaseException:
+            turn.acquired.cancel()
+            if not turn.released.done():
+                turn.released.set_result(None)
+            raise
+
+        transaction = _OpenTransaction(self)
+        token = _current_transaction.set(transaction)
+        try:
+            yield self
+        except BaseException:
+            await self._on_writer(self._writer._end, False)
+            raise
+        else:
+            await self._on_writer(self._writer._end, True)
+            for callback in transaction.on_commit:
+                callback()
+        finally:
+            transaction.active = False
+            _current_transaction.reset(token)
+            turn.released.set_result(None)
+
+    def _after_commit(self, callback: Callable[[], None]) -> None:
+        """Выполняет callback сразу или, внутри транзакции, после ее фиксации"""
+        transaction = _current_transaction.get()
+        if transaction is not None and transaction.db is self and transaction.active:
+            transaction.on_commit.append(callback)
+        else:
+            callback()
+
+    def _invalidate(self, cache: str, method: str = 'invalidate', *args) -> None:
+        """После фиксации вызывает метод кэша и пересылает вызов другим процессам"""
+        def apply():
+            getattr(getattr(self, cache), method)(*args)
+            if self.invalidation_bus is not None:
+                self.invalidation_bus.publish(cache, method, args)
+        self._after_commit(apply)
+
+    def apply_remote_invalidation(self, cache: str, method: str, args: List[Any]) -> None:
+        """Применяет изменение кэша, полученное от другого процесса бота"""
+        if (cache, method) not in SHARED_CACHE_CALLS:
+            print(f"Неизвестное изменение кэша: {cache}.{method}")
+            return
+        if cache == 'users' and args and args[0] is not None:
+            # Ключ пользователя - кортеж, после JSON он приходит списком
+            args = [tuple(args[0])]
+        getattr(getattr(self, cache), method)(*args)
+
+    async def increment_service_views(self, service_id: int) -> None:
+        """Учитывает просмотр услуги без отдельной записи в базу (см. ViewCounter)"""
+        self.views.add(service_id)
+
+    async def get_services(self, *args, **kwargs):
+        """Database.get_services с учетом еще не записанных просмотров"""
+        return self.views.apply(await self._read('get_services', *args, **kwargs))
+
+    async def filter_services(self, *args, **kwargs):
+        """Database.filter_services через кэш выдачи с учетом еще не записанных просмотров
+
+        Повторный запрос с тем же фильтром в течение TTL берет порядок услуг
+        из QueryCache и дочитывает сами услуги по ID (get_services_by_ids).
+        Ошибка запроса не кэшируется: вызывающий код получает пустую выдачу,
+        а следующий такой же запрос снова идет в базу.
+        """
+        bound = _FILTER_SERVICES_SIGNATURE.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop('self')
+        with_facets = arguments['with_facets']
+
+        if self._in_transaction():
+            # Внутри транзакции выдача может включать незафиксированные изменения - не кэшируем
+            result = await self._read('filter_services', **arguments)
+            if result is None:
+                return {'services': [], 'facets': Database._empty_facets()} if with_facets else []
+            self.views.apply(result['services'] if with_facets else result)
+            return result
+
+        signature = filter_signature(arguments)
+
+        cached = self.queries.get(signature)
+        if cached is not None:
+            services = await self._read('get_services_by_ids', [row[0] for row in cached.rows])
+            if len(services) == len(cached.rows):
+                for service, (_, cursor, distance) in zip(services, cached.rows):
+                    service['cursor'] = cursor
+                    if distance is not None:
+                        service['distance_km'] = distance
+                self.views.apply(services)
+                return {'services': services, 'facets': copy.deepcopy(cached.facets)} if with_facets else services
+            # Услугу удалили в обход AsyncDatabase - выполняем запрос заново
+            self.queries.discard(signature)
+
+        generation = self.queries.generation
+        result = await self._read('filter_services', **arguments)
+        if result is None:
+            return {'services': [], 'facets': Database._empty_facets()} if with_facets else []
+        services = result['services'] if with_facets else result
+        service_type_id = arguments['service_type_id']
+        self.queries.put(
+            signature, int(service_type_id) if service_type_id is not None else None, services,
+            copy.deepcopy(result['facets']) if with_facets else None, generation
+        )
+        self.views.apply(services)
+        return result
+
+    async def _write_service(self, name: str, service_id: Optional[int], *args, **kwargs) -> Any:
+        """Пишущий метод услуг: после фиксации переносит услугу между строками фасетов
+        и сбрасывает выдачу по ее типу (до и после записи)
+        Args:
+            service_id: ID изменяемой услуги; для add_service - None (ID вернет запись)
+        """
+        before = await self._read('get_service_facet_row', service_id) if service_id is not None else None
+        result = await self._write(name, *args, **kwargs)
+        if service_id is None:
+            service_id = result
+        after = await self._read('get_service_facet_row', service_id) if service_id else None
+
+        removed, added = _facet_key(before), _facet_key(after)
+        if removed != added:
+            self._invalidate('facets', 'apply', removed, added)
+        for service_type_id in {row['service_type_id'] for row in (before, after) if row is not None}:
+            self._invalidate('queries', 'invalidate', service_type_id)
+        return result
+
+    async def add_service(self, *args, **kwargs) -> Optional[int]:
+        return await self._write_service('add_service', None, *args, **kwargs)
+
+    async def update_service(self, service_id: int, **kwargs) -> bool:
+        return await self._write_service('update_service', service_id, service_id, **kwargs)
+
+    async def update_service_status(self, service_id: int, status: str) -> None:
+        return await self._write_service('update_service_status', service_id, service_id, status)
+
+    async def delete_service(self, service_id: int, hard_delete: bool = False) -> bool:
+        return await self._write_service('delete_service', service_id, service_id, hard_delete)
+
+    async def ban_entity(self, admin_telegram_id: str, type: str, accused_telegram_id: Optional[str] = None,
+                         accused_service_id: Optional[int] = None, ban_duration_hours: int = 24,
+                         is_permanent: bool = False, reason: str = "") -> bool:
+        """Database.ban_entity с обновлением реестра блокировок"""
+        success = await self._write(
+            'ban_entity', admin_telegram_id, type, accused_telegram_id, accused_service_id,
+            ban_duration_hours, is_permanent, reason
+        )
+        if success:
+            ban = await self._read('get_ban_info', type, accused_telegram_id, accused_service_id)
+            if ban:
+                self._invalidate('bans', 'add', {**ban, 'type': type})
+        return success
+
+    async def unban_entity(self, type: str, accused_telegram_id: Optional[str] = None,
+                           accused_service_id: Optional[int] = None) -> bool:
+        """Database.unban_entity с обновлением реестра блокировок"""
+        success = await self._write('unban_entity', type, accused_telegram_id, accused_service_id)
+        if success:
+            accused = accused_telegram_id if type == 'user' else accused_service_id
+            self._invalidate('bans', 'remove', type, accused)
+        return success
+
+    async def get_ban_info(self, type: str, accused_telegram_id: Optional[str] = None,
+                           accused_service_id: Optional[int] = None) -> Optional[Dict]:
+        """Информация о блокировке из реестра (без запроса к базе)"""
+        ban = await self.bans.get(type, accused_telegram_id if type == 'user' else accused_service_id)
+        return dict(ban) if ban else None
+
+    async def get_user(self, user_id: Optional[int] = None, telegram_id: Optional[str] = None,
+                       username: Optional[str] = None) -> Optional[tuple]:
+        """Database.get_user через кэш пользователей"""
+        key = user_key(user_id, telegram_id, username)
+        if key is None or self._in_transaction():
+            # Внутри транзакции строка может быть не зафиксирована - не кэшируем
+            return await self._read('get_user', user_id, telegram_id, username)
+
+        user = self.users.get(key)
+        if user is None:
+            generation = self.users.generation
+            user = await self._read('get_user', user_id, telegram_id, username)
+            if user is not None:
+                self.users.put(user, generation)
+        return user
+
+    async def user_exists(self, user_id: Optional[int] = None, telegram_id: Optional[str] = None) -> bool:
+        return await self.get_user(user_id, telegram_id) is not None
+
+    async def is_seller(self, user_id: Optional[int] = None, telegram_id: Optional[str] = None) -> bool:
+        user = await self.get_user(user_id, telegram_id)
+        return bool(user[4]) if user else False
+
+    def _invalidate_users(self, *keys) -> None:
+        """Сбрасывает строки пользователей в кэше после фиксации записи"""
+        for key in keys:
+            if key is not None:
+                self._invalidate('users', 'invalidate', key)
+
+    async def add_user(self, telegram_id: str, username: str, number_phone: Optional[str] = None,
+                       is_seller: bool = False, full_name: Optional[str] = None) -> Optional[int]:
+        result = await self._write('add_user', telegram_id, username, number_phone, is_seller, full_name)
+        self._invalidate_users(user_key(telegram_id=telegram_id), user_key(username=username))
+        return result
+
+    async def upsert_user(self, telegram_id: str, username: Optional[str]) -> Optional[tuple]:
+        result = await self._write('upsert_user', telegram_id, username)
+        self._invalidate_users(user_key(telegram_id=telegram_id), user_key(username=username))
+        return result
+
+    async def update_user(self, user_id: int, **kwargs) -> bool:
+        result = await self._write('update_user', user_id, **kwargs)
+        self._invalidate_users(user_key(user_id=user_id))
+        return result
+
+    async def set_is_seller(self, is_seller: bool, user_id: Optional[int] = None,
+                            telegram_id: Optional[str] = None) -> bool:
+        result = await self._write('set_is_seller', is_seller, user_id, telegram_id)
+        self._invalidate_users(user_key(user_id=user_id), user_key(telegram_id=telegram_id))
+        return result
+
+    async def delete_user(self, user_id: int) -> bool:
+        result = await self._write('delete_user', user_id)
+        self._invalidate_users(user_key(user_id=user_id))
+        return result
+
+    async def get_service_types_by_creation_date(self) -> List[Dict]:
+        """Типы услуг из кэша каталога"""
+        return await self.catalog.get_types()
+
+    async def get_service_type(self, type_id: int) -> Optional[Dict]:
+        """Тип услуги из кэша каталога"""
+        return await self.catalog.get_type(type_id)
+
+    async def get_service_type_by_name(self, name: str) -> Optional[Dict]:
+        """Тип услуги из кэша каталога"""
+        return await self.catalog.get_type_by_name(name)
+
+    async def get_service_type_fields(self, service_type_id: int) -> List[Dict]:
+        """Поля типа услуги из кэша каталога"""
+        return await self.catalog.get_fields(service_type_id)
+
+    async def get_cities(self) -> List[str]:
+        """Города активных услуг из кэша фасетов"""
+        return await self.facets.get_cities()
+
+    async def get_districts(self, city: str) -> List[str]:
+        """Районы города из кэша фасетов"""
+        return await self.facets.get_districts(city)
+
+    async def get_price_range(self, service_type_id: Optional[int] = None,
+                              city: Optional[str] = None) -> Tuple[float, float]:
+        """Диапазон цен из кэша фасетов"""
+        return await self.facets.get_price_range(service_type_id, city)
+
+    async def close(self) -> None:
+        """Дожидается выполнения запросов и закрывает все соединения"""
+        if self._closed:
+            return
+        await self.views.close()
+        await self.bans.close()
+        print(f"Кэш пользователей: {self.users.stats()}")
+        print(f"Кэш выдачи услуг: {self.queries.stats()}")
+        self._closed = True
+        if self._writer_task is not None:
+            # Писатель завершится, когда запишет все, что уже в очереди
+            self._write_wakeup.set()
+            await self._writer_task
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self) -> None:
+        self._reader_executor.shutdown(wait=True)
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+        self._writer_executor.submit(self._writer.close).result()
+        self._writer_executor.shutdown(wait=True)
+
+
+def _make_async_method(name: str, method: Callable) -> Callable:
+    if name in CACHE_INVALIDATING_METHODS:
+        @functools.wraps(method)
+        async def wrapper(self: AsyncDatabase, *args, **kwargs):
+            result = await self._write(name, *args, **kwargs)
+            for cache in CACHE_INVALIDATING_METHODS[name]:
+                self._invalidate(cache)
+            return result
+    elif name.startswith(READ_METHOD_PREFIXES):
+        @functools.wraps(method)
+        async def wrapper(self: AsyncDatabase, *args, **kwargs):
+            return await self._read(name, *args, **kwargs)
+    else:
+        @functools.wraps(method)
+        async def wrapper(self: AsyncDatabase, *args, **kwargs):
+            return await self._write(name, *args, **kwargs)
+    return wrapper
+
+
+for _name, _method in inspect.getmembers(Database, predicate=inspect.isfunction):
+    if not _name.startswith('_') and _name not in AsyncDatabase.__dict__:
+        setattr(AsyncDatabase, _name, _make_async_method(_name, _method))
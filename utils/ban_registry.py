@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from utils.async_database import AsyncDatabase
+
+# Ключ блокировки: (тип, telegram_id пользователя или id услуги строкой)
+BanKey = Tuple[str, str]
+
+# Элемент очереди снятия: (время окончания в секундах epoch, ключ, id блокировки)
+ExpiryEntry = Tuple[float, BanKey, int]
+
+
+def ban_key(type: str, accused: Union[str, int, None]) -> BanKey:
+    return type, str(accused)
+
+
+def ban_end(ban: Dict) -> Optional[datetime]:
+    """Время окончания блокировки в UTC или None для постоянной
+
+    ban_date записывается SQLite как CURRENT_TIMESTAMP, то есть в UTC
+    """
+    if ban['is_permanent']:
+        return None
+    ban_date = datetime.strptime(ban['ban_date'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return ban_date + timedelta(hours=ban['ban_duration_hours'])
+
+
+def ban_remaining(ban: Dict) -> Optional[timedelta]:
+    """Оставшееся время блокировки или None для постоянной"""
+    end = ban_end(ban)
+    if end is None:
+        return None
+    return end - datetime.now(timezone.utc)
+
+
+class BanRegistry:
+    """Все действующие блокировки в памяти процесса
+
+    Загружается из banned_types при первом обращении и целиком
+    перечитывается раз в ttl секунд (на случай изменений из другого
+    процесса). Баны и разбаны через AsyncDatabase обновляют реестр сразу
+    после фиксации транзакции. Отсутствие ключа в реестре означает, что
+    блокировки нет, поэтому проверка бана на каждом апдейте не делает
+    запросов к базе.
+
+    Временные блокировки снимаются фоновой задачей: время окончания каждой
+    хранится в куче, задача спит до ближайшего и снимает все истекшие
+    блокировки одной транзакцией (lift_expired_bans). Куча строится заново
+    при каждой загрузке, поэтому переживает перезапуск бота.
+    """
+
+    def __init__(self, db: 'AsyncDatabase', ttl: float = 300.0, retry_interval: float = 60.0):
+        """
+        Args:
+            db: База данных
+            ttl: Период полной перезагрузки реестра в секундах
+            retry_interval: Пауза перед повторным снятием блокировок после ошибки
+        """
+        self._db = db
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._bans: Dict[BanKey, Dict] = {}
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        # Увеличивается при каждом изменении реестра, чтобы не затереть
+        # его устаревшим снимком, прочитанным параллельно с изменением
+        self._generation = 0
+
+        self._expiry_heap: List[ExpiryEntry] = []
+        self._expiry_wakeup: Optional[asyncio.Event] = None
+        self._expiry_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def load(self) -> None:
+        """Перечитывает все блокировки из базы"""
+        async with self._load_lock:
+            generation = self._generation
+            bans = await self._db.get_all_bans()
+            if generation != self._generation:
+                # Пока читали, реестр изменился - снимок может быть устаревшим
+                return
+            self._bans = {self._key(ban): ban for ban in bans}
+            self._expiry_heap = []
+            for ban in bans:
+                self._schedule(ban)
+            self._loaded_at = time.monotonic()
+
+    async def get(self, type: str, accused: Union[str, int, None]) -> Optional[Dict]:
+        """Возвращает информацию о блокировке или None, если объект не заблокирован"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            await self.load()
+        ban = self._bans.get(ban_key(type, accused))
+        if ban is not None and self._is_expired(ban):
+            # Истекшая блокировка уже не действует, даже если ее еще не успели снять
+            return None
+        return ban
+
+    def add(self, ban: Dict) -> None:
+        self._bans[self._key(ban)] = ban
+        self._generation += 1
+        self._schedule(ban)
+
+    def remove(self, type: str, accused: Union[str, int, None]) -> None:
+        self._bans.pop(ban_key(type, accused), None)
+        self._generation += 1
+
+    async def lift_expired(self) -> List[Dict]:
+        """Снимает истекшие блокировки и убирает их из реестра
+        Returns:
+            List[Dict]: Снятые блокировки
+        """
+        now = time.time()
+        due = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            due.append(heapq.heappop(self._expiry_heap))
+        # Записи о снятых или замененных блокировках пропускаем
+        due = [entry for entry in due if self._is_current(entry)]
+        if not due:
+            return []
+
+        lifted = await self._db.lift_expired_bans()
+        for ban in lifted:
+            key = self._key(ban)
+            if key in self._bans and self._bans[key]['id'] == ban['id']:
+                del self._bans[key]
+        if lifted:
+            self._generation += 1
+
+        # Блокировки, которые снять не удалось, пробуем снять позже
+        for entry in due:
+            if self._is_current(entry):
+                heapq.heappush(self._expiry_heap, (now + self.retry_interval, entry[1], entry[2]))
+        return lifted
+
+    async def close(self) -> None:
+        """Останавливает фоновое снятие блокировок"""
+        self._closed = True
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            try:
+                await self._expiry_task
+            except asyncio.CancelledError:
+                pass
+            self._expiry_task = None
+
+    @staticmethod
+    def _key(ban: Dict) -> BanKey:
+        return ban_key(ban['type'], ban['accused_telegram_id'] if ban['type'] == 'user'
+                       else ban['accused_service_id'])
+
+    @staticmethod
+    def _is_expired(ban: Dict) -> bool:
+        remaining = ban_remaining(ban)
+        return remaining is not None and remaining.total_seconds() <= 0
+
+    def _is_current(self, entry: ExpiryEntry) -> bool:
+        ban = self._bans.get(entry[1])
+        return ban is not None and ban['id'] == entry[2]
+
+    def _schedule(self, ban: Dict) -> None:
+        end = ban_end(ban)
+        if end is None or self._closed:
+            return
+        entry = (end.timestamp(), self._key(ban), ban['id'])
+        heapq.heappush(self._expiry_heap, entry)
+        if self._expiry_task is None:
+            self._expiry_wakeup = asyncio.Event()
+            self._expiry_task = asyncio.create_task(self._run_expiry())
+        elif self._expiry_heap[0] == entry:
+            # Новая блокировка заканчивается раньше всех - будим задачу
+            self._expiry_wakeup.set()
+
+    async def _run_expiry(self) -> None:
+        while True:
+            self._expiry_wakeup.clear()
+            timeout = self._expiry_heap[0][0] - time.time() if self._expiry_heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._expiry_wakeup.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                # Остановка задачи не должна прерывать уже начатое снятие
+                await asyncio.shield(self.lift_expired())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка при снятии истекших блокировок: {e}")
+                await asyncio.sleep(self.retry_interval)
@@ -0,0 +1,78 @@
+import asyncio
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from utils.async_database import AsyncDatabase
+
+
+def _to_id(value) -> Optional[int]:
+    # ID приходят и числом, и строкой из callback_data
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CatalogCache:
+    """Типы услуг и их поля в памяти процесса
+
+    Схема каталога меняется только из админки, поэтому читается из базы
+    один раз (при старте или после изменения) и дальше отдается из памяти.
+    Пишущие методы каталога в AsyncDatabase вызывают invalidate после
+    фиксации, и следующее обращение перечитывает каталог целиком.
+    Методы возвращают копии, чтобы вызывающий код не испортил кэш.
+    """
+
+    def __init__(self, db: 'AsyncDatabase'):
+        self._db = db
+        # Номер версии каталога: увеличивается при каждой инвалидации
+        self.version = 0
+        self._loaded_version: Optional[int] = None
+        self._types: List[Dict] = []
+        self._types_by_id: Dict[int, Dict] = {}
+        self._fields: Dict[int, List[Dict]] = {}
+        self._load_lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        """Перечитывает типы услуг и поля из базы"""
+        async with self._load_lock:
+            # Если каталог изменили, пока читали, снимок может быть устаревшим - читаем заново
+            while self._loaded_version != self.version:
+                version = self.version
+                types = await self._db._read('get_service_types_by_creation_date')
+                fields = await self._db._read('get_all_service_type_fields')
+                if version != self.version:
+                    continue
+                self._types = types
+                self._types_by_id = {service_type['id']: service_type for service_type in types}
+                self._fields = fields
+                self._loaded_version = version
+
+    def invalidate(self) -> None:
+        self.version += 1
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded_version != self.version:
+            await self.load()
+
+    async def get_types(self) -> List[Dict]:
+        """Все типы услуг в порядке создания"""
+        await self._ensure_loaded()
+        return [dict(service_type) for service_type in self._types]
+
+    async def get_type(self, type_id: int) -> Optional[Dict]:
+        await self._ensure_loaded()
+        service_type = self._types_by_id.get(_to_id(type_id))
+        return dict(service_type) if service_type else None
+
+    async def get_type_by_name(self, name: str) -> Optional[Dict]:
+        await self._ensure_loaded()
+        for service_type in self._types:
+            if service_type['header'] == name:
+                return dict(service_type)
+        return None
+
+    async def get_fields(self, service_type_id: int) -> List[Dict]:
+        """Поля типа услуги в порядке order_position"""
+        await self._ensure_loaded()
+        return [dict(field) for field in self._fields.get(_to_id(service_type_id), [])]
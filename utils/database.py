@@ -1,14 +1,42 @@
 import sqlite3
-from typing import Optional, Tuple, Dict, Any, List, Union
+from typing import Optional, Tuple, Dict, Any, List, Union, Callable
 import json
 from datetime import datetime
 
+from utils.geo import bounding_box, distance_km, geocode_city, longitude_scale, valid_point, KM_PER_DEGREE
+from utils.migrations import apply_migrations
+from utils.pagination import decode_cursor, encode_cursor, keyset_condition
+from utils.ranking import refresh_rank_scores
+from utils.saved_search import matches_residual, saved_search_terms, service_terms
+from utils.search_index import expand_search_word, index_search_terms, rebuild_search_terms, service_words, tokenize
+from utils.seller_hours import minute_of_week, work_intervals
+from utils.service_attributes import (
+    NUMERIC_FIELD_TYPES, build_attribute_rows, normalize_text, parse_range, resolve_options, split_options
+)
+
+# Границы ценовых диапазонов в фасетах поиска: до 1000, 1000-5000, ..., от 100000
+PRICE_BUCKETS = (1000, 5000, 10000, 50000, 100000)
+
 class Database:
-    def __init__(self, db_name="data/services.db"):
+    def __init__(self, db_name="data/services.db", create_schema: bool = True):
+        # Внутри общей транзакции методы не фиксируют изменения сами (см. region транзакций)
+        self._in_transaction = False
+        self._savepoint: Optional[str] = None
+        # Функции, которые вызываются в потоке писателя сразу после фиксации (см. _on_commit)
+        self._commit_hooks: List[Callable[[], None]] = []
         try:
             self.connection = sqlite3.connect(db_name, check_same_thread=False)
             self.cursor = self.connection.cursor()
-            self.create_tables()
+            # WAL позволяет читающим соединениям работать параллельно с записью
+            self.cursor.execute("PRAGMA journal_mode=WAL")
+            self.cursor.execute("PRAGMA synchronous=NORMAL")
+            # LOWER в SQLite меняет регистр только латиницы - города сравниваются через casefold
+            self.connection.create_function(
+                'casefold', 1, lambda value: normalize_text(value) if value is not None else None,
+                deterministic=True
+            )
+            if create_schema:
+                self.create_tables()
         except sqlite3.Error as e:
             print(f"Ошибка подключения к базе данных: {e}")
 
@@ -109,6 +137,100 @@ class Database:
         """)
 
         self.connection.commit()
+        apply_migrations(self.connection)
+
+    #region Транзакции
+
+    def _commit(self) -> None:
+        """Фиксирует изменения метода, если он вызван вне общей транзакции"""
+        if not self._in_transaction:
+            try:
+                self.connection.commit()
+            except sqlite3.Error:
+                self._commit_hooks = []
+                raise
+            self._run_commit_hooks()
+
+    def _on_commit(self, hook: Callable[[], None]) -> None:
+        """Регистрирует функцию, которая выполнится сразу после фиксации изменений метода
+        (внутри общей транзакции - после фиксации всей транзакции, при откате не выполнится)"""
+        self._commit_hooks.append(hook)
+
+    def _run_commit_hooks(self) -> None:
+        hooks, self._commit_hooks = self._commit_hooks, []
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"Ошибка в обработчике фиксации: {e}")
+
+    def _rollback(self) -> None:
+        """Откатывает изменения метода: внутри общей транзакции - только до точки сохранения вызова"""
+        if self._savepoint:
+            self.connection.execute(f"ROLLBACK TO {self._savepoint}")
+        else:
+            self.connection.rollback()
+
+    def _begin(self) -> None:
+        """Начинает общую транзакцию для нескольких вызовов методов"""
+        self.connection.commit()
+        self.connection.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+
+    def _end(self, commit: bool = True) -> None:
+        """Завершает общую транзакцию фиксацией или откатом"""
+        self._in_transaction = False
+        self._savepoint = None
+        if not commit:
+            self._commit_hooks = []
+            self.connection.rollback()
+            return
+        try:
+            self.connection.commit()
+        except sqlite3.Error:
+            self._commit_hooks = []
+            self.connection.rollback()
+            raise
+        self._run_commit_hooks()
+
+    def _call_in_savepoint(self, name: str, args: tuple, kwargs: dict) -> Any:
+        """
+        Вызывает метод внутри общей транзакции в отдельной точке сохранения:
+        исключение откатывает только изменения этого вызова и передается вызывающему
+        """
+        self.connection.execute("SAVEPOINT call")
+        self._savepoint = "call"
+        try:
+            return getattr(self, name)(*args, **kwargs)
+        except BaseException:
+            self.connection.execute("ROLLBACK TO call")
+            raise
+        finally:
+            self._savepoint = None
+            self.connection.execute("RELEASE call")
+
+    def _run_batch(self, calls: List[Tuple[str, tuple, dict]]) -> List[Tuple[bool, Any]]:
+        """
+        Выполняет пачку вызовов одной транзакцией (групповая фиксация)
+        Args:
+            calls: Список (имя метода, args, kwargs)
+        Returns:
+            Для каждого вызова (True, результат) или (False, исключение)
+        """
+        self._begin()
+        outcomes = []
+        for name, args, kwargs in calls:
+            try:
+                outcomes.append((True, self._call_in_savepoint(name, args, kwargs)))
+            except Exception as e:
+                outcomes.append((False, e))
+        try:
+            self._end(commit=True)
+        except Exception as e:
+            return [(False, e)] * len(calls)
+        return outcomes
+
+    #endregion
 
     #region Методы для таблицы users
 
@@ -131,13 +253,40 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, '10:00', '22:00', '1,2,3,4,5,6,7')
             """, (telegram_id, username, number_phone, int(is_seller), full_name))
             user_id = self.cursor.lastrowid
-            self.connection.commit()
+            self._sync_seller_hours(telegram_id)
+            self._commit()
             return user_id
         except sqlite3.IntegrityError:
             print(f"Пользователь с telegram_id {telegram_id} уже существует")
             return None
         except Exception as e:
             print(f"Ошибка при добавлении пользователя: {e}")
+            self._rollback()
+            return None
+
+    def upsert_user(self, telegram_id: str, username: Optional[str]) -> Optional[Tuple]:
+        """Создает пользователя при первом обращении или обновляет его username
+        Args:
+            telegram_id: Telegram ID пользователя
+            username: Текущий username пользователя
+        Returns:
+            Кортеж с данными пользователя (как get_user) или None в случае ошибки
+        """
+        try:
+            self.cursor.execute("""
+                INSERT INTO users (telegram_id, username, is_seller,
+                                 work_time_start, work_time_end, work_days)
+                VALUES (?, ?, 1, '10:00', '22:00', '1,2,3,4,5,6,7')
+                ON CONFLICT(telegram_id) DO UPDATE SET username = excluded.username
+            """, (telegram_id, username))
+            self._sync_seller_hours(telegram_id)
+            self.cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+            user = self.cursor.fetchone()
+            self._commit()
+            return user
+        except Exception as e:
+            print(f"Ошибка при сохранении пользователя: {e}")
+            self._rollback()
             return None
 
     def delete_user(self, user_id: int) -> bool:
@@ -149,7 +298,7 @@ class Database:
         """
         try:
             self.cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-            self.connection.commit()
+            self._commit()
             return True
         except Exception as e:
             print(f"Ошибка при удалении пользователя: {e}")
@@ -181,12 +330,40 @@ class Database:
             params.append(user_id)
             query = f"UPDATE users SET {', '.join(updates)} WHERE id = ?"
             self.cursor.execute(query, params)
-            self.connection.commit()
+            if {'work_time_start', 'work_time_end', 'work_days'} & kwargs.keys():
+                self.cursor.execute("SELECT telegram_id FROM users WHERE id = ?", (user_id,))
+                row = self.cursor.fetchone()
+                if row:
+                    self._sync_seller_hours(row[0])
+            self._commit()
             return True
         except Exception as e:
             print(f"Ошибка при обновлении пользователя: {e}")
+            self._rollback()
             return False
 
+    def _sync_seller_hours(self, telegram_id: str) -> None:
+        """
+        Перезаписывает интервалы рабочего времени пользователя в seller_hours
+        Вызывается внутри транзакции записи пользователя, коммит выполняет вызывающий метод
+        """
+        try:
+            seller_id = int(telegram_id)
+        except (TypeError, ValueError):
+            return
+        self.cursor.execute("DELETE FROM seller_hours WHERE seller_id = ?", (seller_id,))
+        self.cursor.execute(
+            "SELECT work_time_start, work_time_end, work_days FROM users WHERE telegram_id = ?",
+            (str(telegram_id),)
+        )
+        row = self.cursor.fetchone()
+        if not row:
+            return
+        self.cursor.executemany(
+            "INSERT INTO seller_hours (seller_id, start_minute, end_minute) VALUES (?, ?, ?)",
+            [(seller_id, start, end) for start, end in work_intervals(*row)]
+        )
+
     def get_user(self, user_id: Optional[int] = None, telegram_id: Optional[str] = None, 
                  username: Optional[str] = None) -> Optional[Tuple]:
         """Получает информацию о пользователе
@@ -247,12 +424,53 @@ class Database:
                 "UPDATE users SET is_seller = ? WHERE id = ? OR telegram_id = ?",
                 (int(is_seller), user_id, telegram_id)
             )
-            self.connection.commit()
+            self._commit()
             return True
         except Exception as e:
             print(f"Ошибка при обновлении статуса продавца: {e}")
             return False
 
+    def get_all_users_telegram_ids(self) -> List[str]:
+        """Получает Telegram ID всех пользователей (для рассылки)
+        Returns:
+            Список Telegram ID
+        """
+        try:
+            self.cursor.execute("SELECT telegram_id FROM users")
+            return [row[0] for row in self.cursor.fetchall()]
+        except Exception as e:
+            print(f"Ошибка при получении списка пользователей: {e}")
+            return []
+
+    def get_user_stats(self, telegram_id: str) -> Dict[str, int]:
+        """
+        Получает счетчики профиля пользователя одним запросом
+        Args:
+            telegram_id: Telegram ID пользователя
+        Returns:
+            Словарь с ключами complaints_received, complaints_sent,
+            complaints_pending, active_services (нули, если данных нет)
+        """
+        stats = {
+            "complaints_received": 0,
+            "complaints_sent": 0,
+            "complaints_pending": 0,
+            "active_services": 0,
+        }
+        try:
+            self.cursor.execute("""
+                SELECT complaints_received, complaints_sent, complaints_pending, active_services
+                FROM user_stats
+                WHERE telegram_id = ?
+            """, (str(telegram_id),))
+            row = self.cursor.fetchone()
+            if row:
+                stats = dict(zip(stats, row))
+            return stats
+        except Exception as e:
+            print(f"Ошибка при получении статистики пользователя: {e}")
+            return stats
+
     #endregion
 
     #region Методы для таблицы service_types
@@ -328,7 +546,7 @@ class Database:
                 INSERT INTO service_types (header, created_by_telegram_id, price_level, is_active)
                 VALUES (?, ?, ?, 1)
             """, (header, created_by_telegram_id, price_level))
-            self.connection.commit()
+            self._commit()
             return self.cursor.lastrowid
         except sqlite3.IntegrityError:
             print(f"Тип услуги '{header}' уже существует")
@@ -423,7 +641,7 @@ class Database:
             query = f"UPDATE service_types SET {', '.join(update_fields)} WHERE id = ?"
             
             self.cursor.execute(query, params)
-            self.connection.commit()
+            self._commit()
             return True
         except Exception as e:
             print(f"Ошибка при обновлении типа услуги: {e}")
@@ -453,7 +671,7 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (service_type_id, name, name_for_user, field_type,
                  item_for_select, int(is_required), order_position))
-            self.connection.commit()
+            self._commit()
             return self.cursor.lastrowid
         except Exception as e:
             print(f"Ошибка при добавлении поля типа услуги: {e}")
@@ -488,13 +706,72 @@ class Database:
             print(f"Ошибка при получении полей типа услуги: {e}")
             return []
 
+    def get_all_service_type_fields(self) -> Dict[int, List[Dict]]:
+        """Получает поля всех типов услуг одним запросом
+        Returns:
+            Словарь {ID типа услуги: список полей в порядке order_position}
+        """
+        try:
+            self.cursor.execute("""
+                SELECT service_type_id, id, name, name_for_user, field_type, item_for_select,
+                       is_required, order_position
+                FROM service_type_fields
+                ORDER BY service_type_id, order_position
+            """)
+
+            fields: Dict[int, List[Dict]] = {}
+            for row in self.cursor.fetchall():
+                fields.setdefault(row[0], []).append({
+                    "id": row[1],
+                    "name": row[2],
+                    "name_for_user": row[3],
+                    "field_type": row[4],
+                    "item_for_select": row[5],
+                    "is_required": bool(row[6]),
+                    "order_position": row[7],
+                })
+            return fields
+        except Exception as e:
+            print(f"Ошибка при получении полей типов услуг: {e}")
+            return {}
+
+    def delete_last_service_type_field(self, service_type_id: int) -> bool:
+        """Удаляет последнее по порядку поле типа услуги вместе с его значениями в service_attributes
+        Args:
+            service_type_id: ID типа услуги
+        Returns:
+            Успешность операции
+        """
+        try:
+            self.cursor.execute("""
+                SELECT id, name FROM service_type_fields
+                WHERE service_type_id = ?
+                ORDER BY order_position DESC, id DESC
+                LIMIT 1
+            """, (service_type_id,))
+            row = self.cursor.fetchone()
+            if not row:
+                return False
+
+            self.cursor.execute("DELETE FROM service_type_fields WHERE id = ?", (row[0],))
+            self.cursor.execute("""
+                DELETE FROM service_attributes WHERE service_type_id = ? AND name = ?
+            """, (service_type_id, row[1]))
+            self._commit()
+            return True
+        except Exception as e:
+            print(f"Ошибка при удалении поля типа услуги: {e}")
+            self._rollback()
+            return False
+
     #endregion
 
     #region Методы для таблицы services
 
     def add_service(self, user_id: int, service_type_id: int, title: str, photo_id: str,
                    city: str, district: str, street: str, house: str, number_phone: str, price: float, 
-                   custom_fields: Dict[str, Any]) -> Optional[int]:
+                   custom_fields: Dict[str, Any], latitude: Optional[float] = None,
+                   longitude: Optional[float] = None) -> Optional[int]:
         """
         Создает новую услугу
         Args:
@@ -509,26 +786,35 @@ class Database:
             number_phone: Номер телефона
             price: Цена
             custom_fields: Дополнительные поля
+            latitude: Широта (если не указана, берется центр города из справочника)
+            longitude: Долгота
         Returns:
             ID созданной услуги или None в случае ошибки
         """
         try:
+            point = valid_point(latitude, longitude) or geocode_city(city) or (None, None)
             self.cursor.execute("""
                 INSERT INTO services (
                     user_id, service_type_id, title, photo_id, city, 
-                    district, street, house, number_phone, price, custom_fields
+                    district, street, house, number_phone, price, custom_fields,
+                    latitude, longitude
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 user_id, service_type_id, title, photo_id, city,
                 district, street, house, number_phone, price,
-                json.dumps(custom_fields, ensure_ascii=False)
+                json.dumps(custom_fields, ensure_ascii=False), *point
             ))
+            service_id = self.cursor.lastrowid  # Используем lastrowid для получения ID
+            self._sync_service_attributes(service_id)
+            index_search_terms(self.cursor, service_words(title, custom_fields))
+            refresh_rank_scores(self.cursor, [service_id])
 
-            self.connection.commit()
-            return self.cursor.lastrowid  # Используем lastrowid для получения ID
+            self._commit()
+            return service_id
 
         except Exception as e:
+            self._rollback()
             print(f"Ошибка при создании услуги: {e}")
             return None
 
@@ -539,7 +825,8 @@ class Database:
                     status: Optional[str] = None,
                     limit: Optional[int] = None,
                     offset: Optional[int] = None,
-                    order_by: str = 'created_at DESC') -> Optional[Union[Dict, List[Dict]]]:
+                    order_by: str = 'created_at DESC',
+                    cursor: Optional[str] = None) -> Optional[Union[Dict, List[Dict]]]:
         """
         Получает услуги с различными фильтрами
         Args:
@@ -548,10 +835,12 @@ class Database:
             telegram_id: Telegram ID пользователя для получения его услуг 
             status: Статус услуг ('active', 'deactive', 'deleted', None для всех)
             limit: Ограничение количества результатов
-            offset: Смещение для пагинации
+            offset: Смещение для пагинации (устаревшее, используйте cursor)
             order_by: Сортировка результатов
+            cursor: Значение поля 'cursor' последней услуги предыдущей страницы
         Returns:
-            Dict с информацией об услуге или список Dict или None при ошибке
+            Dict с информацией об услуге или список Dict или None при ошибке.
+            У каждой услуги есть поле 'cursor' для запроса следующей страницы
         """
         try:
             query = """
@@ -587,14 +876,28 @@ class Database:
             order_parts = order_by.lower().split()
             if len(order_parts) >= 1 and order_parts[0] in allowed_orders:
                 direction = 'DESC' if len(order_parts) > 1 and order_parts[1].upper() == 'DESC' else 'ASC'
-                query += f" ORDER BY s.{order_parts[0]} {direction}"
+                order_field = order_parts[0]
             else:
-                query += " ORDER BY s.created_at DESC"
+                order_field, direction = 'created_at', 'DESC'
+
+            # id замыкает ключ сортировки, чтобы порядок был однозначным
+            sort_keys = [(f"s.{order_field}", direction), ("s.id", direction)]
+            if cursor:
+                cursor_values = decode_cursor(cursor, len(sort_keys))
+                if cursor_values is None:
+                    # Курсор из устаревшего состояния или чужой выборки - обычная ситуация, не ошибка
+                    return []
+                condition, condition_params = keyset_condition(sort_keys, cursor_values)
+                query += f" AND {condition}"
+                params.extend(condition_params)
+
+            query += f" ORDER BY s.{order_field} {direction}, s.id {direction}"
 
             if limit is not None and limit > 0:
                 query += " LIMIT ?"
-                params.append(min(limit, 100))  # Ограничиваем до 100 записей
-            if offset is not None and offset >= 0:
+                params.append(limit)
+            if offset is not None and offset >= 0 and not cursor:
+                query += " LIMIT -1" if limit is None or limit <= 0 else ""
                 query += " OFFSET ?"
                 params.append(offset)
                 
@@ -609,6 +912,7 @@ class Database:
             
             for row in rows:
                 item = dict(zip(columns, row))
+                item['cursor'] = encode_cursor([item[order_field], item['id']])
                 
                 for json_field in ['custom_fields']:
                     if item.get(json_field):
@@ -632,13 +936,20 @@ class Database:
         Обновляет информацию об услуге
         Args:
             service_id: ID услуги
-            **kwargs: Поля для обновления (title, photo_id, city, etc.)
+            **kwargs: Поля для обновления (title, photo_id, city, latitude, longitude, etc.)
+                При смене города без новых координат услуга переносится в центр города
         Returns:
             bool: Успешность операции
         """
         try:
-            allowed_fields = {'title', 'photo_id', 'city', 'district', 'street', 
-                            'house', 'number_phone', 'price', 'custom_fields', 'status', 'views'}
+            allowed_fields = {'title', 'photo_id', 'city', 'district', 'street', 'house', 'number_phone',
+                            'price', 'custom_fields', 'status', 'views', 'latitude', 'longitude'}
+
+            if 'latitude' in kwargs or 'longitude' in kwargs or 'city' in kwargs:
+                point = valid_point(kwargs.get('latitude'), kwargs.get('longitude'))
+                if point is None and 'city' in kwargs:
+                    point = geocode_city(kwargs['city'])
+                kwargs['latitude'], kwargs['longitude'] = point or (None, None)
             
             updates = []
             params = []
@@ -660,13 +971,74 @@ class Database:
             """
             
             self.cursor.execute(query, params)
-            self.connection.commit()
+            if 'custom_fields' in kwargs:
+                self._sync_service_attributes(service_id)
+            if 'title' in kwargs or 'custom_fields' in kwargs:
+                self._sync_search_terms(service_id)
+            self._commit()
             return True
 
         except Exception as e:
+            self._rollback()
             print(f"Ошибка при обновлении услуги: {e}")
             return False
 
+    def _sync_service_attributes(self, service_id: int) -> None:
+        """
+        Перезаписывает значения дополнительных полей услуги в service_attributes
+        Вызывается внутри транзакции записи услуги, коммит выполняет вызывающий метод
+        """
+        self.cursor.execute(
+            "SELECT service_type_id, custom_fields FROM services WHERE id = ?", (service_id,)
+        )
+        row = self.cursor.fetchone()
+        self.cursor.execute("DELETE FROM service_attributes WHERE service_id = ?", (service_id,))
+        if not row:
+            return
+
+        service_type_id, custom_fields = row
+        try:
+            custom_fields = json.loads(custom_fields) if custom_fields else {}
+        except (json.JSONDecodeError, TypeError):
+            return
+
+        rows = build_attribute_rows(custom_fields, self.get_service_type_fields(service_type_id))
+        self.cursor.executemany("""
+            INSERT INTO service_attributes (service_id, service_type_id, name, value_text, value_num)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(service_id, service_type_id, *attribute) for attribute in rows])
+
+    def _sync_search_terms(self, service_id: int) -> None:
+        """
+        Добавляет в словарь нечеткого поиска новые слова услуги
+        Вызывается внутри транзакции записи услуги, коммит выполняет вызывающий метод
+        """
+        self.cursor.execute("SELECT title, custom_fields FROM services WHERE id = ?", (service_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return
+        try:
+            custom_fields = json.loads(row[1]) if row[1] else {}
+        except (json.JSONDecodeError, TypeError):
+            custom_fields = {}
+        index_search_terms(self.cursor, service_words(row[0], custom_fields))
+
+    def rebuild_search_terms(self) -> bool:
+        """
+        Пересобирает словарь нечеткого поиска по полнотекстовому индексу
+        (убирает слова удаленных и измененных услуг)
+        Returns:
+            bool: Успешность операции
+        """
+        try:
+            rebuild_search_terms(self.cursor)
+            self._commit()
+            return True
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при пересборке словаря поиска: {e}")
+            return False
+
     def delete_service(self, service_id: int, hard_delete: bool = False) -> bool:
         """
         Удаляет услугу
@@ -686,12 +1058,119 @@ class Database:
                     WHERE id = ?
                 """, (service_id,))
                 
-            self.connection.commit()
+            self._commit()
             return True
         except Exception as e:
             print(f"Ошибка при удалении услуги: {e}")
             return False
 
+    def _services_filter(self,
+                         service_type_id: Optional[int] = None,
+                         city: Optional[str] = None,
+                         district: Optional[str] = None,
+                         price_min: Optional[float] = None,
+                         price_max: Optional[float] = None,
+                         custom_fields: Optional[Dict[str, Any]] = None,
+                         search_text: Optional[str] = None,
+                         status: str = 'active',
+                         available_now: bool = False,
+                         near: Optional[Tuple[float, float]] = None,
+                         radius_km: Optional[float] = None) -> Tuple[str, str, List[Any], bool]:
+        """
+        Общая часть запросов filter_services и count_services
+        Returns:
+            JOIN полнотекстового индекса, условие WHERE, его параметры
+            и признак того, что используется полнотекстовый поиск
+        """
+        # Поиск по тексту в названии и описании через полнотекстовый индекс
+        fts_query = self._build_fts_query(search_text) if search_text else None
+        fts_join = "JOIN services_fts ON services_fts.rowid = s.id" if fts_query else ""
+
+        near = valid_point(*near) if near is not None else None
+        use_geo = near is not None and bool(radius_km)
+        # При поиске рядом прямоугольник R*Tree намного избирательнее статуса и типа:
+        # унарный '+' не дает SQLite выбрать вместо него индекс по (status, service_type_id)
+        column_prefix = '+' if use_geo else ''
+
+        where = f"{column_prefix}s.status = ?"
+        params: List[Any] = [status]
+
+        if fts_query:
+            where += " AND services_fts MATCH ?"
+            params.append(fts_query)
+
+        # Добавляем фильтры
+        if service_type_id is not None:
+            where += f" AND {column_prefix}s.service_type_id = ?"
+            params.append(service_type_id)
+
+        if city:
+            where += " AND LOWER(s.city) LIKE LOWER(?)"
+            params.append(f"%{city}%")
+
+        if district:
+            where += " AND LOWER(s.district) LIKE LOWER(?)"
+            params.append(f"%{district}%")
+
+        if price_min is not None:
+            where += " AND s.price >= ?"
+            params.append(float(price_min))
+
+        if price_max is not None:
+            where += " AND s.price <= ?"
+            params.append(float(price_max))
+
+        if available_now:
+            # Продавцы, работающие сейчас, по индексу seller_hours
+            now = minute_of_week()
+            where += """
+                AND s.user_id IN (
+                    SELECT seller_id FROM seller_hours WHERE start_minute <= ? AND end_minute > ?
+                )"""
+            params.extend([now, now])
+
+        if use_geo:
+            # Кандидаты из прямоугольника по R*Tree, затем точная проверка радиуса
+            min_lat, max_lat, min_lon, max_lon = bounding_box(*near, float(radius_km))
+            where += f"""
+                AND s.id IN (
+                    SELECT id FROM services_geo
+                    WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?
+                )
+                AND {self._distance_expression(near)} <= ?"""
+            params.extend([min_lat, max_lat, min_lon, max_lon, (float(radius_km) / KM_PER_DEGREE) ** 2])
+
+        # Применяем фильтры по дополнительным полям через индекс service_attributes
+        if custom_fields and service_type_id is not None:
+            fields = {field['name']: field for field in self.get_service_type_fields(service_type_id)}
+            for name, value in custom_fields.items():
+                field = fields.get(name)
+                if field is None or value is None or value == '' or value == []:
+                    continue
+                condition, condition_params = self._attribute_condition(field, value)
+                if condition:
+                    where += f"""
+                        AND s.id IN (
+                            SELECT service_id FROM service_attributes
+                            WHERE service_type_id = ? AND name = ? AND {condition}
+                        )"""
+                    params.extend([service_type_id, name, *condition_params])
+
+        return fts_join, where, params, bool(fts_query)
+
+    @staticmethod
+    def _distance_expression(near: Tuple[float, float]) -> str:
+        """
+        SQL-выражение квадрата расстояния от услуги до точки near в градусах широты
+        (равнопромежуточная проекция - точна в пределах города и не требует
+        математических функций SQLite). Координаты точки подставляются
+        числами, чтобы выражение можно было использовать в ключе курсора
+        """
+        latitude, longitude = (float(value) for value in near)
+        scale = longitude_scale(latitude)
+        return (f"((s.latitude - {latitude!r}) * (s.latitude - {latitude!r}) + "
+                f"(s.longitude - {longitude!r}) * (s.longitude - {longitude!r}) * {scale * scale!r})")
+
     def filter_services(self,
                        service_type_id: Optional[int] = None,
                        city: Optional[str] = None, 
@@ -704,7 +1183,12 @@ class Database:
                        sort_direction: str = 'DESC',
                        limit: int = 20,
                        offset: int = 0,
-                       status: str = 'active') -> List[Dict]:
+                       status: str = 'active',
+                       cursor: Optional[str] = None,
+                       available_now: bool = False,
+                       with_facets: bool = False,
+                       near: Optional[Tuple[float, float]] = None,
+                       radius_km: Optional[float] = None) -> Union[List[Dict], Dict[str, Any]]:
         """
         Расширенный поиск и фильтрация услуг
         Args:
@@ -713,83 +1197,112 @@ class Database:
             district: Район
             price_min: Минимальная цена
             price_max: Максимальная цена
-            custom_fields: Фильтры по дополнительным полям в формате {"field_name": "value"}
-            search_text: Текст для поиска в названии и описании
-            sort_by: Поле для сортировки
+            custom_fields: Фильтры по дополнительным полям в формате {"field_name": value}
+                (учитываются только поля типа service_type_id, см. _attribute_condition)
+            search_text: Текст для поиска в названии, описании и значениях полей
+                (полнотекстовый поиск по основам слов с исправлением опечаток, см.
+                _build_fts_query; результаты сначала упорядочены по релевантности)
+            sort_by: Поле для сортировки; 'relevance' - по оценке свежести, просмотров
+                и жалоб (utils.ranking), при search_text вместе с релевантностью текста
             sort_direction: Направление сортировки (ASC/DESC)
             limit: Ограничение количества результатов
-            offset: Смещение для пагинации
+            offset: Смещение для пагинации (устаревшее, используйте cursor)
             status: Статус услуги ('active', 'deleted' и т.д.)
+            cursor: Значение поля 'cursor' последней услуги предыдущей страницы;
+                следующая страница выбирается по индексу без пропуска строк
+            available_now: Только услуги продавцов, которые работают в данный момент
+            with_facets: Вернуть вместе с услугами количество найденных услуг
+                по городам, районам, ценовым диапазонам и вариантам полей (см. _facet_counts)
+            near: Точка (широта, долгота) пользователя; вместе с radius_km оставляет
+                услуги в радиусе, sort_by='distance' сортирует от ближних к дальним
+                (услуги без координат при этом не выбираются)
+            radius_km: Радиус поиска вокруг near в километрах
         Returns:
-            Список услуг, соответствующих фильтрам
+            Список услуг, соответствующих фильтрам. У каждой услуги есть
+            поле 'cursor' для запроса следующей страницы с теми же фильтрами,
+            а при поиске рядом - поле 'distance_km'.
+            При with_facets - словарь {'services': список услуг, 'facets': счетчики}.
+            None в случае ошибки
         """
         try:
+            fts_join, where, params, use_fts = self._services_filter(
+                service_type_id, city, district, price_min, price_max,
+                custom_fields, search_text, status, available_now, near, radius_km
+            )
+            near = valid_point(*near) if near is not None else None
+            sort_by_distance = bool(sort_by) and sort_by.lower() == 'distance' and near is not None
+            if sort_by_distance:
+                # У услуг без координат нет расстояния: NULL в ключе сортировки ломает курсор,
+                # поэтому при сортировке по расстоянию они не выбираются и без радиуса
+                where += " AND s.latitude IS NOT NULL AND s.longitude IS NOT NULL"
+            # Фасеты считаются по всем найденным услугам, а не по странице
+            facets = self._facet_counts(fts_join, where, params, service_type_id) if with_facets else None
+
+            # Проверяем и применяем сортировку
+            allowed_sort_fields = {'created_at', 'price', 'views', 'title', 'relevance'}
+            allowed_directions = {'ASC', 'DESC'}
+            
+            sort_by = sort_by.lower() if sort_by else 'created_at'
+            sort_direction = sort_direction.upper() if sort_direction else 'DESC'
+            
+            if sort_by_distance:
+                # Ближние первыми
+                sort_keys = [(self._distance_expression(near), 'ASC'), ("s.id", 'ASC')]
+            elif sort_by == 'relevance' and use_fts:
+                # Сначала услуги, у которых все слова запроса есть в названии, затем по оценке услуги
+                sort_keys = [
+                    (self._title_match_expression(search_text), 'DESC'),
+                    ("s.rank_score", 'DESC'),
+                    ("s.id", 'DESC')
+                ]
+            elif sort_by == 'relevance':
+                # Оценка хранится в rank_score - порядок берется из индекса без сортировки
+                sort_keys = [("s.rank_score", 'DESC'), ("s.id", 'DESC')]
+            else:
+                if sort_by not in allowed_sort_fields or sort_direction not in allowed_directions:
+                    sort_by, sort_direction = 'created_at', 'DESC'
+                # id замыкает ключ сортировки, чтобы порядок был однозначным
+                sort_keys = [(f"s.{sort_by}", sort_direction), ("s.id", sort_direction)]
+            if use_fts and sort_by != 'relevance':
+                # Сначала услуги, у которых все слова запроса есть в названии. bm25 в ключ
+                # не берется: она зависит от статистики всего индекса и меняется при любой
+                # записи услуги, и курсор сохраненной страницы пропускал бы или повторял строки
+                sort_keys.insert(0, (self._title_match_expression(search_text), 'DESC'))
+
+            if cursor:
+                cursor_values = decode_cursor(cursor, len(sort_keys))
+                if cursor_values is None:
+                    # Курсор из устаревшего состояния или чужой выборки - обычная ситуация, не ошибка
+                    return {'services': [], 'facets': facets} if with_facets else []
+                condition, condition_params = keyset_condition(sort_keys, cursor_values)
+                where += f" AND {condition}"
+                params.extend(condition_params)
+
             # Базовый запрос с основными JOIN
-            query = """
+            sort_columns = ''.join(
+                f",\n                    {expression} as _sort_key_{i}"
+                for i, (expression, _) in enumerate(sort_keys)
+            )
+            query = f"""
                 SELECT 
                     s.*,
                     st.header as service_type_name,
                     u.username as seller_username,
-                    u.number_phone as seller_phone
+                    u.number_phone as seller_phone{sort_columns}
                 FROM services s
+                {fts_join}
                 LEFT JOIN service_types st ON s.service_type_id = st.id
                 LEFT JOIN users u ON s.user_id = u.id
-                WHERE s.status = ?
+                WHERE {where}
+                ORDER BY {', '.join(f'{expression} {direction}' for expression, direction in sort_keys)}
             """
-            params = [status]
-
-            # Добавляем фильтры
-            if service_type_id is not None:
-                query += " AND s.service_type_id = ?"
-                params.append(service_type_id)
-            
-            if city:
-                query += " AND LOWER(s.city) LIKE LOWER(?)"
-                params.append(f"%{city}%")
-                
-            if district:
-                query += " AND LOWER(s.district) LIKE LOWER(?)"
-                params.append(f"%{district}%")
-                
-            if price_min is not None:
-                query += " AND s.price >= ?"
-                params.append(float(price_min))
-                
-            if price_max is not None:
-                query += " AND s.price <= ?"
-                params.append(float(price_max))
-
-            # Поиск по тексту в названии и описании
-            if search_text:
-                query += """ AND (
-                    LOWER(s.title) LIKE LOWER(?) 
-                    OR LOWER(json_extract(s.custom_fields, '$.description')) LIKE LOWER(?)
-                )"""
-                search_pattern = f"%{search_text}%"
-                params.extend([search_pattern, search_pattern])
-
-            # Применяем фильтры по дополнительным полям
-            if custom_fields:
-                for field, value in custom_fields.items():
-                    if value is not None and value != '':
-                        query += f" AND json_extract(s.custom_fields, '$.{field}') LIKE ?"
-                        params.append(f"%{value}%")
-
-            # Проверяем и применяем сортировку
-            allowed_sort_fields = {'created_at', 'price', 'views', 'title'}
-            allowed_directions = {'ASC', 'DESC'}
-            
-            sort_by = sort_by.lower() if sort_by else 'created_at'
-            sort_direction = sort_direction.upper() if sort_direction else 'DESC'
-            
-            if sort_by in allowed_sort_fields and sort_direction in allowed_directions:
-                query += f" ORDER BY s.{sort_by} {sort_direction}"
-            else:
-                query += " ORDER BY s.created_at DESC"
 
             # Добавляем пагинацию
-            query += " LIMIT ? OFFSET ?"
-            params.extend([max(1, int(limit)), max(0, int(offset))])
+            query += " LIMIT ?"
+            params.append(max(1, int(limit)))
+            if offset and not cursor:
+                query += " OFFSET ?"
+                params.append(max(0, int(offset)))
 
             # Выполняем запрос
             self.cursor.execute(query, params)
@@ -800,31 +1313,258 @@ class Database:
             
             for row in self.cursor.fetchall():
                 item = dict(zip(columns, row))
-                
-                # Обрабатываем JSON поля
-                for json_field in ['custom_fields']:
-                    try:
-                        if item.get(json_field):
-                            item[json_field] = json.loads(item[json_field])
-                        else:
-                            item[json_field] = {}
-                    except (json.JSONDecodeError, TypeError):
-                        item[json_field] = {}
-                
-                # Приводим числовые поля к правильному типу
-                if 'price' in item:
-                    item['price'] = float(item['price'])
-                if 'views' in item:
-                    item['views'] = int(item['views'])
+                item['cursor'] = encode_cursor([item.pop(f"_sort_key_{i}") for i in range(len(sort_keys))])
+                self._prepare_service_row(item)
+                if near is not None and item.get('latitude') is not None:
+                    item['distance_km'] = round(distance_km(*near, item['latitude'], item['longitude']), 2)
                         
                 result.append(item)
 
+            if with_facets:
+                return {'services': result, 'facets': facets}
             return result
 
         except Exception as e:
             print(f"Ошибка при фильтрации услуг: {e}")
+            return None
+
+    @staticmethod
+    def _prepare_service_row(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Приводит строку услуги из filter_services/get_services_by_ids к итоговому виду"""
+        # Обрабатываем JSON поля
+        for json_field in ['custom_fields']:
+            try:
+                if item.get(json_field):
+                    item[json_field] = json.loads(item[json_field])
+                else:
+                    item[json_field] = {}
+            except (json.JSONDecodeError, TypeError):
+                item[json_field] = {}
+
+        # Приводим числовые поля к правильному типу
+        if 'price' in item:
+            item['price'] = float(item['price'])
+        if 'views' in item:
+            item['views'] = int(item['views'])
+        return item
+
+    def get_services_by_ids(self, service_ids: List[int]) -> List[Dict]:
+        """
+        Услуги по списку ID в том же виде, что и в filter_services (без 'cursor')
+        Args:
+            service_ids: ID услуг в нужном порядке
+        Returns:
+            Список услуг в порядке service_ids; отсутствующие услуги пропускаются
+        """
+        try:
+            ids = list(dict.fromkeys(int(service_id) for service_id in service_ids))
+            if not ids:
+                return []
+            self.cursor.execute(f"""
+                SELECT 
+                    s.*,
+                    st.header as service_type_name,
+                    u.username as seller_username,
+                    u.number_phone as seller_phone
+                FROM services s
+                LEFT JOIN service_types st ON s.service_type_id = st.id
+                LEFT JOIN users u ON s.user_id = u.id
+                WHERE s.id IN ({', '.join('?' * len(ids))})
+            """, ids)
+            columns = [desc[0] for desc in self.cursor.description]
+            services = {row[0]: self._prepare_service_row(dict(zip(columns, row))) for row in self.cursor.fetchall()}
+            return [services[service_id] for service_id in ids if service_id in services]
+        except Exception as e:
+            print(f"Ошибка при получении услуг по списку ID: {e}")
             return []
 
+    def get_service_facet_row(self, service_id: int) -> Optional[Dict]:
+        """
+        Поля услуги, по которым она учитывается в service_facets
+        Returns:
+            Словарь service_type_id, city, district, price, status или None, если услуги нет
+        """
+        try:
+            self.cursor.execute(
+                "SELECT service_type_id, city, district, price, status FROM services WHERE id = ?", (service_id,)
+            )
+            row = self.cursor.fetchone()
+            return dict(zip(['service_type_id', 'city', 'district', 'price', 'status'], row)) if row else None
+        except Exception as e:
+            print(f"Ошибка при получении услуги {service_id}: {e}")
+            return None
+
+    @staticmethod
+    def _empty_facets() -> Dict[str, Any]:
+        return {'total': 0, 'city': {}, 'district': {}, 'price': {}, 'fields': {}}
+
+    @staticmethod
+    def _price_bucket_label(bucket: int) -> str:
+        """Подпись ценового диапазона в формате, который понимает фильтр цены"""
+        if bucket == 0:
+            return f"до {PRICE_BUCKETS[0]}"
+        if bucket >= len(PRICE_BUCKETS):
+            return f"от {PRICE_BUCKETS[-1]}"
+        return f"{PRICE_BUCKETS[bucket - 1]}-{PRICE_BUCKETS[bucket]}"
+
+    def _facet_counts(self, fts_join: str, where: str, params: List[Any],
+                      service_type_id: Optional[int]) -> Dict[str, Any]:
+        """
+        Считает фасеты найденных услуг одним запросом: выборка по фильтрам
+        выполняется один раз (MATERIALIZED) и группируется по каждому фасету
+        Returns:
+            {'total': всего услуг, 'city': {город: количество}, 'district': {район: количество},
+             'price': {диапазон: количество}, 'fields': {имя поля: {вариант: количество}}};
+            поля - только select/multiselect типа service_type_id
+        """
+        bucket_case = "CASE " + " ".join(
+            f"WHEN price < {bound} THEN {i}" for i, bound in enumerate(PRICE_BUCKETS)
+        ) + f" ELSE {len(PRICE_BUCKETS)} END"
+
+        query = f"""
+            WITH filtered AS MATERIALIZED (
+                SELECT s.id, s.city, s.district, s.price FROM services s {fts_join} WHERE {where}
+            )
+            SELECT 'city', city, COUNT(*) FROM filtered GROUP BY city
+            UNION ALL
+            SELECT 'district', district, COUNT(*) FROM filtered GROUP BY district
+            UNION ALL
+            SELECT 'price', {bucket_case}, COUNT(*) FROM filtered GROUP BY 2
+        """
+        query_params = list(params)
+
+        select_fields = {}
+        if service_type_id is not None:
+            select_fields = {
+                field['name']: field for field in self.get_service_type_fields(service_type_id)
+                if field['field_type'] in ('select', 'multiselect')
+            }
+        if select_fields:
+            query += f"""
+            UNION ALL
+            SELECT 'field:' || a.name, a.value_text, COUNT(DISTINCT a.service_id)
+            FROM filtered f JOIN service_attributes a ON a.service_id = f.id
+            WHERE a.service_type_id = ? AND a.name IN ({', '.join('?' * len(select_fields))})
+            GROUP BY a.name, a.value_text
+            """
+            query_params.extend([service_type_id, *select_fields])
+
+        facets = self._empty_facets()
+        price_buckets = {}
+        self.cursor.execute(query, query_params)
+        for facet, value, count in self.cursor.fetchall():
+            if facet == 'city':
+                facets['city'][value] = count
+                facets['total'] += count
+            elif facet == 'district':
+                facets['district'][value] = count
+            elif facet == 'price':
+                price_buckets[value] = count
+            else:
+                name = facet[len('field:'):]
+                # В service_attributes варианты хранятся в нижнем регистре - показываем исходный текст
+                options = {normalize_text(option): option for option in split_options(select_fields[name])}
+                facets['fields'].setdefault(name, {})[options.get(value, value)] = count
+
+        facets['price'] = {self._price_bucket_label(bucket): price_buckets[bucket] for bucket in sorted(price_buckets)}
+        return facets
+
+    def count_services(self,
+                       service_type_id: Optional[int] = None,
+                       city: Optional[str] = None,
+                       district: Optional[str] = None,
+                       price_min: Optional[float] = None,
+                       price_max: Optional[float] = None,
+                       custom_fields: Optional[Dict[str, Any]] = None,
+                       search_text: Optional[str] = None,
+                       status: str = 'active',
+                       available_now: bool = False,
+                       near: Optional[Tuple[float, float]] = None,
+                       radius_km: Optional[float] = None,
+                       **_) -> int:
+        """
+        Считает услуги, подходящие под фильтры filter_services
+        Лишние именованные параметры (сортировка, курсор) игнорируются,
+        поэтому можно передавать тот же набор фильтров, что и в filter_services
+        Returns:
+            Количество услуг
+        """
+        try:
+            fts_join, where, params, _ = self._services_filter(
+                service_type_id, city, district, price_min, price_max,
+                custom_fields, search_text, status, available_now, near, radius_km
+            )
+            self.cursor.execute(f"SELECT COUNT(*) FROM services s {fts_join} WHERE {where}", params)
+            return self.cursor.fetchone()[0]
+        except Exception as e:
+            print(f"Ошибка при подсчете услуг: {e}")
+            return 0
+
+    @staticmethod
+    def _attribute_condition(field: Dict, value: Any) -> Tuple[Optional[str], List[Any]]:
+        """
+        Строит условие по значению дополнительного поля для подзапроса к service_attributes
+        Args:
+            field: Поле типа услуги
+            value: Значение фильтра: число/дата или диапазон ('от X', 'до Y', 'X-Y',
+                {'min': X, 'max': Y}) для number/date, один или несколько вариантов
+                (список или через запятую) для select/multiselect, текст (подстрока) для text
+        Returns:
+            SQL-условие и его параметры, (None, []) если значение не разобрано
+        """
+        field_type = field['field_type']
+        if field_type in NUMERIC_FIELD_TYPES:
+            low, high = parse_range(field_type, value)
+            if low is None and high is None:
+                return None, []
+            if low == high:
+                return "value_num = ?", [low]
+            if high is None:
+                return "value_num >= ?", [low]
+            if low is None:
+                return "value_num <= ?", [high]
+            return "value_num BETWEEN ? AND ?", [low, high]
+
+        if field_type in ('select', 'multiselect'):
+            # В фильтре и select может содержать несколько вариантов через запятую
+            options = resolve_options({**field, 'field_type': 'multiselect'}, value)
+            if not options:
+                return None, []
+            return f"value_text IN ({', '.join('?' * len(options))})", options
+
+        # Текстовое поле ищется по подстроке без учета регистра (value_text уже в нижнем регистре);
+        # символы шаблона LIKE в самом значении экранируются
+        pattern = normalize_text(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return "value_text LIKE ? ESCAPE '\\'", [f"%{pattern}%"]
+
+    def _title_match_expression(self, search_text: str) -> str:
+        """
+        SQL-выражение 1/0: найдены ли все слова запроса в названии услуги.
+        Значение зависит только от самой услуги, поэтому выражение входит в ключ
+        курсора; запрос FTS5 подставляется в него строкой, а не параметром
+        """
+        title_query = "title : (" + self._build_fts_query(search_text) + ")"
+        return ("(s.id IN (SELECT rowid FROM services_fts WHERE services_fts MATCH '"
+                + title_query.replace("'", "''") + "'))")
+
+    def _build_fts_query(self, search_text: str) -> Optional[str]:
+        """
+        Преобразует пользовательский текст в запрос FTS5
+        Каждое слово заменяется основой (и похожими основами из словаря, если слово
+        написано с опечаткой, см. utils.search_index), основы ищутся по префиксу,
+        все слова должны присутствовать. Основы берутся в кавычки, чтобы спецсимволы FTS5 не ломали запрос
+        Returns:
+            Строка запроса для MATCH или None, если в тексте нет слов
+        """
+        words = list(dict.fromkeys(tokenize(search_text)))
+        if not words:
+            return None
+        groups = []
+        for word in words:
+            terms = ' OR '.join('"' + term + '"*' for term in expand_search_word(self.cursor, word))
+            groups.append(f"({terms})")
+        return ' AND '.join(groups)
+
     def get_cities(self) -> List[str]:
         """
         Получает список всех городов из активных услуг
@@ -832,8 +1572,7 @@ class Database:
         try:
             self.cursor.execute("""
                 SELECT DISTINCT city 
-                FROM services 
-                WHERE status = 'active'
+                FROM service_facets 
                 ORDER BY city
             """)
             return [row[0] for row in self.cursor.fetchall()]
@@ -848,10 +1587,10 @@ class Database:
         try:
             self.cursor.execute("""
                 SELECT DISTINCT district 
-                FROM services 
-                WHERE status = 'active' AND LOWER(city) = LOWER(?)
+                FROM service_facets 
+                WHERE casefold(city) = ?
                 ORDER BY district
-            """, (city,))
+            """, (normalize_text(city or ''),))
             return [row[0] for row in self.cursor.fetchall()]
         except Exception as e:
             print(f"Ошибка при получении списка районов: {e}")
@@ -862,19 +1601,22 @@ class Database:
         Получает минимальную и максимальную цену для заданных фильтров
         """
         try:
+            # Счетчики хранятся только для активных услуг
             query = """
                 SELECT MIN(price), MAX(price)
-                FROM services
-                WHERE status = 'active'
+                FROM service_facets
             """
+            conditions = []
             params = []
 
             if service_type_id:
-                query += " AND service_type_id = ?"
+                conditions.append("service_type_id = ?")
                 params.append(service_type_id)
             if city:
-                query += " AND LOWER(city) = LOWER(?)"
-                params.append(city)
+                conditions.append("casefold(city) = ?")
+                params.append(normalize_text(city))
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
 
             self.cursor.execute(query, params)
             min_price, max_price = self.cursor.fetchone()
@@ -883,19 +1625,64 @@ class Database:
             print(f"Ошибка при получении диапазона цен: {e}")
             return (0, 0)  
 
+    def get_service_facets(self) -> List[Dict]:
+        """
+        Получает счетчики активных услуг по сочетаниям типа, города, района и цены
+        Returns:
+            Список словарей service_type_id, city, district, price, services
+        """
+        try:
+            self.cursor.execute("""
+                SELECT service_type_id, city, district, price, services
+                FROM service_facets
+                WHERE services > 0
+            """)
+            return [dict(zip(['service_type_id', 'city', 'district', 'price', 'services'], row))
+                    for row in self.cursor.fetchall()]
+        except Exception as e:
+            print(f"Ошибка при получении счетчиков услуг: {e}")
+            return []
+
     def update_service_status(self, service_id: int, status: str) -> None:
         """
         Обновляет статус услуги по его ID
         """
         self.cursor.execute("UPDATE services SET status = ? WHERE id = ?", (status, service_id))
-        self.connection.commit()
+        self._commit()
     
     def increment_service_views(self, service_id: int) -> None:
         """
         Увеличивает количество просмотров услуги на 1
         """
         self.cursor.execute("UPDATE services SET views = views + 1 WHERE id = ?", (service_id,))
-        self.connection.commit()
+        refresh_rank_scores(self.cursor, [service_id])
+        self._commit()
+
+    def add_service_views(self, views: Dict[int, int],
+                          on_commit: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Добавляет накопленные просмотры нескольким услугам одной транзакцией
+        Args:
+            views: Словарь {service_id: количество новых просмотров}
+            on_commit: Вызывается в потоке писателя сразу после фиксации просмотров
+        Returns:
+            bool: Успешность операции
+        """
+        try:
+            self.cursor.executemany(
+                "UPDATE services SET views = views + ? WHERE id = ?",
+                [(count, service_id) for service_id, count in views.items()]
+            )
+            # Оценка для sort_by='relevance' пересчитывается только у просмотренных услуг
+            refresh_rank_scores(self.cursor, views)
+            if on_commit is not None:
+                self._on_commit(on_commit)
+            self._commit()
+            return True
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при записи просмотров: {e}")
+            return False
         
     #endregion
 
@@ -948,8 +1735,10 @@ class Database:
                 )
                 VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             """, (type, creator_telegram_id, accused_telegram_id, accused_service_id, text))
+            if accused_service_id:
+                refresh_rank_scores(self.cursor, [accused_service_id])
             
-            self.connection.commit()
+            self._commit()
             return True
             
         except Exception as e:
@@ -1080,12 +1869,16 @@ class Database:
             bool: True если удаление успешно, False если произошла ошибка
         """
         try:
+            self.cursor.execute("SELECT accused_service_id FROM complaints WHERE id = ?", (complaint_id,))
+            complaint = self.cursor.fetchone()
             self.cursor.execute("DELETE FROM complaints WHERE id = ?", (complaint_id,))
             
             if self.cursor.rowcount == 0:
                 raise ValueError("Жалоба не найдена")
+            if complaint[0]:
+                refresh_rank_scores(self.cursor, [complaint[0]])
                 
-            self.connection.commit()
+            self._commit()
             return True
             
         except Exception as e:
@@ -1174,7 +1967,7 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (type, admin_telegram_id, accused_telegram_id, accused_service_id, 
                  ban_duration_hours, is_permanent, reason))
-            self.connection.commit()
+            self._commit()
             return True
             
         except Exception as e:
@@ -1210,7 +2003,7 @@ class Database:
             if self.cursor.rowcount == 0:
                 raise ValueError(f"{'Пользователь' if type == 'user' else 'Сервис'} не найден в списке заблокированных")
             
-            self.connection.commit()
+            self._commit()
             return True
             
         except Exception as e:
@@ -1294,8 +2087,303 @@ class Database:
             print(f"Ошибка при получении списка блокировок: {e}")
             return []
 
+    def lift_expired_bans(self) -> List[Dict]:
+        """
+        Снимает все истекшие временные блокировки одной транзакцией.
+        Услуги, заблокированные по истекшему бану услуги, снова становятся активными
+        Returns:
+            List[Dict]: Снятые блокировки в формате get_all_bans
+        """
+        try:
+            self.cursor.execute("""
+                SELECT id, type, admin_telegram_id, accused_telegram_id, accused_service_id,
+                       ban_date, ban_duration_hours, is_permanent, reason
+                FROM banned_types
+                WHERE NOT is_permanent
+                AND datetime(ban_date, '+' || ban_duration_hours || ' hours') <= CURRENT_TIMESTAMP
+            """)
+            lifted = [dict(zip(['id', 'type', 'admin_telegram_id', 'accused_telegram_id',
+                                'accused_service_id', 'ban_date', 'ban_duration_hours',
+                                'is_permanent', 'reason'], row)) for row in self.cursor.fetchall()]
+            if not lifted:
+                return []
+
+            self.cursor.executemany("DELETE FROM banned_types WHERE id = ?",
+                                    [(ban['id'],) for ban in lifted])
+            self.cursor.executemany(
+                "UPDATE services SET status = 'active' WHERE id = ? AND status = 'blocked'",
+                [(ban['accused_service_id'],) for ban in lifted if ban['type'] == 'service']
+            )
+            self._commit()
+            return lifted
+
+        except Exception as e:
+            print(f"Ошибка при снятии истекших блокировок: {e}")
+            self._rollback()
+            return []
+
+    #endregion
+
+    #region Методы для таблицы saved_searches
+
+    def add_saved_search(self, telegram_id: str, service_type_id: int, city: Optional[str] = None,
+                         price_min: Optional[float] = None, price_max: Optional[float] = None,
+                         custom_fields: Optional[Dict[str, Any]] = None, search_text: Optional[str] = None,
+                         near: Optional[Tuple[float, float]] = None,
+                         radius_km: Optional[float] = None) -> Optional[int]:
+        """
+        Сохраняет набор фильтров, по которому пользователь получит уведомления о новых услугах
+        Args:
+            telegram_id: Telegram ID пользователя
+            service_type_id: ID типа услуги
+            city: Город (как и в filter_services, подстрока без учета регистра)
+            price_min: Минимальная цена
+            price_max: Максимальная цена
+            custom_fields: Фильтры по дополнительным полям, как в filter_services
+            search_text: Текст поиска, как в filter_services
+            near: Точка (широта, долгота); учитывается вместе с radius_km
+            radius_km: Радиус вокруг near в километрах
+        Returns:
+            ID сохраненного поиска или None в случае ошибки
+        """
+        try:
+            terms = saved_search_terms(service_type_id, custom_fields or {},
+                                       self.get_service_type_fields(service_type_id))
+            near = valid_point(*near) if near is not None and radius_km else None
+            self.cursor.execute("""
+                INSERT INTO saved_searches (
+                    telegram_id, service_type_id, city, price_min, price_max, custom_fields, predicates,
+                    search_text, latitude, longitude, radius_km
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                str(telegram_id), service_type_id, normalize_text(city) if city else None,
+                float(price_min) if price_min is not None else None,
+                float(price_max) if price_max is not None else None,
+                json.dumps(custom_fields or {}, ensure_ascii=False),
+                len({predicate for _, predicate in terms}),
+                search_text.strip() if search_text and search_text.strip() else None,
+                *(near if near is not None else (None, None)),
+                float(radius_km) if near is not None else None
+            ))
+            search_id = self.cursor.lastrowid
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO saved_search_terms (term, search_id, predicate) VALUES (?, ?, ?)",
+                [(term, search_id, predicate) for term, predicate in terms]
+            )
+            self._commit()
+            return search_id
+
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при сохранении поиска: {e}")
+            return None
+
+    def get_saved_searches(self, telegram_id: str) -> List[Dict]:
+        """
+        Получает сохраненные поиски пользователя (новые сверху)
+        Args:
+            telegram_id: Telegram ID пользователя
+        Returns:
+            Список поисков с названием типа услуги
+        """
+        try:
+            self.cursor.execute("""
+                SELECT ss.id, ss.service_type_id, st.header, ss.city, ss.price_min, ss.price_max,
+                       ss.custom_fields, ss.search_text, ss.radius_km, ss.created_at
+                FROM saved_searches ss
+                LEFT JOIN service_types st ON st.id = ss.service_type_id
+                WHERE ss.telegram_id = ?
+                ORDER BY ss.created_at DESC, ss.id DESC
+            """, (str(telegram_id),))
+            searches = []
+            for row in self.cursor.fetchall():
+                search = dict(zip(['id', 'service_type_id', 'service_type_name', 'city', 'price_min',
+                                   'price_max', 'custom_fields', 'search_text', 'radius_km', 'created_at'], row))
+                try:
+                    search['custom_fields'] = json.loads(search['custom_fields'] or '{}')
+                except (json.JSONDecodeError, TypeError):
+                    search['custom_fields'] = {}
+                searches.append(search)
+            return searches
+
+        except Exception as e:
+            print(f"Ошибка при получении сохраненных поисков: {e}")
+            return []
+
+    def delete_saved_search(self, search_id: int, telegram_id: str) -> bool:
+        """
+        Удаляет сохраненный поиск пользователя (условия и отметки удаляет триггер)
+        Returns:
+            bool: True если поиск удален
+        """
+        try:
+            self.cursor.execute(
+                "DELETE FROM saved_searches WHERE id = ? AND telegram_id = ?", (search_id, str(telegram_id))
+            )
+            deleted = self.cursor.rowcount > 0
+            self._commit()
+            return deleted
+
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при удалении сохраненного поиска: {e}")
+            return False
+
+    def claim_saved_search_matches(self, service_id: int) -> List[Dict]:
+        """
+        Находит сохраненные поиски, которым подходит активная услуга, и отмечает их,
+        чтобы об этой услуге не уведомлять повторно (например, после повторного включения)
+        Args:
+            service_id: ID услуги
+        Returns:
+            Список {'search_id', 'telegram_id'} для еще не уведомленных поисков;
+            поиски самого продавца не учитываются
+        """
+        try:
+            self.cursor.execute(
+                "SELECT service_type_id, city, price, user_id, status FROM services WHERE id = ?", (service_id,)
+            )
+            service = self.cursor.fetchone()
+            if not service or service[4] != 'active':
+                return []
+            service_type_id, city, price, seller_id, _ = service
+
+            self.cursor.execute(
+                "SELECT name, value_text, value_num FROM service_attributes WHERE service_id = ?", (service_id,)
+            )
+            attributes = self.cursor.fetchall()
+            terms = service_terms(service_type_id, [(name, text) for name, text, _ in attributes])
+
+            # Кандидаты - только поиски, у которых по терминам услуги совпали все условия.
+            # Город поиска хранится в нижнем регистре и ищется в городе услуги как подстрока
+            self.cursor.execute(f"""
+                SELECT ss.id, ss.telegram_id, ss.custom_fields, ss.search_text,
+                       ss.latitude, ss.longitude, ss.radius_km
+                FROM saved_search_terms t
+                JOIN saved_searches ss ON ss.id = t.search_id
+                WHERE t.term IN ({', '.join('?' * len(terms))})
+                AND (ss.price_min IS NULL OR ss.price_min <= ?)
+                AND (ss.price_max IS NULL OR ss.price_max >= ?)
+                AND (ss.city IS NULL OR INSTR(?, ss.city) > 0)
+                AND ss.telegram_id != CAST(? AS TEXT)
+                GROUP BY ss.id
+                HAVING COUNT(DISTINCT t.predicate) = ss.predicates
+            """, [*terms, price, price, normalize_text(city or ''), seller_id])
+            candidates = self.cursor.fetchall()
+
+            fields = self.get_service_type_fields(service_type_id) if candidates else []
+            matches = []
+            for search_id, telegram_id, custom_fields, search_text, latitude, longitude, radius_km in candidates:
+                try:
+                    custom_fields = json.loads(custom_fields or '{}')
+                except (json.JSONDecodeError, TypeError):
+                    custom_fields = {}
+                if not matches_residual(custom_fields, fields, attributes):
+                    continue
+                if search_text and not self._matches_search_text(service_id, search_text):
+                    continue
+                if radius_km and not self._within_radius(service_id, (latitude, longitude), radius_km):
+                    continue
+                self.cursor.execute(
+                    "INSERT OR IGNORE INTO saved_search_hits (search_id, service_id) VALUES (?, ?)",
+                    (search_id, service_id)
+                )
+                if self.cursor.rowcount:
+                    matches.append({'search_id': search_id, 'telegram_id': telegram_id})
+            self._commit()
+            return matches
+
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при поиске подписок на услугу: {e}")
+            return []
+
+    def _matches_search_text(self, service_id: int, search_text: str) -> bool:
+        """Находит ли полнотекстовый поиск filter_services услугу по тексту"""
+        fts_query = self._build_fts_query(search_text)
+        if not fts_query:
+            return True
+        self.cursor.execute(
+            "SELECT 1 FROM services_fts WHERE rowid = ? AND services_fts MATCH ?", (service_id, fts_query)
+        )
+        return self.cursor.fetchone() is not None
+
+    def _within_radius(self, service_id: int, near: Tuple[float, float], radius_km: float) -> bool:
+        """Попадает ли услуга в радиус поиска рядом (то же условие, что и в filter_services)"""
+        self.cursor.execute(f"""
+            SELECT 1 FROM services s
+            WHERE s.id = ? AND s.latitude IS NOT NULL AND {self._distance_expression(near)} <= ?
+        """, (service_id, (float(radius_km) / KM_PER_DEGREE) ** 2))
+        return self.cursor.fetchone() is not None
+
+    #endregion
+
+    #region Методы для таблицы fsm_storage
+
+    def get_fsm_record(self, key: str, now: int) -> Optional[Tuple[Optional[str], Optional[str], int]]:
+        """
+        Получает сохраненное состояние FSM
+        Args:
+            key: Ключ состояния
+            now: Текущее unix-время: истекшие записи не возвращаются
+        Returns:
+            (состояние, данные в JSON, unix-время истечения) или None
+        """
+        try:
+            self.cursor.execute(
+                "SELECT state, data, expires_at FROM fsm_storage WHERE key = ? AND expires_at > ?", (key, now)
+            )
+            return self.cursor.fetchone()
+        except Exception as e:
+            print(f"Ошибка при получении состояния FSM: {e}")
+            return None
+
+    def save_fsm_records(self, records: List[Tuple[str, Optional[str], Optional[str], int]]) -> bool:
+        """
+        Записывает пачку состояний FSM одной транзакцией
+        Args:
+            records: Список (ключ, состояние, данные в JSON, unix-время истечения);
+                запись без состояния и данных удаляется
+        Returns:
+            bool: Успешность операции
+        """
+        try:
+            self.cursor.executemany("""
+                INSERT INTO fsm_storage (key, state, data, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, expires_at = excluded.expires_at
+            """, [record for record in records if record[1] is not None or record[2] is not None])
+            self.cursor.executemany(
+                "DELETE FROM fsm_storage WHERE key = ?",
+                [(record[0],) for record in records if record[1] is None and record[2] is None]
+            )
+            self._commit()
+            return True
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при записи состояний FSM: {e}")
+            return False
+
+    def delete_expired_fsm_records(self, now: int) -> int:
+        """
+        Удаляет истекшие состояния FSM
+        Returns:
+            Количество удаленных записей
+        """
+        try:
+            self.cursor.execute("DELETE FROM fsm_storage WHERE expires_at <= ?", (now,))
+            deleted = self.cursor.rowcount
+            self._commit()
+            return deleted
+        except Exception as e:
+            self._rollback()
+            print(f"Ошибка при удалении истекших состояний FSM: {e}")
+            return 0
+
     #endregion
 
-    def __del__(self):
+    def close(self) -> None:
+        """Закрывает соединение с базой данных"""
         self.connection.close()
 
@@ -0,0 +1,128 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.service_attributes import normalize_text
+
+if TYPE_CHECKING:
+    from utils.async_database import AsyncDatabase
+
+# Срез фасетов: (ID типа услуги или None - все типы, город через normalize_text или None - все города)
+FacetSlice = Tuple[Optional[int], Optional[str]]
+# Строка service_facets: (ID типа услуги, город, район, цена)
+FacetKey = Tuple[int, str, str, float]
+
+
+def _change_count(counts: Dict[Any, int], key: Any, delta: int) -> None:
+    count = counts.get(key, 0) + delta
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+
+class FacetCache:
+    """Города, районы и диапазоны цен активных услуг в памяти процесса
+
+    Строится по таблице service_facets, которую триггеры поддерживают
+    при каждой вставке, изменении и удалении услуги. Пишущие методы услуг
+    в AsyncDatabase после фиксации переносят услугу между строками
+    счетчиков (apply), и срезы обновляются на месте без чтения базы;
+    invalidate (остальные изменения) перечитывает таблицу целиком при
+    следующем обращении. Все ответы - чтение из словарей по срезам "тип",
+    "город" и "тип и город". Город сравнивается через normalize_text,
+    как и в Database.get_districts / get_price_range.
+    """
+
+    def __init__(self, db: 'AsyncDatabase'):
+        self._db = db
+        self.version = 0
+        self._loaded_version: Optional[int] = None
+        self._load_lock = asyncio.Lock()
+        # Число активных услуг по городу (как записан в услуге), району и цене среза
+        self._cities: Dict[str, int] = {}
+        self._districts: Dict[str, Dict[str, int]] = {}
+        self._prices: Dict[FacetSlice, Dict[float, int]] = {}
+        self._price_ranges: Dict[FacetSlice, Tuple[float, float]] = {}
+
+    async def load(self) -> None:
+        """Перечитывает счетчики из базы и пересчитывает срезы"""
+        async with self._load_lock:
+            # Если услуги изменили, пока читали, снимок может быть устаревшим - читаем заново
+            while self._loaded_version != self.version:
+                version = self.version
+                facets = await self._db._read('get_service_facets')
+                if version != self.version:
+                    continue
+                self._build(facets)
+                self._loaded_version = version
+
+    def invalidate(self) -> None:
+        self.version += 1
+
+    def apply(self, removed: Optional[Sequence], added: Optional[Sequence]) -> None:
+        """Переносит одну активную услугу между строками service_facets
+        Args:
+            removed: Строка, из которой услуга ушла (FacetKey), или None
+            added: Строка, в которую услуга пришла, или None
+        """
+        if self._loaded_version != self.version or self._load_lock.locked():
+            # Срезы еще не загружены или загружаются - загрузка прочитает изменение из базы
+            self.invalidate()
+            return
+        # После пересылки между процессами ключи приходят списками
+        if removed is not None:
+            self._add(tuple(removed), -1)
+        if added is not None:
+            self._add(tuple(added), 1)
+
+    def _build(self, facets: List[Dict]) -> None:
+        self._cities = {}
+        self._districts = {}
+        self._prices = {}
+        self._price_ranges = {}
+        for facet in facets:
+            self._add(
+                (facet['service_type_id'], facet['city'], facet['district'], facet['price']),
+                facet['services']
+            )
+
+    def _add(self, key: FacetKey, delta: int) -> None:
+        service_type_id, city, district, price = key
+        city_key = normalize_text(city)
+        _change_count(self._cities, city, delta)
+        districts = self._districts.setdefault(city_key, {})
+        _change_count(districts, district, delta)
+        if not districts:
+            del self._districts[city_key]
+
+        for slice_key in ((None, None), (service_type_id, None), (None, city_key), (service_type_id, city_key)):
+            prices = self._prices.setdefault(slice_key, {})
+            _change_count(prices, price, delta)
+            if not prices:
+                del self._prices[slice_key]
+                self._price_ranges.pop(slice_key, None)
+                continue
+            low, high = self._price_ranges.get(slice_key, (price, price))
+            if price in prices:
+                self._price_ranges[slice_key] = (min(low, price), max(high, price))
+            elif price in (low, high):
+                # Ушла последняя услуга с крайней ценой - границы пересчитываются по ценам среза
+                self._price_ranges[slice_key] = (min(prices), max(prices))
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded_version != self.version:
+            await self.load()
+
+    async def get_cities(self) -> List[str]:
+        await self._ensure_loaded()
+        return sorted(self._cities)
+
+    async def get_districts(self, city: str) -> List[str]:
+        await self._ensure_loaded()
+        return sorted(self._districts.get(normalize_text(city or ''), {}))
+
+    async def get_price_range(self, service_type_id: Optional[int] = None,
+                              city: Optional[str] = None) -> Tuple[float, float]:
+        await self._ensure_loaded()
+        key = (int(service_type_id) if service_type_id else None, normalize_text(city) if city else None)
+        return self._price_ranges.get(key, (0, 0))
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+if TYPE_CHECKING:
+    from utils.async_database import AsyncDatabase
+
+# Время жизни состояния по умолчанию: брошенная на середине форма удаляется через неделю
+DEFAULT_STATE_TTL = 7 * 24 * 3600
+
+
+class _Record(NamedTuple):
+    state: Optional[str]
+    # Данные состояния в компактном JSON (None - пустые данные)
+    data: Optional[str]
+    expires_at: int
+    last_access: float
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в таблице fsm_storage основной базы
+
+    Состояния переживают перезапуск бота. Недавно использованные записи
+    держатся в памяти в виде JSON-строк (и отсутствие записи - тоже, чтобы
+    апдейты пользователей без состояния не читали базу), изменения пишутся
+    в базу пачкой раз в flush_interval секунд, при накоплении max_pending
+    измененных ключей и при остановке. Фоновая очистка выгружает из памяти
+    записи, к которым не обращались memory_idle секунд, и удаляет из базы
+    истекшие.
+
+    Срок жизни записи отсчитывается от последнего изменения: ttl секунд
+    или значение из state_ttl по имени состояния ("SearchStates:browsing")
+    либо его группы ("SearchStates").
+
+    Создается до диспетчера, а работать начинает после start(db) в main.py.
+    """
+
+    def __init__(self, ttl: int = DEFAULT_STATE_TTL, state_ttl: Optional[Dict[str, int]] = None,
+                 key_builder: Optional[KeyBuilder] = None, flush_interval: float = 1.0,
+                 eviction_interval: float = 60.0, memory_idle: float = 600.0, max_pending: int = 500):
+        self.ttl = ttl
+        self.state_ttl = state_ttl or {}
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.eviction_interval = eviction_interval
+        self.memory_idle = memory_idle
+        self.max_pending = max_pending
+        self._db: Optional['AsyncDatabase'] = None
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        # Внеочередная запись при накоплении max_pending ключей
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def start(self, db: 'AsyncDatabase') -> None:
+        """Подключает хранилище к базе и запускает фоновую запись и очистку"""
+        self._db = db
+        await self.evict()
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    def _record_ttl(self, state: Optional[str]) -> int:
+        if state is not None:
+            if state in self.state_ttl:
+                return self.state_ttl[state]
+            group = state.split(':', 1)[0]
+            if group in self.state_ttl:
+                return self.state_ttl[group]
+        return self.ttl
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        storage_key = self.key_builder.build(key)
+        record = self._records.get(storage_key)
+        now = time.time()
+        if record is None:
+            if self._db is None:
+                raise RuntimeError("Хранилище состояний не подключено к базе (SQLiteStorage.start)")
+            row = await self._db.get_fsm_record(storage_key, int(now))
+            # Пока читали, запись могли изменить - она новее прочитанной
+            record = self._records.get(storage_key)
+            if record is None:
+                record = _Record(*row, now) if row else _Record(None, None, 0, now)
+                self._records[storage_key] = record
+        elif record.expires_at and record.expires_at <= now:
+            record = _Record(None, None, 0, now)
+            self._records[storage_key] = record
+        else:
+            record = record._replace(last_access=now)
+            self._records[storage_key] = record
+        return record
+
+    async def _put_record(self, key: StorageKey, state: Optional[str], data: Optional[str]) -> None:
+        if self._closed:
+            raise RuntimeError("Хранилище состояний уже закрыто")
+        storage_key = self.key_builder.build(key)
+        now = time.time()
+        expires_at = int(now) + self._record_ttl(state) if state is not None or data is not None else 0
+        self._records[storage_key] = _Record(state, data, expires_at, now)
+        self._dirty.add(storage_key)
+        if len(self._dirty) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        await self._put_record(key, state.state if isinstance(state, State) else state, record.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Данные состояния должны быть словарем, получено {type(data).__name__}")
+        record = await self._get_record(key)
+        packed = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str) if data else None
+        await self._put_record(key, record.state, packed)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        return json.loads(record.data) if record.data else {}
+
+    async def flush(self) -> bool:
+        """Записывает измененные состояния одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty or self._db is None:
+                return True
+            keys, self._dirty = self._dirty, set()
+            records = [(key, *self._records[key][:3]) for key in keys if key in self._records]
+            try:
+                success = await self._db.save_fsm_records(records)
+            except Exception as e:
+                print(f"Ошибка при записи состояний FSM: {e}")
+                success = False
+            if not success:
+                # Записи в памяти уже новее - повторим их запись в следующий раз
+                self._dirty |= keys
+            return success
+
+    async def evict(self) -> None:
+        """Выгружает из памяти давно не использованные записи и удаляет истекшие из базы"""
+        await self.flush()
+        now = time.time()
+        idle = [
+            key for key, record in self._records.items()
+            if key not in self._dirty
+            and (record.last_access <= now - self.memory_idle or (record.expires_at and record.expires_at <= now))
+        ]
+        for key in idle:
+            del self._records[key]
+        if self._db is not None:
+            deleted = await self._db.delete_expired_fsm_records(int(now))
+            if deleted:
+                print(f"Удалено истекших состояний FSM: {deleted}")
+
+    async def _run_timer(self) -> None:
+        last_eviction = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # Остановка таймера не должна прерывать уже начатую запись
+            if time.monotonic() - last_eviction >= self.eviction_interval:
+                last_eviction = time.monotonic()
+                await asyncio.shield(self.evict())
+            else:
+                await asyncio.shield(self.flush())
+
+    async def close(self) -> None:
+        """Останавливает фоновые задачи и записывает оставшиеся изменения"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
@@ -0,0 +1,110 @@
+import math
+from typing import Optional, Tuple
+
+# Координаты (широта, долгота) в градусах
+Point = Tuple[float, float]
+# Прямоугольник (мин. широта, макс. широта, мин. долгота, макс. долгота)
+BoundingBox = Tuple[float, float, float, float]
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# Справочник центров городов: услуги без точных координат привязываются к центру своего города
+CITY_COORDINATES = {
+    'москва': (55.7558, 37.6173),
+    'санкт-петербург': (59.9343, 30.3351),
+    'новосибирск': (55.0084, 82.9357),
+    'екатеринбург': (56.8389, 60.6057),
+    'казань': (55.7961, 49.1064),
+    'нижний новгород': (56.2965, 43.9361),
+    'челябинск': (55.1644, 61.4368),
+    'самара': (53.1959, 50.1002),
+    'омск': (54.9885, 73.3242),
+    'ростов-на-дону': (47.2357, 39.7015),
+    'уфа': (54.7388, 55.9721),
+    'красноярск': (56.0153, 92.8932),
+    'пермь': (58.0105, 56.2502),
+    'воронеж': (51.6608, 39.2003),
+    'волгоград': (48.7080, 44.5133),
+    'краснодар': (45.0355, 38.9753),
+    'саратов': (51.5331, 46.0342),
+    'тюмень': (57.1613, 65.5250),
+    'тольятти': (53.5078, 49.4204),
+    'ижевск': (56.8526, 53.2045),
+    'барнаул': (53.3474, 83.7784),
+    'ульяновск': (54.3142, 48.4031),
+    'иркутск': (52.2870, 104.3050),
+    'хабаровск': (48.4802, 135.0719),
+    'ярославль': (57.6261, 39.8845),
+    'владивосток': (43.1155, 131.8855),
+    'махачкала': (42.9849, 47.5047),
+    'томск': (56.4846, 84.9476),
+    'оренбург': (51.7682, 55.0970),
+    'кемерово': (55.3547, 86.0873),
+    'новокузнецк': (53.7557, 87.1099),
+    'рязань': (54.6269, 39.6916),
+    'астрахань': (46.3479, 48.0336),
+    'пенза': (53.1959, 45.0183),
+    'липецк': (52.6031, 39.5708),
+    'тула': (54.1931, 37.6173),
+    'калининград': (54.7104, 20.4522),
+    'сочи': (43.5855, 39.7231),
+}
+
+# Распространенные сокращения названий городов
+CITY_ALIASES = {
+    'мск': 'москва',
+    'спб': 'санкт-петербург',
+    'питер': 'санкт-петербург',
+    'екб': 'екатеринбург',
+    'нск': 'новосибирск',
+    'нн': 'нижний новгород',
+    'ростов': 'ростов-на-дону',
+}
+
+
+def normalize_city(city: str) -> str:
+    """Название города для поиска в справочнике: без регистра, 'ё' и префикса 'г.'"""
+    name = ' '.join((city or '').casefold().replace('ё', 'е').split())
+    for prefix in ('город ', 'г. ', 'г.', 'г '):
+        if name.startswith(prefix):
+            name = name[len(prefix):].strip()
+            break
+    return CITY_ALIASES.get(name, name)
+
+
+def geocode_city(city: str) -> Optional[Point]:
+    """Координаты центра города по справочнику или None, если город неизвестен"""
+    return CITY_COORDINATES.get(normalize_city(city))
+
+
+def valid_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[Point]:
+    """Проверяет координаты и приводит их к числам"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        return latitude, longitude
+    return None
+
+
+def distance_km(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Расстояние по поверхности Земли (формула гаверсинусов)"""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def longitude_scale(latitude: float) -> float:
+    """Во сколько раз градус долготы на этой широте короче градуса широты"""
+    return max(math.cos(math.radians(latitude)), 0.01)
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    """Прямоугольник, в который гарантированно попадает круг радиуса radius_km"""
+    d_lat = radius_km / KM_PER_DEGREE
+    d_lon = min(radius_km / (KM_PER_DEGREE * longitude_scale(latitude)), 180.0)
+    return latitude - d_lat, latitude + d_lat, longitude - d_lon, longitude + d_lon
@@ -0,0 +1,633 @@
+import json
+import sqlite3
+from typing import Callable, List, NamedTuple, Union
+
+from utils.geo import geocode_city
+from utils.ranking import refresh_rank_scores
+from utils.search_index import rebuild_search_terms
+from utils.seller_hours import work_intervals
+from utils.service_attributes import build_attribute_rows
+
+# Шаг миграции: SQL-запрос или функция, получающая курсор
+MigrationStep = Union[str, Callable[[sqlite3.Cursor], None]]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: List[MigrationStep]
+
+
+def _fts_text(expression: str) -> str:
+    """Приводит 'ё' к 'е' - unicode61 не считает их одной буквой"""
+    return f"REPLACE(REPLACE({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts_title(row: str) -> str:
+    """SQL-выражение названия услуги для полнотекстового индекса"""
+    return _fts_text(f"{row}.title")
+
+
+def _fts_description(row: str) -> str:
+    """SQL-выражение описания услуги для полнотекстового индекса
+    (некорректный JSON в custom_fields не должен ломать запись услуги)"""
+    return _fts_text(
+        f"CASE WHEN json_valid({row}.custom_fields) "
+        f"THEN json_extract({row}.custom_fields, '$.description') END"
+    )
+
+
+def _fts_attributes(row: str) -> str:
+    """SQL-выражение текстовых значений дополнительных полей (кроме описания),
+    в том числе вариантов select/multiselect"""
+    return _fts_text(
+        f"(SELECT group_concat(value, ' ') FROM json_tree("
+        f"CASE WHEN json_valid({row}.custom_fields) THEN {row}.custom_fields END"
+        f") WHERE type = 'text' AND key IS NOT 'description')"
+    )
+
+
+def _backfill_service_attributes(cursor: sqlite3.Cursor) -> None:
+    """Заполняет service_attributes по уже существующим услугам"""
+    fields_by_type = {}
+    cursor.execute("""
+        SELECT service_type_id, name, field_type, item_for_select
+        FROM service_type_fields
+        ORDER BY service_type_id, order_position
+    """)
+    for type_id, name, field_type, item_for_select in cursor.fetchall():
+        fields_by_type.setdefault(type_id, []).append(
+            {"name": name, "field_type": field_type, "item_for_select": item_for_select}
+        )
+
+    cursor.execute("SELECT id, service_type_id, custom_fields FROM services")
+    for service_id, type_id, custom_fields in cursor.fetchall():
+        try:
+            custom_fields = json.loads(custom_fields) if custom_fields else {}
+        except (json.JSONDecodeError, TypeError):
+            continue
+        rows = build_attribute_rows(custom_fields, fields_by_type.get(type_id, []))
+        cursor.executemany("""
+            INSERT INTO service_attributes (service_id, service_type_id, name, value_text, value_num)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(service_id, type_id, *row) for row in rows])
+
+
+def _backfill_seller_hours(cursor: sqlite3.Cursor) -> None:
+    """Заполняет seller_hours по графикам уже существующих пользователей"""
+    cursor.execute("SELECT telegram_id, work_time_start, work_time_end, work_days FROM users")
+    for telegram_id, work_time_start, work_time_end, work_days in cursor.fetchall():
+        try:
+            seller_id = int(telegram_id)
+        except (TypeError, ValueError):
+            continue
+        cursor.executemany("""
+            INSERT INTO seller_hours (seller_id, start_minute, end_minute) VALUES (?, ?, ?)
+        """, [(seller_id, start, end) for start, end in work_intervals(work_time_start, work_time_end, work_days)])
+
+
+def _backfill_service_coordinates(cursor: sqlite3.Cursor) -> None:
+    """Привязывает существующие услуги к центрам их городов по справочнику utils.geo"""
+    cursor.execute("SELECT id, city FROM services WHERE latitude IS NULL")
+    rows = []
+    for service_id, city in cursor.fetchall():
+        point = geocode_city(city)
+        if point:
+            rows.append((*point, service_id))
+    # Триггер services_geo_update добавит услуги в пространственный индекс
+    cursor.executemany("UPDATE services SET latitude = ?, longitude = ? WHERE id = ?", rows)
+
+
+# Миграции применяются строго по возрастанию версии и только один раз.
+# Уже выпущенные миграции не изменяются - новые изменения схемы
+# добавляются отдельной миграцией в конец списка.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Индексы для основных запросов", [
+        # filter_services: WHERE status = ? AND service_type_id = ? ORDER BY created_at / price
+        "CREATE INDEX IF NOT EXISTS idx_services_status_type_created "
+        "ON services (status, service_type_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_services_status_type_price "
+        "ON services (status, service_type_id, price)",
+        # get_services(telegram_id=...): WHERE user_id = ? ORDER BY created_at
+        "CREATE INDEX IF NOT EXISTS idx_services_user_created "
+        "ON services (user_id, created_at)",
+        # get_ban_info / ban_entity / unban_entity: WHERE type = ? AND accused_... = ?
+        "CREATE INDEX IF NOT EXISTS idx_banned_types_type_user "
+        "ON banned_types (type, accused_telegram_id)",
+        "CREATE INDEX IF NOT EXISTS idx_banned_types_type_service "
+        "ON banned_types (type, accused_service_id)",
+        # get_complaints: WHERE creator/accused = ? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_complaints_creator_created "
+        "ON complaints (creator_telegram_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_complaints_accused_created "
+        "ON complaints (accused_telegram_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_complaints_service_created "
+        "ON complaints (accused_service_id, created_at)",
+        # get_service_type_fields: WHERE service_type_id = ? ORDER BY order_position
+        "CREATE INDEX IF NOT EXISTS idx_service_type_fields_type_position "
+        "ON service_type_fields (service_type_id, order_position)",
+    ]),
+    Migration(2, "Полнотекстовый индекс по названию и описанию услуг", [
+        # rowid индекса совпадает с services.id. unicode61 приводит к нижнему
+        # регистру любые буквы (в том числе кириллицу) и убирает диакритику
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+            title,
+            description,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS services_fts_insert AFTER INSERT ON services
+        BEGIN
+            INSERT INTO services_fts (rowid, title, description)
+            VALUES (new.id, {_fts_title('new')}, {_fts_description('new')});
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_fts_delete AFTER DELETE ON services
+        BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS services_fts_update AFTER UPDATE OF title, custom_fields ON services
+        BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+            INSERT INTO services_fts (rowid, title, description)
+            VALUES (new.id, {_fts_title('new')}, {_fts_description('new')});
+        END
+        """,
+        f"""
+        INSERT INTO services_fts (rowid, title, description)
+        SELECT id, {_fts_title('services')}, {_fts_description('services')} FROM services
+        """,
+    ]),
+    Migration(3, "Таблица значений дополнительных полей услуг", [
+        # Одна строка на значение поля (для multiselect - на каждый вариант).
+        # Текст хранится в нижнем регистре, числа и даты (номер дня) - в value_num
+        """
+        CREATE TABLE IF NOT EXISTS service_attributes (
+            service_id INTEGER NOT NULL,
+            service_type_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            value_text TEXT,
+            value_num REAL,
+            FOREIGN KEY (service_id) REFERENCES services(id)
+        )
+        """,
+        # filter_services: service_type_id = ? AND name = ? AND value_text IN (...) / value_num BETWEEN
+        "CREATE INDEX IF NOT EXISTS idx_service_attributes_text "
+        "ON service_attributes (service_type_id, name, value_text, service_id)",
+        "CREATE INDEX IF NOT EXISTS idx_service_attributes_num "
+        "ON service_attributes (service_type_id, name, value_num, service_id)",
+        # Перезапись значений при обновлении услуги
+        "CREATE INDEX IF NOT EXISTS idx_service_attributes_service "
+        "ON service_attributes (service_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS service_attributes_delete AFTER DELETE ON services
+        BEGIN
+            DELETE FROM service_attributes WHERE service_id = old.id;
+        END
+        """,
+        _backfill_service_attributes,
+    ]),
+    Migration(4, "Счетчики профиля пользователя", [
+        # Одна строка на пользователя (ключ - telegram_id), обновляется триггерами.
+        # complaints_received/sent копятся за все время, complaints_pending -
+        # жалобы на пользователя, которые еще не разобраны (не удалены)
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            telegram_id TEXT PRIMARY KEY,
+            complaints_received INTEGER NOT NULL DEFAULT 0,
+            complaints_sent INTEGER NOT NULL DEFAULT 0,
+            complaints_pending INTEGER NOT NULL DEFAULT 0,
+            active_services INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_complaint_insert AFTER INSERT ON complaints
+        BEGIN
+            INSERT INTO user_stats (telegram_id, complaints_sent)
+            VALUES (new.creator_telegram_id, 1)
+            ON CONFLICT (telegram_id) DO UPDATE SET complaints_sent = complaints_sent + 1;
+
+            INSERT INTO user_stats (telegram_id, complaints_received, complaints_pending)
+            SELECT new.accused_telegram_id, 1, 1 WHERE new.accused_telegram_id IS NOT NULL
+            ON CONFLICT (telegram_id) DO UPDATE SET
+                complaints_received = complaints_received + 1,
+                complaints_pending = complaints_pending + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_complaint_delete AFTER DELETE ON complaints
+        WHEN old.accused_telegram_id IS NOT NULL
+        BEGIN
+            UPDATE user_stats SET complaints_pending = MAX(complaints_pending - 1, 0)
+            WHERE telegram_id = old.accused_telegram_id;
+        END
+        """,
+        # services.user_id хранит telegram_id продавца
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_service_insert AFTER INSERT ON services
+        WHEN new.status = 'active'
+        BEGIN
+            INSERT INTO user_stats (telegram_id, active_services)
+            VALUES (CAST(new.user_id AS TEXT), 1)
+            ON CONFLICT (telegram_id) DO UPDATE SET active_services = active_services + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_service_update AFTER UPDATE OF status, user_id ON services
+        WHEN (old.status IS 'active') != (new.status IS 'active') OR old.user_id IS NOT new.user_id
+        BEGIN
+            UPDATE user_stats SET active_services = MAX(active_services - 1, 0)
+            WHERE old.status = 'active' AND telegram_id = CAST(old.user_id AS TEXT);
+
+            INSERT INTO user_stats (telegram_id, active_services)
+            SELECT CAST(new.user_id AS TEXT), 1 WHERE new.status = 'active'
+            ON CONFLICT (telegram_id) DO UPDATE SET active_services = active_services + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_service_delete AFTER DELETE ON services
+        WHEN old.status = 'active'
+        BEGIN
+            UPDATE user_stats SET active_services = MAX(active_services - 1, 0)
+            WHERE telegram_id = CAST(old.user_id AS TEXT);
+        END
+        """,
+        # Заполнение по текущим данным (история удаленных жалоб не сохранилась)
+        """
+        INSERT INTO user_stats (telegram_id, complaints_received, complaints_sent, complaints_pending, active_services)
+        SELECT telegram_id, SUM(received), SUM(sent), SUM(received), SUM(active)
+        FROM (
+            SELECT accused_telegram_id AS telegram_id, COUNT(*) AS received, 0 AS sent, 0 AS active
+            FROM complaints WHERE accused_telegram_id IS NOT NULL GROUP BY accused_telegram_id
+            UNION ALL
+            SELECT creator_telegram_id, 0, COUNT(*), 0
+            FROM complaints GROUP BY creator_telegram_id
+            UNION ALL
+            SELECT CAST(user_id AS TEXT), 0, 0, COUNT(*)
+            FROM services WHERE status = 'active' GROUP BY user_id
+        )
+        GROUP BY telegram_id
+        """,
+    ]),
+    Migration(5, "Рабочее время продавцов в минутах недели", [
+        # Интервалы [start_minute, end_minute) от понедельника 00:00, см. utils.seller_hours.
+        # seller_id - telegram_id продавца числом, как services.user_id
+        """
+        CREATE TABLE IF NOT EXISTS seller_hours (
+            seller_id INTEGER NOT NULL,
+            start_minute INTEGER NOT NULL,
+            end_minute INTEGER NOT NULL
+        )
+        """,
+        # "Кто работает сейчас": start_minute <= ? AND end_minute > ?
+        "CREATE INDEX IF NOT EXISTS idx_seller_hours_open "
+        "ON seller_hours (start_minute, end_minute, seller_id)",
+        "CREATE INDEX IF NOT EXISTS idx_seller_hours_seller ON seller_hours (seller_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS seller_hours_user_delete AFTER DELETE ON users
+        BEGIN
+            DELETE FROM seller_hours WHERE seller_id = CAST(old.telegram_id AS INTEGER);
+        END
+        """,
+        _backfill_seller_hours,
+    ]),
+    Migration(6, "Счетчики активных услуг по типу, городу, району и цене", [
+        # Одна строка на сочетание (тип, город, район, цена) с числом активных услуг.
+        # Таблица намного меньше services и читается целиком в кэш фасетов
+        """
+        CREATE TABLE IF NOT EXISTS service_facets (
+            service_type_id INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            district TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            services INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (service_type_id, city, district, price)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS service_facets_insert AFTER INSERT ON services
+        WHEN new.status = 'active'
+        BEGIN
+            INSERT INTO service_facets (service_type_id, city, district, price, services)
+            VALUES (new.service_type_id, new.city, new.district, new.price, 1)
+            ON CONFLICT (service_type_id, city, district, price) DO UPDATE SET services = services + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS service_facets_update
+        AFTER UPDATE OF status, service_type_id, city, district, price ON services
+        WHEN old.status IS 'active' OR new.status IS 'active'
+        BEGIN
+            UPDATE service_facets SET services = services - 1
+            WHERE old.status = 'active' AND service_type_id = old.service_type_id
+            AND city = old.city AND district = old.district AND price = old.price;
+
+            INSERT INTO service_facets (service_type_id, city, district, price, services)
+            SELECT new.service_type_id, new.city, new.district, new.price, 1 WHERE new.status = 'active'
+            ON CONFLICT (service_type_id, city, district, price) DO UPDATE SET services = services + 1;
+
+            DELETE FROM service_facets
+            WHERE services <= 0 AND service_type_id = old.service_type_id
+            AND city = old.city AND district = old.district AND price = old.price;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS service_facets_delete AFTER DELETE ON services
+        WHEN old.status = 'active'
+        BEGIN
+            UPDATE service_facets SET services = services - 1
+            WHERE service_type_id = old.service_type_id
+            AND city = old.city AND district = old.district AND price = old.price;
+
+            DELETE FROM service_facets
+            WHERE services <= 0 AND service_type_id = old.service_type_id
+            AND city = old.city AND district = old.district AND price = old.price;
+        END
+        """,
+        """
+        INSERT INTO service_facets (service_type_id, city, district, price, services)
+        SELECT service_type_id, city, district, price, COUNT(*)
+        FROM services WHERE status = 'active'
+        GROUP BY service_type_id, city, district, price
+        """,
+    ]),
+    Migration(7, "Координаты услуг и пространственный индекс", [
+        "ALTER TABLE services ADD COLUMN latitude REAL",
+        "ALTER TABLE services ADD COLUMN longitude REAL",
+        # R*Tree по точкам услуг (min = max): поиск в прямоугольнике вокруг пользователя.
+        # Индекс хранит координаты float32 с округлением наружу, точное расстояние
+        # проверяется в запросе по services.latitude/longitude
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS services_geo USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_geo_insert AFTER INSERT ON services
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO services_geo (id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_geo_update AFTER UPDATE OF latitude, longitude ON services
+        BEGIN
+            DELETE FROM services_geo WHERE id = old.id;
+            INSERT INTO services_geo (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS services_geo_delete AFTER DELETE ON services
+        BEGIN
+            DELETE FROM services_geo WHERE id = old.id;
+        END
+        """,
+        _backfill_service_coordinates,
+    ]),
+    Migration(8, "Оценка услуг для сортировки по релевантности", [
+        # Формула и пересчет - в utils.ranking
+        "ALTER TABLE services ADD COLUMN rank_score REAL NOT NULL DEFAULT 0",
+        # filter_services(sort_by='relevance'): WHERE status = ? AND service_type_id = ? ORDER BY rank_score
+        "CREATE INDEX IF NOT EXISTS idx_services_status_type_rank "
+        "ON services (status, service_type_id, rank_score)",
+        refresh_rank_scores,
+    ]),
+    Migration(9, "Значения полей в полнотекстовом индексе и словарь для нечеткого поиска", [
+        # services_fts пересоздается с колонкой attributes: поиск находит и значения полей
+        "DROP TRIGGER IF EXISTS services_fts_insert",
+        "DROP TRIGGER IF EXISTS services_fts_delete",
+        "DROP TRIGGER IF EXISTS services_fts_update",
+        "DROP TABLE IF EXISTS services_fts",
+        """
+        CREATE VIRTUAL TABLE services_fts USING fts5(
+            title,
+            description,
+            attributes,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER services_fts_insert AFTER INSERT ON services
+        BEGIN
+            INSERT INTO services_fts (rowid, title, description, attributes)
+            VALUES (new.id, {_fts_title('new')}, {_fts_description('new')}, {_fts_attributes('new')});
+        END
+        """,
+        """
+        CREATE TRIGGER services_fts_delete AFTER DELETE ON services
+        BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER services_fts_update AFTER UPDATE OF title, custom_fields ON services
+        BEGIN
+            DELETE FROM services_fts WHERE rowid = old.id;
+            INSERT INTO services_fts (rowid, title, description, attributes)
+            VALUES (new.id, {_fts_title('new')}, {_fts_description('new')}, {_fts_attributes('new')});
+        END
+        """,
+        f"""
+        INSERT INTO services_fts (rowid, title, description, attributes)
+        SELECT id, {_fts_title('services')}, {_fts_description('services')}, {_fts_attributes('services')}
+        FROM services
+        """,
+        # Слова индекса с числом документов - источник для пересборки словаря
+        "CREATE VIRTUAL TABLE IF NOT EXISTS services_fts_terms USING fts5vocab(services_fts, 'row')",
+        # Словарь основ слов и инвертированный индекс триграмм, см. utils.search_index
+        "CREATE TABLE IF NOT EXISTS search_terms (stem TEXT PRIMARY KEY) WITHOUT ROWID",
+        """
+        CREATE TABLE IF NOT EXISTS search_trigrams (
+            trigram TEXT NOT NULL,
+            stem TEXT NOT NULL,
+            PRIMARY KEY (trigram, stem)
+        ) WITHOUT ROWID
+        """,
+        rebuild_search_terms,
+    ]),
+    Migration(10, "Сохраненные поиски и индекс их условий", [
+        # Фильтры поиска в тех же единицах, что и в filter_services; city - в нижнем регистре.
+        # predicates - число условий, записанных в saved_search_terms (см. utils.saved_search)
+        """
+        CREATE TABLE IF NOT EXISTS saved_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id TEXT NOT NULL,
+            service_type_id INTEGER NOT NULL,
+            city TEXT,
+            price_min REAL,
+            price_max REAL,
+            custom_fields TEXT,
+            predicates INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_saved_searches_user ON saved_searches (telegram_id, created_at)",
+        # Инвертированный индекс: термин условия -> сохраненные поиски
+        """
+        CREATE TABLE IF NOT EXISTS saved_search_terms (
+            term TEXT NOT NULL,
+            search_id INTEGER NOT NULL,
+            predicate INTEGER NOT NULL,
+            PRIMARY KEY (term, search_id, predicate)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_saved_search_terms_search ON saved_search_terms (search_id)",
+        # Уже отправленные уведомления: услуга, включенная повторно, не приходит дважды
+        """
+        CREATE TABLE IF NOT EXISTS saved_search_hits (
+            search_id INTEGER NOT NULL,
+            service_id INTEGER NOT NULL,
+            PRIMARY KEY (search_id, service_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_saved_search_hits_service ON saved_search_hits (service_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS saved_searches_delete AFTER DELETE ON saved_searches
+        BEGIN
+            DELETE FROM saved_search_terms WHERE search_id = old.id;
+            DELETE FROM saved_search_hits WHERE search_id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS saved_searches_user_delete AFTER DELETE ON users
+        BEGIN
+            DELETE FROM saved_searches WHERE telegram_id = old.telegram_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS saved_search_hits_service_delete AFTER DELETE ON services
+        BEGIN
+            DELETE FROM saved_search_hits WHERE service_id = old.id;
+        END
+        """,
+    ]),
+    Migration(11, "Хранилище состояний FSM", [
+        # key - ключ StorageKey (utils.fsm_storage), data - компактный JSON данных состояния.
+        # expires_at - unix-время, после которого запись удаляется фоновой очисткой
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            expires_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires ON fsm_storage (expires_at)",
+    ]),
+    Migration(12, "Текст поиска и поиск рядом в сохраненных поисках, город по подстроке", [
+        # Условия списка услуг, которые проверяются у кандидатов (см. claim_saved_search_matches)
+        "ALTER TABLE saved_searches ADD COLUMN search_text TEXT",
+        "ALTER TABLE saved_searches ADD COLUMN latitude REAL",
+        "ALTER TABLE saved_searches ADD COLUMN longitude REAL",
+        "ALTER TABLE saved_searches ADD COLUMN radius_km REAL",
+        # Город, как и в filter_services, совпадает по подстроке - точные термины города
+        # больше не пишутся в индекс
+        """
+        DELETE FROM saved_search_terms
+        WHERE EXISTS (
+            SELECT 1 FROM saved_searches ss
+            WHERE ss.id = saved_search_terms.search_id
+            AND ss.city IS NOT NULL AND ss.city != ''
+            AND saved_search_terms.term = ss.service_type_id || ':city:' || ss.city
+        )
+        """,
+        "UPDATE saved_searches SET predicates = predicates - 1 WHERE city IS NOT NULL AND city != ''",
+        # Поиск, у которого не осталось условий в индексе, находится по термину "тип:*"
+        """
+        INSERT OR IGNORE INTO saved_search_terms (term, search_id, predicate)
+        SELECT service_type_id || ':*', id, 0 FROM saved_searches WHERE predicates = 0
+        """,
+        "UPDATE saved_searches SET predicates = 1 WHERE predicates = 0",
+    ]),
+    Migration(13, "Счетчики жалоб профиля по существующим жалобам", [
+        # Как и до счетчиков, в профиле считаются только неудаленные жалобы:
+        # complaints_received/sent больше не копятся за все время (см. миграцию 4),
+        # удаление жалобы уменьшает и полученные, и отправленные
+        "DROP TRIGGER IF EXISTS user_stats_complaint_delete",
+        """
+        CREATE TRIGGER IF NOT EXISTS user_stats_complaint_delete AFTER DELETE ON complaints
+        BEGIN
+            UPDATE user_stats SET complaints_sent = MAX(complaints_sent - 1, 0)
+            WHERE telegram_id = old.creator_telegram_id;
+
+            UPDATE user_stats SET
+                complaints_received = MAX(complaints_received - 1, 0),
+                complaints_pending = MAX(complaints_pending - 1, 0)
+            WHERE old.accused_telegram_id IS NOT NULL AND telegram_id = old.accused_telegram_id;
+        END
+        """,
+        # Пересчет счетчиков, накопленных с учетом уже удаленных жалоб
+        """
+        UPDATE user_stats SET
+            complaints_received = (
+                SELECT COUNT(*) FROM complaints WHERE accused_telegram_id = user_stats.telegram_id
+            ),
+            complaints_sent = (
+                SELECT COUNT(*) FROM complaints WHERE creator_telegram_id = user_stats.telegram_id
+            ),
+            complaints_pending = (
+                SELECT COUNT(*) FROM complaints WHERE accused_telegram_id = user_stats.telegram_id
+            )
+        """,
+    ]),
+]
+
+
+def get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """Возвращает номер последней примененной миграции (0 для новой базы)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(connection: sqlite3.Connection) -> int:
+    """Применяет все еще не примененные миграции
+    Args:
+        connection: Соединение с базой данных
+    Returns:
+        Номер версии схемы после применения миграций
+    """
+    cursor = connection.cursor()
+    current_version = get_schema_version(cursor)
+    connection.commit()
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version <= current_version:
+            continue
+
+        # Каждая миграция выполняется в отдельной транзакции
+        try:
+            cursor.execute("BEGIN")
+            for step in migration.steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration.version, migration.description)
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+        current_version = migration.version
+        print(f"Применена миграция {migration.version}: {migration.description}")
+
+    return current_version
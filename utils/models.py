@@ -0,0 +1,25 @@
+from typing import NamedTuple, Optional, Sequence
+
+
+class User(NamedTuple):
+    """Строка таблицы users
+
+    Остается кортежем, поэтому код, который обращается к полям
+    по индексу (user[1], user[4]), продолжает работать
+    """
+    id: int
+    telegram_id: str
+    username: Optional[str]
+    number_phone: Optional[str]
+    is_seller: bool
+    full_name: Optional[str]
+    work_time_start: Optional[str]
+    work_time_end: Optional[str]
+    work_days: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: Optional[Sequence]) -> Optional['User']:
+        """Строит User из результата get_user"""
+        if row is None:
+            return None
+        return cls(*row[:len(cls._fields)])
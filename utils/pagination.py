@@ -0,0 +1,58 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Ключ сортировки: (SQL-выражение, направление 'ASC'/'DESC')
+SortKey = Tuple[str, str]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Упаковывает значения ключей сортировки последней записи в непрозрачную строку"""
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> Optional[List[Any]]:
+    """Распаковывает курсор
+    Args:
+        cursor: Строка, полученная от encode_cursor
+        size: Ожидаемое количество ключей сортировки
+    Returns:
+        Список значений или None, если курсор поврежден или от другой сортировки
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def keyset_condition(keys: List[SortKey], values: List[Any]) -> Tuple[str, List[Any]]:
+    """Условие "строго после записи с такими ключами" для выбранного порядка сортировки
+
+    При одинаковом направлении всех ключей используется сравнение кортежей.
+    Нестрогое условие по первому ключу дублирует его, чтобы SQLite
+    начинал чтение индекса сразу с нужного места
+    """
+    directions = {direction for _, direction in keys}
+    if len(directions) == 1:
+        operator = '<' if directions.pop() == 'DESC' else '>'
+        expressions = ', '.join(expression for expression, _ in keys)
+        placeholders = ', '.join('?' * len(keys))
+        return (
+            f"{keys[0][0]} {operator}= ? AND ({expressions}) {operator} ({placeholders})",
+            [values[0], *values],
+        )
+
+    # Разные направления: (k1 > v1) OR (k1 = v1 AND k2 < v2) OR ...
+    alternatives = []
+    params: List[Any] = []
+    for i, (expression, direction) in enumerate(keys):
+        parts = [f"{prev_expression} = ?" for prev_expression, _ in keys[:i]]
+        parts.append(f"{expression} {'<' if direction == 'DESC' else '>'} ?")
+        alternatives.append(f"({' AND '.join(parts)})")
+        params.extend(values[:i + 1])
+    return f"({' OR '.join(alternatives)})", params
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.service_attributes import normalize_text
+
+# Кэш результатов filter_services
+#
+# Ключ - подпись фильтра: хэш канонического JSON аргументов. В нем не
+# различается то, что не влияет на результат: регистр и пробелы в тексте
+# поиска, порядок полей и вариантов, регистр сортировки, пустые фильтры и
+# явно переданные значения по умолчанию. В кэше хранится только порядок
+# найденных услуг - ID с курсором (и расстоянием при поиске рядом) - и
+# фасеты; строки услуг при попадании дочитываются по первичному ключу.
+# Запись живет TTL секунд, а пишущие методы услуг в AsyncDatabase
+# сбрасывают записи своего типа услуги и поиски по всем типам.
+
+# Время жизни записи: за это время в выдаче успевают измениться только
+# просмотры и, как следствие, порядок при сортировке по популярности
+QUERY_CACHE_TTL = 30.0
+
+
+class CachedQuery(NamedTuple):
+    # (ID услуги, курсор, расстояние или None) в порядке выдачи
+    rows: Tuple[Tuple[int, str, Optional[float]], ...]
+    facets: Optional[Dict[str, Any]]
+    service_type_id: Optional[int]
+    expires_at: float
+
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, (list, tuple, set)):
+        return sorted((_normalize_value(item) for item in value), key=repr)
+    if isinstance(value, dict):
+        return {str(key): _normalize_value(item) for key, item in value.items() if item not in (None, '', [])}
+    return value
+
+
+def filter_signature(arguments: Dict[str, Any]) -> str:
+    """Подпись фильтра по аргументам filter_services (со значениями по умолчанию)
+    Args:
+        arguments: Именованные аргументы вызова
+    Returns:
+        Хэш, одинаковый для фильтров, которые выбирают одни и те же услуги
+    """
+    canonical = {}
+    for name, value in arguments.items():
+        if value in (None, '', [], {}) or value is False:
+            continue
+        if name == 'search_text':
+            # Текст поиска разбивается на слова без учета регистра (см. utils.search_index)
+            value = ' '.join(normalize_text(value).split())
+        elif name in ('sort_by', 'status'):
+            value = str(value).lower()
+        elif name == 'sort_direction':
+            value = str(value).upper()
+        elif name in ('price_min', 'price_max', 'radius_km'):
+            value = float(value)
+        elif name == 'near':
+            value = [round(float(coordinate), 6) for coordinate in value]
+        elif name == 'custom_fields':
+            value = _normalize_value(value)
+            if not value:
+                continue
+        canonical[name] = value
+
+    if canonical.get('available_now'):
+        # Результат зависит от текущей минуты недели (рабочие часы продавцов)
+        now = datetime.now()
+        canonical['available_now'] = now.weekday() * 1440 + now.hour * 60 + now.minute
+
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    """LRU-кэш упорядоченных результатов filter_services с TTL
+
+    Поиск с фильтром по типу услуги сбрасывается только записью услуг этого
+    типа, поиск без типа - записью любой услуги. Как и в UserCache, результат,
+    прочитанный до сброса, не кэшируется (generation). Счетчики попаданий,
+    промахов, устаревших записей и сбросов доступны через stats().
+    """
+
+    def __init__(self, ttl: float = QUERY_CACHE_TTL, max_size: int = 2000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, CachedQuery]' = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, signature: str) -> Optional[CachedQuery]:
+        entry = self._entries.get(signature)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[signature]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(signature)
+        self.hits += 1
+        return entry
+
+    def put(self, signature: str, service_type_id: Optional[int], services: List[Dict],
+            facets: Optional[Dict[str, Any]], generation: int) -> None:
+        """Запоминает порядок услуг, если с начала запроса не было сбросов"""
+        if generation != self.generation:
+            return
+        rows = tuple((service['id'], service.get('cursor'), service.get('distance_km')) for service in services)
+        self._entries[signature] = CachedQuery(rows, facets, service_type_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(signature)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, signature: str) -> None:
+        self._entries.pop(signature, None)
+
+    def invalidate(self, service_type_id: Optional[int] = None) -> None:
+        """Сбрасывает поиски по типу услуги и по всем типам; без типа - весь кэш"""
+        self.generation += 1
+        self.invalidations += 1
+        if service_type_id is None:
+            self._entries.clear()
+            return
+        for signature in [signature for signature, entry in self._entries.items()
+                          if entry.service_type_id is None or entry.service_type_id == service_type_id]:
+            del self._entries[signature]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
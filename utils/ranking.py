@@ -0,0 +1,47 @@
+import math
+import sqlite3
+from typing import Iterable, Optional
+
+# Оценка услуги для sort_by='relevance' измеряется в днях:
+#   rank_score = дата создания в днях от RANK_EPOCH
+#              + VIEWS_WEIGHT * log2(1 + просмотры)
+#              - COMPLAINT_PENALTY * жалобы на услугу
+# Свежесть заложена в саму оценку (более новая услуга получает большее
+# число), поэтому оценки не нужно пересчитывать со временем: старая услуга
+# опускается, потому что новые появляются выше. Удвоение просмотров
+# поднимает услугу на VIEWS_WEIGHT дней - чтобы удержаться в выдаче,
+# услуга должна набирать просмотры быстрее, чем стареет.
+
+# 2024-01-01 00:00 UTC в юлианских днях (julianday() в SQLite)
+RANK_EPOCH = 2460310.5
+VIEWS_WEIGHT = 1.0
+COMPLAINT_PENALTY = 3.0
+
+
+def rank_score(created_julianday: Optional[float], views: Optional[int], complaints: int) -> float:
+    """Оценка услуги по дате создания (julianday), просмотрам и жалобам"""
+    age = (created_julianday or RANK_EPOCH) - RANK_EPOCH
+    return age + VIEWS_WEIGHT * math.log2(1 + max(views or 0, 0)) - COMPLAINT_PENALTY * complaints
+
+
+def refresh_rank_scores(cursor: sqlite3.Cursor, service_ids: Optional[Iterable[int]] = None) -> None:
+    """Пересчитывает rank_score услуг (всех, если service_ids не передан)
+    Вызывается в той же транзакции, что и изменение просмотров или жалоб
+    """
+    query = """
+        SELECT s.id, julianday(s.created_at), s.views,
+               (SELECT COUNT(*) FROM complaints c WHERE c.accused_service_id = s.id)
+        FROM services s
+    """
+    params = []
+    if service_ids is not None:
+        params = list(dict.fromkeys(int(service_id) for service_id in service_ids))
+        if not params:
+            return
+        query += f" WHERE s.id IN ({', '.join('?' * len(params))})"
+    cursor.execute(query, params)
+    cursor.executemany(
+        "UPDATE services SET rank_score = ? WHERE id = ?",
+        [(rank_score(created, views, complaints), service_id)
+         for service_id, created, views, complaints in cursor.fetchall()]
+    )
@@ -0,0 +1,86 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.service_attributes import NUMERIC_FIELD_TYPES, normalize_text, parse_range, resolve_options
+
+# Сохраненные поиски сопоставляются с новой услугой через инвертированный индекс
+# предикатов (saved_search_terms). Каждое условие поиска с точным значением -
+# варианты select/multiselect - записывается термином "тип:field:поле:вариант"
+# с номером условия; у поиска без таких условий есть один термин "тип:*". По
+# терминам новой услуги выбираются только поиски, у которых совпали все условия
+# (число разных номеров условий равно saved_searches.predicates). Диапазон цены
+# и город (по подстроке, как в filter_services) проверяются в том же запросе, а
+# диапазоны числовых полей, текстовые поля, текст поиска и радиус - у найденных
+# кандидатов.
+
+# Индексируемое условие: (термин, номер условия)
+SearchTerm = Tuple[str, int]
+
+
+def _term(service_type_id: int, *parts: Any) -> str:
+    return ':'.join([str(service_type_id), *(str(part) for part in parts)])
+
+
+def saved_search_terms(service_type_id: int, custom_fields: Dict[str, Any], fields: List[Dict]) -> List[SearchTerm]:
+    """Термины индекса для условий сохраненного поиска
+    Args:
+        service_type_id: ID типа услуги
+        custom_fields: Фильтры по дополнительным полям, как в filter_services
+        fields: Поля типа услуги (get_service_type_fields)
+    Returns:
+        Список (термин, номер условия); варианты одного поля - одно условие
+    """
+    terms: List[SearchTerm] = []
+    predicate = 0
+    fields_by_name = {field['name']: field for field in fields}
+    for name, value in (custom_fields or {}).items():
+        field = fields_by_name.get(name)
+        if field is None or field['field_type'] not in ('select', 'multiselect'):
+            continue
+        # Как и в filter_services, select в фильтре может содержать несколько вариантов
+        options = resolve_options({**field, 'field_type': 'multiselect'}, value)
+        if not options:
+            continue
+        terms.extend((_term(service_type_id, 'field', name, option), predicate) for option in options)
+        predicate += 1
+
+    return terms or [(_term(service_type_id, '*'), 0)]
+
+
+def service_terms(service_type_id: int, attributes: Iterable[Tuple[str, Optional[str]]]) -> List[str]:
+    """Термины услуги для поиска подходящих сохраненных поисков
+    Args:
+        attributes: Пары (имя поля, value_text) из service_attributes
+    """
+    terms = [_term(service_type_id, '*')]
+    terms.extend(_term(service_type_id, 'field', name, value) for name, value in attributes if value is not None)
+    return terms
+
+
+def matches_residual(custom_fields: Dict[str, Any], fields: List[Dict],
+                     attributes: Iterable[Tuple[str, Optional[str], Optional[float]]]) -> bool:
+    """Проверяет условия поиска, которых нет в индексе: диапазоны чисел и дат, подстроки текстовых полей
+    Args:
+        custom_fields: Фильтры сохраненного поиска
+        fields: Поля типа услуги
+        attributes: Строки (name, value_text, value_num) услуги из service_attributes
+    """
+    values: Dict[str, List[Tuple[Optional[str], Optional[float]]]] = {}
+    for name, value_text, value_num in attributes:
+        values.setdefault(name, []).append((value_text, value_num))
+
+    fields_by_name = {field['name']: field for field in fields}
+    for name, value in (custom_fields or {}).items():
+        field = fields_by_name.get(name)
+        if field is None or field['field_type'] in ('select', 'multiselect') or value in (None, '', []):
+            continue
+        if field['field_type'] in NUMERIC_FIELD_TYPES:
+            low, high = parse_range(field['field_type'], value)
+            if low is None and high is None:
+                continue
+            if not any(number is not None and (low is None or number >= low) and (high is None or number <= high)
+                       for _, number in values.get(name, [])):
+                return False
+        elif not any(text is not None and normalize_text(value) in text for text, _ in values.get(name, [])):
+            # Как и в filter_services, текстовое поле совпадает по подстроке
+            return False
+    return True
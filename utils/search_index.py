@@ -0,0 +1,133 @@
+import re
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Нечеткий поиск по словам услуг
+#
+# Полнотекстовый индекс services_fts находит документы, а этот модуль
+# решает, какие слова искать. Словарь основ (search_terms) и инвертированный
+# индекс триграмм (search_trigrams: триграмма -> основа) строятся по словам
+# названий, описаний и значений полей услуг. Слово запроса приводится к основе;
+# если такой основы в словаре нет, берутся основы с похожим набором триграмм
+# (опечатки: "маникур" -> "маникюр"). Затем каждая основа ищется в services_fts
+# по префиксу, что покрывает и окончания: "квартир"* находит "квартиры".
+# Размер словаря зависит от числа разных слов, а не от числа услуг, и
+# количество кандидатов на слово ограничено FUZZY_CANDIDATES.
+
+# Минимальная длина слова для нечеткого поиска (короткие слова ищутся только по префиксу)
+FUZZY_MIN_LENGTH = 4
+# Сколько основ с общими триграммами оценивать и сколько похожих основ искать
+FUZZY_CANDIDATES = 200
+FUZZY_MAX_STEMS = 5
+# Минимальное сходство основ по коэффициенту Дайса на триграммах
+FUZZY_MIN_SIMILARITY = 0.5
+
+# Окончания русских слов, от длинных к коротким (упрощенный стеммер)
+_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ией', 'ием',
+    'ться', 'тся', 'ешь', 'ете', 'ите', 'ить', 'ать', 'ять', 'еть', 'уть',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ых', 'их',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'ов', 'ев', 'ью', 'ия',
+    'ья', 'ии', 'ию', 'ть', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+}, key=len, reverse=True)
+_MIN_STEM_LENGTH = 3
+
+
+def normalize_word(word: str) -> str:
+    """Слово в том виде, в каком его хранит services_fts: нижний регистр, 'ё' заменена на 'е'"""
+    return word.casefold().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize_word(word) for word in re.findall(r'\w+', text or '')]
+
+
+def stem(word: str) -> str:
+    """Отбрасывает окончание русского слова, оставляя основу не короче трех букв"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с границами (' ма', 'ман', ...): начало слова весит больше"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def service_words(title: Optional[str], custom_fields: Optional[Dict[str, Any]]) -> Set[str]:
+    """Слова услуги, которые попадают в services_fts: название, описание и текстовые поля"""
+    texts = [title or '']
+    for value in (custom_fields or {}).values():
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, list):
+            texts.extend(item for item in value if isinstance(item, str))
+    return {word for text in texts for word in tokenize(text)}
+
+
+def index_search_terms(cursor: sqlite3.Cursor, words: Iterable[str]) -> None:
+    """Добавляет в словарь основы новых слов (уже известные основы пропускаются)"""
+    stems = {stem(word) for word in words if len(word) >= FUZZY_MIN_LENGTH and not word.isdigit()}
+    if not stems:
+        return
+    stems = list(stems)
+    known = set()
+    # Проверяем пачками, чтобы не упереться в лимит параметров запроса при пересборке
+    for start in range(0, len(stems), 500):
+        batch = stems[start:start + 500]
+        cursor.execute(f"SELECT stem FROM search_terms WHERE stem IN ({', '.join('?' * len(batch))})", batch)
+        known.update(row[0] for row in cursor.fetchall())
+    new_stems = [term for term in stems if term not in known]
+    cursor.executemany("INSERT OR IGNORE INTO search_terms (stem) VALUES (?)", [(term,) for term in new_stems])
+    cursor.executemany(
+        "INSERT OR IGNORE INTO search_trigrams (trigram, stem) VALUES (?, ?)",
+        [(trigram, term) for term in new_stems for trigram in trigrams(term)]
+    )
+
+
+def rebuild_search_terms(cursor: sqlite3.Cursor) -> None:
+    """Строит словарь заново по текущим словам services_fts
+
+    Основы удаленных и измененных услуг при обычной работе остаются в
+    словаре - это безопасно (такая основа просто ничего не находит),
+    а пересборка убирает их.
+    """
+    cursor.execute("DELETE FROM search_trigrams")
+    cursor.execute("DELETE FROM search_terms")
+    cursor.execute("SELECT term FROM services_fts_terms")
+    index_search_terms(cursor, [row[0] for row in cursor.fetchall()])
+
+
+def expand_search_word(cursor: sqlite3.Cursor, word: str) -> List[str]:
+    """Основы, которые нужно искать вместо слова запроса
+    Returns:
+        Основа самого слова и, если ее нет в словаре, до FUZZY_MAX_STEMS похожих основ
+    """
+    word_stem = stem(word)
+    if len(word) < FUZZY_MIN_LENGTH or word.isdigit():
+        return [word_stem]
+
+    cursor.execute("SELECT 1 FROM search_terms WHERE stem = ?", (word_stem,))
+    if cursor.fetchone():
+        return [word_stem]
+
+    word_trigrams = trigrams(word_stem)
+    # Основа с долей общих триграмм меньше порога не пройдет и по коэффициенту Дайса
+    min_shared = max(2, int(len(word_trigrams) * FUZZY_MIN_SIMILARITY / 2) + 1)
+    cursor.execute(f"""
+        SELECT stem, COUNT(*) AS shared FROM search_trigrams
+        WHERE trigram IN ({', '.join('?' * len(word_trigrams))})
+        GROUP BY stem HAVING shared >= ?
+        ORDER BY shared DESC LIMIT ?
+    """, [*word_trigrams, min_shared, FUZZY_CANDIDATES])
+
+    scored = []
+    for candidate, shared in cursor.fetchall():
+        similarity = 2 * shared / (len(word_trigrams) + len(trigrams(candidate)))
+        if similarity >= FUZZY_MIN_SIMILARITY:
+            scored.append((similarity, candidate))
+    scored.sort(reverse=True)
+    return [word_stem] + [candidate for _, candidate in scored[:FUZZY_MAX_STEMS]]
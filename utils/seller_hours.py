@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Полуоткрытый интервал рабочего времени в минутах от начала недели: [начало, конец)
+WorkInterval = Tuple[int, int]
+
+
+def minute_of_week(moment: Optional[datetime] = None) -> int:
+    """Минута недели (0 - понедельник 00:00) для момента по локальному времени бота"""
+    moment = moment or datetime.now()
+    return (moment.isoweekday() - 1) * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def _parse_minute(value: str) -> int:
+    hours, minutes = value.strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Некорректное время: {value}")
+    return hours * 60 + minutes
+
+
+def work_intervals(work_time_start: Optional[str], work_time_end: Optional[str],
+                   work_days: Optional[str]) -> List[WorkInterval]:
+    """Переводит график продавца в интервалы минут недели
+    Args:
+        work_time_start: Начало работы 'ЧЧ:ММ'
+        work_time_end: Конец работы 'ЧЧ:ММ' (включительно); если он раньше
+            начала, смена заканчивается на следующий день
+        work_days: Рабочие дни через запятую (1 - понедельник, 7 - воскресенье);
+            смена относится к дню, в который начинается
+    Returns:
+        Список интервалов [начало, конец). Если график не заполнен или
+        некорректен, продавец считается доступным всегда
+    """
+    if not (work_time_start and work_time_end and work_days):
+        return [(0, MINUTES_PER_WEEK)]
+    try:
+        start = _parse_minute(work_time_start)
+        # Конец включительно: 22:00 значит, что в 22:00 продавец еще работает
+        end = _parse_minute(work_time_end) + 1
+        days = {int(day) for day in work_days.split(',') if day.strip()}
+    except (ValueError, TypeError):
+        return [(0, MINUTES_PER_WEEK)]
+
+    intervals = []
+    for day in sorted(day for day in days if 1 <= day <= 7):
+        day_start = (day - 1) * MINUTES_PER_DAY
+        if end > start:
+            intervals.append((day_start + start, day_start + end))
+            continue
+        # Ночная смена: до конца дня и утро следующего (после воскресенья - понедельник)
+        intervals.append((day_start + start, day_start + MINUTES_PER_DAY))
+        if day == 7:
+            intervals.append((0, end))
+        else:
+            intervals.append((day_start + MINUTES_PER_DAY, day_start + MINUTES_PER_DAY + end))
+    return intervals
@@ -0,0 +1,130 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Строка таблицы service_attributes без service_id: (name, value_text, value_num)
+AttributeRow = Tuple[str, Optional[str], Optional[float]]
+
+NUMERIC_FIELD_TYPES = ('number', 'date')
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y')
+
+
+def normalize_text(value: Any) -> str:
+    """Текстовое значение для сравнения без учета регистра"""
+    return str(value).strip().casefold()
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Разбирает число из строки вида '1 500₽' или '2,5'"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    cleaned = re.sub(r'[^\d,.\-]', '', str(value)).replace(',', '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any) -> Optional[float]:
+    """Переводит дату в номер дня, чтобы даты можно было сравнивать как числа"""
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return float(datetime.strptime(text, date_format).toordinal())
+        except ValueError:
+            continue
+    return None
+
+
+def parse_numeric(field_type: str, value: Any) -> Optional[float]:
+    return parse_date(value) if field_type == 'date' else parse_number(value)
+
+
+def split_options(field: Dict) -> List[str]:
+    return [option.strip() for option in (field.get('item_for_select') or '').split(',') if option.strip()]
+
+
+def resolve_options(field: Dict, value: Any) -> List[str]:
+    """Значения select/multiselect в виде нормализованного текста вариантов
+
+    Форма может прислать как номер варианта, так и его текст,
+    поэтому номера переводятся в текст по списку вариантов поля
+    """
+    options = split_options(field)
+    if isinstance(value, (list, tuple)):
+        raw_values = value
+    else:
+        raw_values = str(value).split(',') if field['field_type'] == 'multiselect' else [value]
+
+    result = []
+    for raw in raw_values:
+        raw = str(raw).strip()
+        if not raw:
+            continue
+        if raw.isdigit() and int(raw) < len(options):
+            raw = options[int(raw)]
+        normalized = normalize_text(raw)
+        if normalized not in result:
+            result.append(normalized)
+    return result
+
+
+def build_attribute_rows(custom_fields: Dict[str, Any], fields: List[Dict]) -> List[AttributeRow]:
+    """Раскладывает дополнительные поля услуги в строки service_attributes
+    Args:
+        custom_fields: Дополнительные поля услуги
+        fields: Поля типа услуги (get_service_type_fields)
+    Returns:
+        Список строк (name, value_text, value_num); для multiselect -
+        по строке на каждый выбранный вариант
+    """
+    rows: List[AttributeRow] = []
+    if not isinstance(custom_fields, dict):
+        return rows
+
+    for field in fields:
+        value = custom_fields.get(field['name'])
+        if value is None or value == '':
+            continue
+
+        field_type = field['field_type']
+        if field_type in NUMERIC_FIELD_TYPES:
+            number = parse_numeric(field_type, value)
+            rows.append((field['name'], normalize_text(value), number))
+        elif field_type in ('select', 'multiselect'):
+            rows.extend((field['name'], option, None) for option in resolve_options(field, value))
+        else:
+            rows.append((field['name'], normalize_text(value), None))
+    return rows
+
+
+def parse_range(field_type: str, value: Any) -> Tuple[Optional[float], Optional[float]]:
+    """Разбирает диапазон фильтра: {'min': .., 'max': ..}, 'от X', 'до Y', 'X-Y' или одно значение
+    Returns:
+        (минимум, максимум); отсутствующая граница - None
+    """
+    if isinstance(value, dict):
+        low, high = value.get('min'), value.get('max')
+        return (
+            parse_numeric(field_type, low) if low not in (None, '') else None,
+            parse_numeric(field_type, high) if high not in (None, '') else None,
+        )
+
+    text = str(value).strip()
+    lowered = text.lower()
+    if lowered.startswith('от'):
+        return parse_numeric(field_type, text[2:]), None
+    if lowered.startswith('до'):
+        return None, parse_numeric(field_type, text[2:])
+    # Дефис у даты в формате ГГГГ-ММ-ДД не является разделителем диапазона
+    if field_type == 'number' and '-' in text.lstrip('-'):
+        low, high = text.lstrip('-').split('-', 1)
+        if text.startswith('-'):
+            low = '-' + low
+        return parse_number(low), parse_number(high)
+    if field_type == 'date' and ' - ' in text:
+        low, high = text.split(' - ', 1)
+        return parse_date(low), parse_date(high)
+
+    exact = parse_numeric(field_type, text)
+    return exact, exact
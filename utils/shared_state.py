@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
+
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from utils.fsm_storage import DEFAULT_STATE_TTL, SQLiteStorage
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+    from utils.async_database import AsyncDatabase
+
+# Общее состояние процессов бота
+#
+# Один процесс хранит состояния FSM в SQLite (SQLiteStorage), а счетчики
+# антифлуда - в памяти. Чтобы запустить несколько процессов, задается
+# переменная окружения REDIS_URL (например redis://localhost:6379/0): тогда
+# состояния FSM, счетчики антифлуда и сбросы кэшей AsyncDatabase идут через
+# Redis (или любой сервер с тем же протоколом). Для проверки без сервера
+# в redis_shared_state можно передать клиент fakeredis.aioredis.FakeRedis.
+
+# Префикс всех ключей и каналов бота в Redis
+REDIS_PREFIX = 'sellservices'
+# Пауза перед повторной подпиской на сбросы кэшей после обрыва соединения
+RESUBSCRIBE_DELAY = 5.0
+
+
+class LocalRateLimiter:
+    """Ограничение частоты событий в памяти процесса"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._timestamps: Dict[str, float] = {}
+
+    async def hit(self, key: str, interval: float) -> bool:
+        """Учитывает событие
+        Returns:
+            False, если предыдущее разрешенное событие было меньше interval секунд назад
+        """
+        now = time.monotonic()
+        last = self._timestamps.get(key)
+        if last is not None and now - last < interval:
+            return False
+        self._timestamps[key] = now
+        if len(self._timestamps) > self.max_size:
+            # Старые отметки уже ничего не ограничивают
+            self._timestamps = {k: t for k, t in self._timestamps.items() if now - t < interval}
+        return True
+
+
+class RedisRateLimiter:
+    """Ограничение частоты событий, общее для всех процессов: ключ с TTL в Redis"""
+
+    def __init__(self, redis: 'Redis', prefix: str = f"{REDIS_PREFIX}:flood"):
+        self._redis = redis
+        self.prefix = prefix
+
+    async def hit(self, key: str, interval: float) -> bool:
+        # SET NX создает ключ, только если его нет: успешен первый вызов за interval
+        try:
+            return bool(await self._redis.set(
+                f"{self.prefix}:{key}", 1, px=max(1, int(interval * 1000)), nx=True
+            ))
+        except Exception as e:
+            # Без Redis антифлуд пропускает сообщения, а не блокирует бота
+            print(f"Ошибка антифлуда в Redis: {e}")
+            return True
+
+
+class RedisInvalidationBus:
+    """Рассылка изменений кэшей AsyncDatabase между процессами через Redis Pub/Sub
+
+    Каждый процесс публикует вызовы из SHARED_CACHE_CALLS после фиксации
+    своих записей и применяет вызовы остальных процессов. Сообщения,
+    пропущенные во время обрыва соединения, восполняются полным сбросом
+    кэшей после повторной подписки.
+    """
+
+    def __init__(self, redis: 'Redis', channel: str = f"{REDIS_PREFIX}:cache"):
+        self._redis = redis
+        self.channel = channel
+        # Отличает свои сообщения от сообщений других процессов
+        self.origin = uuid.uuid4().hex
+        self._db: Optional['AsyncDatabase'] = None
+        self._listener: Optional[asyncio.Task] = None
+        # Рассылки и перечитывание реестра блокировок, которых close() дожидается
+        self._pending: Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def start(self, db: 'AsyncDatabase') -> None:
+        self._db = db
+        db.invalidation_bus = self
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    def publish(self, cache: str, method: str, args: Any) -> None:
+        if self._closed:
+            return
+        message = json.dumps(
+            {'origin': self.origin, 'cache': cache, 'method': method, 'args': list(args)},
+            ensure_ascii=False, default=str
+        )
+        self._track(asyncio.create_task(self._publish(message)))
+
+    def _track(self, task: asyncio.Task) -> None:
+        # Ссылка на задачу нужна, чтобы ее не собрал сборщик мусора до завершения
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish(self, message: str) -> None:
+        try:
+            await self._redis.publish(self.channel, message)
+        except Exception as e:
+            print(f"Ошибка при рассылке сброса кэша: {e}")
+
+    async def _listen(self, pubsub) -> None:
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._apply(message['data'])
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                if self._closed:
+                    return
+                print(f"Ошибка подписки на сбросы кэшей: {e}")
+
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+            try:
+                await pubsub.aclose()
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                self._reset_caches()
+            except Exception as e:
+                print(f"Ошибка повторной подписки на сбросы кэшей: {e}")
+
+    def _apply(self, data: Any) -> None:
+        try:
+            message = json.loads(data)
+            if message.get('origin') != self.origin:
+                self._db.apply_remote_invalidation(message['cache'], message['method'], message.get('args') or [])
+        except Exception as e:
+            print(f"Ошибка при применении сброса кэша: {e}")
+
+    def _reset_caches(self) -> None:
+        """Сбрасывает кэши целиком: пока не было подписки, сообщения могли потеряться"""
+        for cache in ('catalog', 'facets', 'queries', 'users'):
+            getattr(self._db, cache).invalidate()
+        # Реестр блокировок перечитывается в фоне
+        self._track(asyncio.create_task(self._db.bans.load()))
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+
+class SharedState:
+    """Хранилище FSM, ограничение частоты сообщений и рассылка сбросов кэшей
+
+    Создается до диспетчера (storage передается в Dispatcher), а
+    подключается к базе в main() через start(db).
+    """
+
+    def __init__(self, storage: BaseStorage, rate_limiter, invalidation_bus: Optional[RedisInvalidationBus] = None,
+                 redis: Optional['Redis'] = None):
+        self.storage = storage
+        self.rate_limiter = rate_limiter
+        self.invalidation_bus = invalidation_bus
+        self._redis = redis
+
+    async def start(self, db: 'AsyncDatabase') -> None:
+        if isinstance(self.storage, SQLiteStorage):
+            await self.storage.start(db)
+        if self.invalidation_bus is not None:
+            await self.invalidation_bus.start(db)
+
+    async def close(self) -> None:
+        """Записывает несохраненные состояния и закрывает соединения (до закрытия базы)"""
+        if self.invalidation_bus is not None:
+            await self.invalidation_bus.close()
+        if isinstance(self.storage, SQLiteStorage):
+            await self.storage.close()
+        elif self._redis is not None:
+            await self._redis.aclose()
+
+
+def redis_shared_state(redis: 'Redis', state_ttl: int = DEFAULT_STATE_TTL) -> SharedState:
+    """Общее состояние в Redis
+    Args:
+        redis: Клиент redis.asyncio (или совместимый, например fakeredis.aioredis.FakeRedis)
+        state_ttl: Время жизни состояния FSM в секундах от последнего изменения
+    """
+    from aiogram.fsm.storage.redis import RedisStorage
+
+    storage = RedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(prefix=f"{REDIS_PREFIX}:fsm", with_bot_id=True, with_destiny=True),
+        state_ttl=state_ttl,
+        data_ttl=state_ttl
+    )
+    return SharedState(storage, RedisRateLimiter(redis), RedisInvalidationBus(redis), redis)
+
+
+def create_shared_state(redis_url: Optional[str] = None,
+                        state_ttl: Optional[Dict[str, int]] = None) -> SharedState:
+    """Общее состояние по настройке REDIS_URL
+    Args:
+        redis_url: Адрес Redis; по умолчанию переменная окружения REDIS_URL
+        state_ttl: Время жизни состояний FSM по имени состояния или группы (только для SQLite;
+            в Redis у всех состояний время жизни по умолчанию)
+    Returns:
+        Redis, если адрес задан, иначе SQLite и память процесса
+    """
+    redis_url = redis_url or os.getenv("REDIS_URL")
+    if not redis_url:
+        return SharedState(SQLiteStorage(state_ttl=state_ttl), LocalRateLimiter())
+
+    try:
+        from redis.asyncio import Redis
+    except ImportError:
+        raise RuntimeError("Для работы с REDIS_URL установите пакет redis (pip install redis)")
+    return redis_shared_state(Redis.from_url(redis_url))
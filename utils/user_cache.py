@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Ключ поиска пользователя: ('id' | 'telegram_id' | 'username', значение)
+UserKey = Tuple[str, Any]
+
+
+def user_key(user_id: Optional[int] = None, telegram_id: Optional[str] = None,
+             username: Optional[str] = None) -> Optional[UserKey]:
+    """Ключ кэша для аргументов get_user (с тем же приоритетом, что и в запросе)"""
+    if user_id is not None:
+        try:
+            return 'id', int(user_id)
+        except (TypeError, ValueError):
+            return None
+    if telegram_id is not None:
+        # telegram_id хранится текстом, но часто передается числом
+        return 'telegram_id', str(telegram_id)
+    if username is not None:
+        return 'username', username
+    return None
+
+
+class UserCache:
+    """LRU-кэш строк таблицы users
+
+    Строка хранится один раз (по id) и находится по id, telegram_id и
+    username. Пишущие методы пользователей в AsyncDatabase сбрасывают
+    затронутую строку после фиксации. Отсутствующие пользователи не
+    кэшируются. Счетчики hits/misses/evictions доступны через stats(),
+    чтобы подобрать max_size по реальной нагрузке.
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._rows: 'OrderedDict[int, Tuple]' = OrderedDict()
+        self._aliases: Dict[UserKey, int] = {}
+        # Увеличивается при каждом сбросе: строку, прочитанную до сброса, не кэшируем
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: UserKey) -> Optional[Tuple]:
+        user_id = key[1] if key[0] == 'id' else self._aliases.get(key)
+        row = self._rows.get(user_id) if user_id is not None else None
+        if row is None:
+            self.misses += 1
+            return None
+        self._rows.move_to_end(user_id)
+        self.hits += 1
+        return row
+
+    def put(self, row: Tuple, generation: int) -> None:
+        """Кэширует строку, если с момента начала ее чтения не было сбросов"""
+        if generation != self.generation:
+            return
+        self._drop(row[0])
+        self._rows[row[0]] = row
+        for key in self._row_keys(row):
+            self._aliases[key] = row[0]
+        while len(self._rows) > self.max_size:
+            _, evicted = self._rows.popitem(last=False)
+            self._drop_aliases(evicted)
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[UserKey] = None) -> None:
+        """Сбрасывает строку по ключу или весь кэш, если ключ неизвестен"""
+        self.generation += 1
+        if key is None:
+            self._rows.clear()
+            self._aliases.clear()
+            return
+        user_id = key[1] if key[0] == 'id' else self._aliases.get(key)
+        if user_id is not None:
+            self._drop(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._rows),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    @staticmethod
+    def _row_keys(row: Tuple):
+        yield 'telegram_id', str(row[1])
+        if row[2] is not None:
+            yield 'username', row[2]
+
+    def _drop(self, user_id: int) -> None:
+        row = self._rows.pop(user_id, None)
+        if row is not None:
+            self._drop_aliases(row)
+
+    def _drop_aliases(self, row: Tuple) -> None:
+        for key in self._row_keys(row):
+            # Username может совпадать у разных строк - удаляем только свою ссылку
+            if self._aliases.get(key) == row[0]:
+                del self._aliases[key]
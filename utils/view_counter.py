@@ -0,0 +1,106 @@
+import asyncio
+import functools
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+
+class ViewCounter:
+    """Накопитель просмотров услуг с отложенной записью в базу
+
+    Просмотры складываются в памяти по service_id и записываются одной
+    транзакцией: по таймеру, при накоплении max_pending разных услуг
+    и при остановке бота. Пока приращения не записаны, их нужно
+    прибавлять к прочитанному из базы значению (см. apply). Записываемая
+    пачка перестает учитываться в момент фиксации (callback on_commit
+    выполняется в потоке писателя), а не когда запись вернет результат:
+    иначе прочитанные между этими моментами просмотры учитывались бы дважды.
+    """
+
+    def __init__(self, flush_callback: Callable[[Dict[int, int], Callable[[], None]], Awaitable[bool]],
+                 interval: float = 10.0, max_pending: int = 500):
+        """
+        Args:
+            flush_callback: Записывает словарь {service_id: приращение} и вызывает
+                переданный callback сразу после фиксации, возвращает успешность
+            interval: Период записи в секундах
+            max_pending: Количество услуг в буфере, при котором запись начинается сразу
+        """
+        self._flush_callback = flush_callback
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, int] = defaultdict(int)
+        # Приращения, которые сейчас записываются: они еще не видны в базе
+        self._in_flight: Dict[int, int] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        # Будит таймер раньше срока, когда буфер заполнен
+        self._wakeup = asyncio.Event()
+        self._closed = False
+
+    def add(self, service_id: int, count: int = 1) -> None:
+        """Учитывает просмотр услуги"""
+        if self._closed:
+            return
+        self._pending[service_id] += count
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, service_id: int) -> int:
+        """Количество еще не записанных в базу просмотров услуги"""
+        return self._pending.get(service_id, 0) + self._in_flight.get(service_id, 0)
+
+    def apply(self, services: Union[Dict, List[Dict], None]) -> Union[Dict, List[Dict], None]:
+        """Добавляет незаписанные просмотры к полю views услуг, прочитанных из базы"""
+        items = services if isinstance(services, list) else [services]
+        for service in items:
+            if isinstance(service, dict) and 'id' in service and 'views' in service:
+                service['views'] = (service['views'] or 0) + self.pending(service['id'])
+        return services
+
+    async def flush(self) -> bool:
+        """Записывает накопленные просмотры одной транзакцией"""
+        async with self._lock:
+            if not self._pending:
+                return True
+            batch, self._pending = dict(self._pending), defaultdict(int)
+            self._in_flight = batch
+            try:
+                success = await self._flush_callback(batch, functools.partial(self._committed, batch))
+            except Exception as e:
+                print(f"Ошибка при записи просмотров: {e}")
+                success = False
+            if not success and self._in_flight is batch:
+                # Возвращаем приращения в буфер, чтобы записать их в следующий раз
+                for service_id, count in batch.items():
+                    self._pending[service_id] += count
+            self._in_flight = {}
+            return success
+
+    def _committed(self, batch: Dict[int, int]) -> None:
+        """Пачка зафиксирована и уже видна в базе (вызывается из потока писателя)"""
+        if self._in_flight is batch:
+            self._in_flight = {}
+
+    async def _run_timer(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Остановка таймера не должна прерывать уже начатую запись
+            await asyncio.shield(self.flush())
+
+    async def close(self) -> None:
+        """Останавливает таймер и записывает оставшиеся просмотры"""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()